@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Several processes editing one annotation database at the same time.
+
+    python -m benchmarks.concurrency --processes 4 --ops 2000
+
+Every worker process saves, updates and deletes boxes on a shared set of
+images through its own AnnotationWriter (as one annotator would), while
+this process polls PRAGMA data_version like the GUI does. At the end the
+boxes left per worker (created_by) must match what the worker expects,
+otherwise a write was lost; the exit status is then 1.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from src.db import AnnotationDB
+from src.db_writer import AnnotationWriter
+from src.rect import Rect
+
+
+def worker(db_path, user, ops, images, flush_interval, seed):
+    """Apply `ops` random edits as `user`; returns (boxes left, lock retries, seconds)."""
+    rng = random.Random(seed)
+    writer = AnnotationWriter(db_path, user=user, flush_interval=flush_interval)
+    writer.wait_ready()
+    live = []  # (image, temp id)
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        action = rng.random()
+        if action < 0.6 or not live:
+            image = rng.choice(images)
+            rect = Rect(rng.uniform(0, 1000), rng.uniform(0, 600), rng.uniform(8, 200), rng.uniform(8, 200))
+            live.append((image, writer.save_annotation(image, rect, f"class_{rng.randrange(10)}")))
+        elif action < 0.8:
+            image, ann_id = rng.choice(live)
+            writer.update_annotation(image, ann_id, rect_label=f"class_{rng.randrange(10)}")
+        else:
+            image, ann_id = live.pop(rng.randrange(len(live)))
+            writer.delete_annotation(image, ann_id)
+        # 人の操作間隔の代わりに、ときどき他のプロセスに譲る
+        if rng.random() < 0.05:
+            time.sleep(0.001)
+    writer.flush()
+    seconds = time.perf_counter() - start
+    writer.close()
+    return len(live), writer.lock_retries, seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.concurrency", description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=2000, help="edits per process")
+    parser.add_argument("--images", type=int, default=50, help="shared images being edited")
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="seconds between writer commits")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="seconds between data_version polls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="database file (default: a new file in a temporary folder)")
+    args = parser.parse_args(argv)
+
+    workdir = None
+    db_path = args.db
+    if db_path is None:
+        workdir = tempfile.mkdtemp(prefix="annotator_concurrency_")
+        db_path = os.path.join(workdir, "shared.db")
+
+    images = [os.path.join("label_000", f"img_{i:06d}.jpg") for i in range(args.images)]
+    users = [f"worker-{n}" for n in range(args.processes)]
+    try:
+        watcher = AnnotationDB(db_path, user="watcher")
+        before = dict((user, boxes) for user, _, boxes in watcher.user_stats())
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(args.processes) as pool:
+            start = time.perf_counter()
+            pending = pool.starmap_async(worker, [(db_path, user, args.ops, images, args.flush_interval,
+                                                   args.seed + n) for n, user in enumerate(users)])
+
+            # GUIと同じく、コミットの有無だけを安く確かめる
+            changes = polls = 0
+            poll_seconds = 0.0
+            version = watcher.data_version()
+            while not pending.ready():
+                t = time.perf_counter()
+                current = watcher.data_version()
+                poll_seconds += time.perf_counter() - t
+                polls += 1
+                if current != version:
+                    changes += 1
+                    version = current
+                time.sleep(args.poll_interval)
+            results = pending.get()
+            seconds = time.perf_counter() - start
+
+        total_ops = args.ops * args.processes
+        print(f"{args.processes} processes x {args.ops} edits on {args.images} images: {seconds:.2f}s "
+              f"({total_ops / seconds:.0f} edits/s)")
+        print(f"lock retries: {sum(r[1] for r in results)}")
+        print(f"data_version polls: {polls} ({poll_seconds / max(polls, 1) * 1e6:.1f}us each), "
+              f"changes seen: {changes}")
+
+        counts = dict((user, boxes) for user, _, boxes in watcher.user_stats())
+        lost = 0
+        for user, (expected, retries, worker_seconds) in zip(users, results):
+            actual = counts.get(user, 0) - before.get(user, 0)
+            mark = "" if actual == expected else "  MISMATCH"
+            print(f"  {user:<12} boxes {actual:>6} / expected {expected:>6}  {worker_seconds:.2f}s{mark}")
+            lost += actual != expected
+
+        corrupt = watcher.check()["corrupt"]
+        watcher.close()
+        if lost or corrupt:
+            print(f"[ERROR] {lost} workers with lost writes, integrity check problems: {corrupt}")
+            return 1
+        return 0
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
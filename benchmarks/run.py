@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite over a synthetic dataset (Qt runs headless on the offscreen platform).
+
+    python -m benchmarks.run --labels 10 --images 500 --boxes 20 --out results.json
+    python -m benchmarks.run --out new.json --compare results.json
+
+Results are written as JSON ({"meta": ..., "results": {name: {value, unit, better}}});
+with --compare, every metric is compared with a previous run and the exit
+status is 1 if any got worse by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.synthetic import make_dataset, make_annotation_csv, image_names  # noqa: E402
+from src.db import AnnotationDB  # noqa: E402
+from src.rect import Rect  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    # Windowsではピークメモリを計測しない
+    resource = None
+
+BENCHMARKS = ("db", "scan", "nav")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def peak_rss_mib():
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxは KiB、macOSは bytes
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 1024
+
+
+class Results:
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, value, unit, better="lower"):
+        self.results[name] = {"value": round(value, 4), "unit": unit, "better": better}
+        print(f"  {name:<32} {value:>12.2f} {unit}")
+
+    def add_latencies(self, name, times_ms):
+        self.add(f"{name}_p50", percentile(times_ms, 0.5), "ms")
+        self.add(f"{name}_p95", percentile(times_ms, 0.95), "ms")
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_db(workdir, args, results):
+    print("db:")
+    names = image_names(args.labels, args.images)
+    csv_path = os.path.join(workdir, "annotations.csv")
+    rows = make_annotation_csv(csv_path, args.labels, args.images, args.boxes, args.image_size, args.seed)
+
+    db_path = os.path.join(workdir, "bench_insert.db")
+    db = AnnotationDB(db_path)
+    rng = random.Random(args.seed)
+
+    def insert_all():
+        with db.transaction():
+            for label, name in names:
+                path = os.path.join(label, name)
+                for _ in range(args.boxes):
+                    db.save_annotation(path, Rect(rng.uniform(0, 1000), rng.uniform(0, 600), 50.0, 40.0), "box")
+
+    seconds, _ = timed(insert_all)
+    results.add("db_insert_rows_per_s", rows / seconds, "rows/s", "higher")
+
+    sample = rng.sample(names, min(len(names), 500))
+    load_times = []
+    for label, name in sample:
+        seconds, _ = timed(db.load_annotations, os.path.join(label, name))
+        load_times.append(seconds * 1000)
+    results.add_latencies("db_load_annotations", load_times)
+
+    ids = [row[0] for row in db.conn.execute("SELECT id FROM annotations ORDER BY random() LIMIT 1000")]
+    seconds, _ = timed(lambda: [db.delete_annotation(ann_id) for ann_id in ids])
+    results.add("db_delete_ops_per_s", len(ids) / seconds, "ops/s", "higher")
+    db.close()
+
+    import_db = AnnotationDB(os.path.join(workdir, "bench_import.db"))
+    seconds, (imported, _) = timed(import_db.import_from_csv, csv_path)
+    results.add("db_import_rows_per_s", imported / seconds, "rows/s", "higher")
+
+    seconds, _ = timed(import_db.export_to_csv, os.path.join(workdir, "export.csv"))
+    results.add("db_export_rows_per_s", imported / seconds, "rows/s", "higher")
+    import_db.close()
+
+
+def bench_scan(root, args, results):
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QEventLoop
+    from src.scanner import FolderScanner, scan_cache_path, list_label_dirs
+    from src.dataset import ImageDataset
+    from src.label_model import LabelTreeModel
+
+    print("scan:")
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+    # 走査キャッシュはデータセットと一緒に消えるよう作業フォルダに置く
+    cache_dir = os.path.join(os.path.dirname(root), "scan_cache")
+    label_count = len(list_label_dirs(root))
+
+    def scan():
+        # アプリと同じく、ワーカースレッドの結果をイベントループで受け取る
+        scanned = []
+        scanner = FolderScanner(root, cache_dir=cache_dir)
+        scanner.label_scanned.connect(lambda label, names: scanned.append((label, names)))
+        loop = QEventLoop()
+        scanner.finished.connect(loop.quit)
+        scanner.start()
+        loop.exec()
+        scanner.stop()
+        assert len(scanned) == label_count, f"scanned {len(scanned)} of {label_count} label folders"
+        return scanned
+
+    cache_path = scan_cache_path(root, cache_dir)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    seconds, scanned = timed(scan)
+    results.add("scan_cold_ms", seconds * 1000, "ms")
+    seconds, scanned = timed(scan)
+    results.add("scan_warm_ms", seconds * 1000, "ms")
+
+    # ツリーへの反映（旧populate_label_tree相当）
+    model = LabelTreeModel(ImageDataset(root))
+
+    def populate():
+        model.reset(root)
+        for label, names in scanned:
+            model.replace_images(label, names)
+
+    seconds, _ = timed(populate)
+    results.add("tree_populate_ms", seconds * 1000, "ms")
+
+
+def bench_nav(root, workdir, args, results):
+    from PySide6.QtWidgets import QApplication
+    import main
+    from src.image_cache import decode_stats
+
+    print("nav:")
+    app = QApplication.instance() or QApplication([])
+
+    def wait(condition, timeout=60):
+        end = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < end:
+            app.processEvents()
+            time.sleep(0.01)
+
+    # annotations.dbはカレントディレクトリに作られる
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        window = main.Annotator()
+        window.resize(*args.window_size)
+        window.show()
+        app.processEvents()
+
+        finished = []
+        window.open_folder(root)
+        window.scanner.finished.connect(finished.append)
+        wait(lambda: finished)
+
+        window.label_item_selected(window.label_model.label_index(window.label_list[0]))
+        app.processEvents()
+        rss_before = peak_rss_mib()
+
+        steps = min(args.nav_steps, len(window.current_images) - 1)
+        times = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            window.show_next_image()
+            app.processEvents()
+            times.append((time.perf_counter() - start) * 1000)
+            # 先読みが終わる程度の操作間隔
+            time.sleep(args.think_time)
+            app.processEvents()
+        results.add_latencies("nav_next", times)
+
+        rng = random.Random(args.seed)
+        times = []
+        for _ in range(steps):
+            window.current_index = rng.randrange(len(window.current_images))
+            start = time.perf_counter()
+            window.update_image_display()
+            app.processEvents()
+            times.append((time.perf_counter() - start) * 1000)
+        results.add_latencies("nav_random", times)
+
+        results.add("nav_decode_peak_mib", decode_stats.peak_bytes / 2 ** 20, "MiB")
+        if resource is not None:
+            results.add("nav_rss_growth_mib", peak_rss_mib() - rss_before, "MiB")
+        window.close()
+    finally:
+        os.chdir(cwd)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current, baseline, threshold):
+    """Print a comparison table; returns the names of metrics that regressed."""
+    regressions = []
+    print(f"\n{'metric':<32} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            print(f"{name:<32} {'-':>12} {result['value']:>12.2f}")
+            continue
+
+        change = (result["value"] - base["value"]) / base["value"]
+        worse = change > threshold if result["better"] == "lower" else change < -threshold
+        mark = "  REGRESSION" if worse else ""
+        print(f"{name:<32} {base['value']:>12.2f} {result['value']:>12.2f} {change:>+8.1%}{mark}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", type=int, default=5)
+    parser.add_argument("--images", type=int, default=200, help="images per label")
+    parser.add_argument("--boxes", type=int, default=20, help="boxes per image")
+    parser.add_argument("--image-size", type=parse_size, default=(1920, 1080), metavar="WxH")
+    parser.add_argument("--window-size", type=parse_size, default=(1200, 800), metavar="WxH")
+    parser.add_argument("--nav-steps", type=int, default=50)
+    parser.add_argument("--think-time", type=float, default=0.05, help="seconds between navigation steps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"comma-separated subset of {BENCHMARKS}")
+    parser.add_argument("--workdir", help="dataset folder (default: a temporary folder)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated dataset")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="previous results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="annotator_bench_"))
+    root = os.path.join(workdir, "images")
+    results = Results()
+
+    try:
+        if {"scan", "nav"} & set(selected) and not os.path.isdir(root):
+            seconds, _ = timed(make_dataset, root, args.labels, args.images, args.image_size, seed=args.seed)
+            print(f"generated {args.labels * args.images} images in {seconds:.1f}s: {root}")
+
+        if "db" in selected:
+            bench_db(workdir, args, results)
+        if "scan" in selected:
+            bench_scan(root, args, results)
+        if "nav" in selected:
+            bench_nav(root, workdir, args, results)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    meta = {
+        "revision": git_revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items()
+                   if key in ("labels", "images", "boxes", "image_size", "window_size", "nav_steps", "think_time", "seed")},
+    }
+    # タプルはJSONではリストになるので、比較用にそろえておく
+    meta = json.loads(json.dumps(meta))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results.results}, f, indent=2)
+    print(f"results written to: {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("params") != meta["params"]:
+            print("[WARN] baseline was run with different parameters")
+        regressions = compare(results.results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
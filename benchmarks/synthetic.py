@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic datasets: `root/<label>/<image>.jpg` plus an annotation CSV."""
+import os
+import csv
+import random
+
+import cv2
+import numpy as np
+
+from src.db import CSV_COLUMNS
+
+
+def make_jpeg(width, height, seed=0):
+    """Encoded JPEG bytes of a noisy gradient image (noise keeps the file size realistic)."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), np.uint8)
+    image[..., 0] = x
+    image[..., 1] = y
+    image[..., 2] = (x + y) / 2
+    image += rng.integers(0, 32, image.shape, dtype=np.uint8)
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return data.tobytes()
+
+
+def image_names(labels, images):
+    """[(label, file name)] of a dataset with `labels` x `images` images."""
+    return [(f"label_{i:03d}", f"img_{i:03d}_{j:06d}.jpg") for i in range(labels) for j in range(images)]
+
+
+def make_dataset(root, labels, images, image_size=(1920, 1080), variants=4, seed=0):
+    """Write `labels` x `images` JPEGs under `root`; returns the list of image paths.
+
+    Only `variants` distinct images are encoded; the others are byte copies,
+    so generating a large tree is bounded by disk speed, not by encoding.
+    """
+    blobs = [make_jpeg(image_size[0], image_size[1], seed + i) for i in range(variants)]
+    paths = []
+    for n, (label, name) in enumerate(image_names(labels, images)):
+        label_dir = os.path.join(root, label)
+        if n % images == 0:
+            os.makedirs(label_dir, exist_ok=True)
+        path = os.path.join(label_dir, name)
+        with open(path, "wb") as f:
+            f.write(blobs[n % variants])
+        paths.append(path)
+    return paths
+
+
+def make_annotation_csv(path, labels, images, boxes, image_size=(1920, 1080), seed=0):
+    """Write `boxes` random boxes per image in the import CSV format; returns the row count."""
+    rng = random.Random(seed)
+    width, height = image_size
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for label, name in image_names(labels, images):
+            for _ in range(boxes):
+                w = rng.uniform(8, width / 4)
+                h = rng.uniform(8, height / 4)
+                x = rng.uniform(0, width - w)
+                y = rng.uniform(0, height - h)
+                writer.writerow([name, label, round(x, 1), round(y, 1), round(w, 1), round(h, 1),
+                                 f"class_{rng.randrange(10)}"])
+                rows += 1
+    return rows
@@ -1,21 +1,41 @@
 # -*- coding: utf-8 -*-
+# 起動時間の計測はimportより前から始める
+from src.perf import startup
+
 import sys
 import os
 import shutil
 import csv
-
-import cv2
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QPushButton, QListWidget,
     QVBoxLayout, QHBoxLayout, QFileDialog, QGraphicsView, QGraphicsScene,
-    QGraphicsPixmapItem, QGraphicsRectItem, QGraphicsSimpleTextItem, QGraphicsTextItem,QSizePolicy, QComboBox, QTreeWidget,
-    QTreeWidgetItem, QSplitter, QGridLayout, QInputDialog
+    QGraphicsPixmapItem, QGraphicsRectItem, QGraphicsTextItem,QSizePolicy, QComboBox,
+    QSplitter, QGridLayout, QInputDialog, QCheckBox, QTreeView, QAbstractItemView, QMessageBox, QStackedWidget, QLineEdit
 )
-from PySide6.QtGui import QPixmap, QImage, QPen, QColor, QFont
-from PySide6.QtCore import Qt, QRectF, QPointF, QEvent
+from PySide6.QtGui import QPixmap, QImage, QPen, QColor
+from PySide6.QtCore import Qt, QRectF, QPointF, QEvent, QEventLoop, QTimer, Signal
+
+from src.db import AnnotationDB, DB_PATH
+from src.db_writer import AnnotationWriter
+from src.image_cache import ImageCache, ImagePrefetcher, decode_stats, resize_image, preload
+from src.imagesize import get_image_size
+from src.tiles import TiledImageItem
+from src.annotation_layer import AnnotationLayerItem
+from src.perf import FrameTimer, profiler, timed
+from src.scanner import FolderScanner
+from src.dataset import ImageDataset
+from src.image_filter import ImageFilter, FILTER_HELP
+from src.crops import extract_crops
+from src.batch_move import BatchMover, has_pending_journal
+from src.label_model import LabelTreeModel
+from src.thumbnail_view import ThumbnailLoader, ThumbnailModel, ThumbnailGrid
+
+startup.mark("imports")
 
-from src.db import AnnotationDB
+CHANGE_POLL_INTERVAL = 1000  # ms, 共有DBの変更を確認する間隔
 
 
 class Annotator(QMainWindow):
@@ -25,115 +45,280 @@ class Annotator(QMainWindow):
         self.setGeometry(100, 100, 1200, 800)
 
         self.root_folder = ""
-        self.label_list = []
-        self.image_dict = {}  # label: [paths]
+        # ツリー・ナビゲーション・export_labelsで共有する画像一覧
+        self.dataset = ImageDataset()
+        self.label_list = self.dataset.labels
         self.current_label = None
-        self.current_images = []
+        self.current_images = []  # 表示中ラベルのLabelView
         self.current_index = 0
+        self.image_filter = None
+
+        self.scanner = None
+
+        # GUIスレッドではSQLiteへの書き込みを待たない（DBのオープン・移行も書き込みスレッドで行う）
+        self.db_writer = AnnotationWriter(DB_PATH)
+        self.data_version = None
 
-        self.db = AnnotationDB("annotations.db")
+        self.image_cache = ImageCache()
+        self.prefetcher = ImagePrefetcher(self.image_cache)
+        self.thumbnail_loader = ThumbnailLoader(parent=self)
 
         self.initUI()
+        startup.mark("window")
+
+    @property
+    def db(self):
+        return self.db_writer.db
 
     def initUI(self):
         # left-side: buttons
-        self.label_tree = QTreeWidget()
-        self.label_tree.setHeaderLabel("Label > Image")
-        self.label_tree.itemClicked.connect(self.label_item_selected)
+        # 画像行は展開・スクロール時に必要な分だけ読み込む
+        self.label_model = LabelTreeModel(self.dataset, self)
+        self.label_tree = QTreeView()
+        self.label_tree.setModel(self.label_model)
+        self.label_tree.setUniformRowHeights(True)
+        self.label_tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.label_tree.clicked.connect(self.label_item_selected)
 
         button_defs = [
             ("Set image folder", self.load_images),
             ("Add Label", self.add_new_label),
+            ("Move Images", self.move_selected_images),
+            ("Grid View", self.toggle_grid_view),
             ("Clear Annotations", self.clear_current_annotations),
             ("Export Labels", self.export_labels),
             ("Export Annotations", self.export_annotations),
+            ("Export Crops", self.export_crops),
             ("Import Annotations", self.import_annotations),
         ]
 
+        # 矩形の内容で画像を絞り込む（Enterで適用、空にすると解除）
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText(f"Filter: {FILTER_HELP}")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.returnPressed.connect(self.apply_filter)
+        self.filter_edit.textChanged.connect(self.on_filter_text_changed)
+
         left_layout = QVBoxLayout()
         for label, handler in button_defs:
             btn = QPushButton(label)
             btn.clicked.connect(handler)
             left_layout.addWidget(btn)
-        left_layout.insertWidget(1, self.label_tree)
+        left_layout.insertWidget(1, self.filter_edit)
+        left_layout.insertWidget(2, self.label_tree)
 
-        left_widget = QWidget()
+        self.left_widget = left_widget = QWidget()
         left_widget.setLayout(left_layout)
         left_widget.setFixedWidth(300)
 
         # right-side: viewer
-        self.image_view = ImageWithControls(self, self.db)
+        self.image_view = ImageWithControls(self, self.db_writer)
         self.image_view.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
+        # 一覧表示（サムネイルグリッド）と切り替え
+        self.thumbnail_model = ThumbnailModel(self.thumbnail_loader, self)
+        self.thumbnail_grid = ThumbnailGrid(self.thumbnail_model)
+        self.thumbnail_grid.image_activated.connect(self.open_grid_image)
+
+        self.view_stack = QStackedWidget()
+        self.view_stack.addWidget(self.image_view)
+        self.view_stack.addWidget(self.thumbnail_grid)
+
         # merge
         splitter = QSplitter(Qt.Horizontal)
         splitter.addWidget(left_widget)
-        splitter.addWidget(self.image_view)
+        splitter.addWidget(self.view_stack)
         self.setCentralWidget(splitter)
 
+        # ANNOTATOR_PROFILE有効時はステータスバーに計測値を表示
+        if profiler.enabled:
+            self.perf_label = QLabel()
+            self.statusBar().addPermanentWidget(self.perf_label)
+            self.perf_timer = QTimer(self)
+            self.perf_timer.setInterval(500)
+            self.perf_timer.timeout.connect(self.update_perf_hud)
+            self.perf_timer.start()
+
+        # 最初の描画が終わってからOpenCVの読み込みなど後回しにした初期化を行う
+        self.image_view.image_view.viewport().installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            QTimer.singleShot(0, self.on_first_paint)
+        return super().eventFilter(obj, event)
+
+    def on_first_paint(self):
+        startup.mark("first_paint")
+        preload()
+
+        self.change_timer = QTimer(self)
+        self.change_timer.setInterval(CHANGE_POLL_INTERVAL)
+        self.change_timer.timeout.connect(self.poll_changes)
+        self.change_timer.start()
+        if startup.enabled:
+            self.db_writer.wait_ready()
+            startup.mark("db_ready", self.db_writer.ready_time)
+            print(startup.summary())
+            if "--startup-time" in sys.argv:
+                self.close()
+
+    def poll_changes(self):
+        # 書き込めなかった変更（再試行中・破棄したもの）を利用者に知らせる
+        error = self.db_writer.take_error()
+        if error is not None:
+            QMessageBox.warning(self, "Saving annotations", error)
+
+        # 他のプロセスや書き込みスレッドがコミットしたときだけ、表示中の画像の矩形を読み直す
+        if not self.db_writer.wait_ready(0):
+            return
+        version = self.db.data_version()
+        if version != self.data_version and self.image_view.image_view.refresh_annotations():
+            self.data_version = version
+
     def keyPressEvent(self, event):
-        if event.key() == Qt.Key_Left:
+        # 一覧表示中の矢印キーはグリッドでの移動
+        if self.is_grid_view():
+            super().keyPressEvent(event)
+        elif event.key() == Qt.Key_Left:
             self.show_previous_image()
         elif event.key() == Qt.Key_Right:
             self.show_next_image()
 
     def load_images(self):
         folder = QFileDialog.getExistingDirectory(self, "Select image folder")
-        if not folder:
-            return
+        if folder:
+            self.open_folder(folder)
 
+    def open_folder(self, folder):
         self.root_folder = folder
-        self.image_dict = {}
-        self.label_list = [d for d in os.listdir(folder) if os.path.isdir(os.path.join(folder, d))]
-
-        for label in self.label_list:
-            label_path = os.path.join(folder, label)
-            self.image_dict[label] = [os.path.join(label_path, f)
-                                      for f in os.listdir(label_path)
-                                      if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-
-        self.populate_label_tree()
-
-    def populate_label_tree(self):
-        self.label_tree.clear()
-        self.sort_image_dict()
-        for label in self.label_list:
-            parent = QTreeWidgetItem(self.label_tree, [label])
-            for img_path in self.image_dict[label]:
-                QTreeWidgetItem(parent, [os.path.basename(img_path)])
-
-    def sort_image_dict(self):
-        for label, file_list in self.image_dict.items():
-            self.image_dict[label] = sorted(
-                file_list,
-                key=lambda path: os.path.basename(path).lower()
-            )
-
-    def label_item_selected(self, item, column):
-        parent = item.parent()
-        if parent:
-            label = parent.text(0)
-            image_name = item.text(0)
-            full_path = os.path.join(self.root_folder, label, image_name)
-            self.current_label = label
-            self.current_images = self.image_dict[label]
-            self.current_index = self.current_images.index(full_path)
-        else:
-            label = item.text(0)
-            self.current_label = label
-            self.current_images = self.image_dict[label]
+        self.current_label = None
+        self.current_images = []
+        self.current_index = 0
+        self.label_model.reset(folder)
+        self.thumbnail_model.set_images([])
+        self.thumbnail_model.clear_pixmaps()
+        self.thumbnail_loader.open(folder)
+
+        # 中断された一括移動があれば、走査の前に再開または取り消し
+        if has_pending_journal(folder):
+            self.recover_batch_move(folder)
+
+        # フォルダ走査はバックグラウンドで行い、ラベルごとに反映
+        if self.scanner is not None:
+            self.scanner.stop()
+            self.scanner.label_scanned.disconnect(self.on_label_scanned)
+            self.scanner.label_removed.disconnect(self.on_label_removed)
+            self.scanner.finished.disconnect(self.on_scan_finished)
+        self.scanner = FolderScanner(folder)
+        self.scanner.label_scanned.connect(self.on_label_scanned)
+        self.scanner.label_removed.connect(self.on_label_removed)
+        self.scanner.finished.connect(self.on_scan_finished)
+        self.statusBar().showMessage(f"Scanning {folder} ...")
+        self.scanner.start()
+
+    def update_perf_hud(self):
+        parts = []
+        nav = profiler.get("nav.update_image_display")
+        if nav is not None:
+            parts.append(f"nav p50 {nav.percentile(0.5):.0f}ms p95 {nav.percentile(0.95):.0f}ms")
+        frame = profiler.get("frame.AnnotatableImageView")
+        if frame is not None:
+            parts.append(f"paint p95 {frame.percentile(0.95):.1f}ms")
+
+        cache = self.image_cache
+        lookups = cache.hits + cache.misses
+        hit_rate = cache.hits / lookups * 100 if lookups else 0
+        parts.append(f"cache {hit_rate:.0f}% hit, {cache.total_bytes / 2 ** 20:.0f}MiB")
+        self.perf_label.setText(" | ".join(parts))
+
+    @timed("tree.label_scanned")
+    def on_label_scanned(self, label, names):
+        # 自分の移動で反映済みのフォルダなら、ツリーはそのまま
+        if self.dataset.has_names(label, names):
+            return
+
+        current_path = None
+        if label == self.current_label and 0 <= self.current_index < len(self.current_images):
+            current_path = self.current_images[self.current_index]
+
+        self.label_model.replace_images(label, names)
+
+        # 表示中のラベルなら、位置を保つ
+        if label == self.current_label:
+            location = self.dataset.locate(current_path) if current_path else None
+            if location is not None:
+                self.current_index = location[1]
+            else:
+                self.current_index = min(self.current_index, max(0, len(self.current_images) - 1))
+            if self.is_grid_view():
+                self.thumbnail_model.set_images(self.current_images)
+
+    def on_label_removed(self, label):
+        if label in self.label_list:
+            self.label_model.remove_label(label)
+        if label == self.current_label:
+            self.current_label = None
+            self.current_images = []
             self.current_index = 0
+            self.thumbnail_model.set_images([])
+
+    def on_scan_finished(self, total):
+        self.statusBar().showMessage(f"{total} images in {len(self.label_list)} labels", 5000)
+        self.scanner.watch()
+
+    def label_item_selected(self, index):
+        label = self.label_model.label_at(index)
+        self.current_label = label
+        self.current_images = self.dataset.view(label)
+        # 行番号がそのままラベル内の位置
+        self.current_index = index.row() if self.label_model.path_at(index) else 0
 
         self.update_image_display()
 
+    def on_filter_text_changed(self, text):
+        # クリアボタンで空にしたときは、Enterを待たずに解除
+        if not text and self.dataset.filter is not None:
+            self.apply_filter()
+
+    @timed("tree.apply_filter")
+    def apply_filter(self):
+        try:
+            image_filter = ImageFilter(self.filter_edit.text())
+        except ValueError as e:
+            self.statusBar().showMessage(str(e), 5000)
+            return
+
+        current_path = None
+        if 0 <= self.current_index < len(self.current_images):
+            current_path = self.current_images[self.current_index]
+
+        # 集計はトリガーで更新されるので、未反映の書き込みを出してから問い合わせる
+        if not self.flush_writes("Filter"):
+            return
+        self.image_filter = image_filter if image_filter else None
+        self.dataset.set_filter(image_filter.predicate(self.db))
+        self.label_model.reset()
+
+        # 表示中の画像が残っていれば、その位置から
+        if self.current_label is not None:
+            location = self.dataset.locate(current_path) if current_path else None
+            self.current_index = location[1] if location is not None else 0
+            self.update_image_display()
+
+        if image_filter:
+            self.statusBar().showMessage(f"{len(self.dataset)} images match '{image_filter.text}' "
+                                         f"({self.dataset.hidden_count()} hidden)")
+        else:
+            self.statusBar().showMessage("Filter cleared", 5000)
+
     def add_new_label(self):
         text, ok = QInputDialog.getText(self, "New Label", "Label:")
         if ok and text:
             label_path = os.path.join(self.root_folder, text)
             os.makedirs(label_path, exist_ok=True)
-            self.label_list.append(text)
-            self.image_dict[text] = []
-            self.populate_label_tree()
+            if text not in self.label_list:
+                self.label_model.insert_label(text)
 
     def show_next_image(self):
         if self.current_index + 1 < len(self.current_images):
@@ -145,15 +330,47 @@ class Annotator(QMainWindow):
             self.current_index -= 1
             self.update_image_display()
 
+    @timed("nav.update_image_display")
     def update_image_display(self):
+        # 一覧表示中は画像をデコードせず、グリッドだけ更新
+        if self.is_grid_view():
+            self.thumbnail_model.set_images(self.current_images)
+            self.thumbnail_grid.show_row(self.current_index)
+            return
+
         try:
             image_path = self.current_images[self.current_index]
         except IndexError:
             return
 
+        # 表示中の画像への変更を書き出してから切り替え
+        self.db_writer.flush(wait=False)
+
         self.image_view.set_image_path(image_path, self.label_list)
         self.image_view.setFocus()
 
+        # 前後の画像を先読み（タイル表示では全体をデコードしないので不要）
+        if not self.image_view.image_view.tiled:
+            self.prefetcher.prefetch(self.prefetcher.neighbors(self.current_images, self.current_index))
+
+    def is_grid_view(self):
+        return self.view_stack.currentWidget() is self.thumbnail_grid
+
+    def toggle_grid_view(self):
+        if self.is_grid_view():
+            self.view_stack.setCurrentWidget(self.image_view)
+            self.thumbnail_model.set_images([])
+        else:
+            # サムネイルの保存先は初めてグリッドを開くときに用意する
+            self.thumbnail_loader.ensure_store()
+            self.view_stack.setCurrentWidget(self.thumbnail_grid)
+        self.update_image_display()
+
+    def open_grid_image(self, row):
+        self.current_index = row
+        self.toggle_grid_view()
+
+    @timed("nav.move_image")
     def move_image_to_label(self, image_path, new_label):
         old_label = os.path.basename(os.path.dirname(image_path))
         if old_label == new_label:
@@ -164,28 +381,236 @@ class Annotator(QMainWindow):
         os.makedirs(new_dir, exist_ok=True)
         new_path = os.path.join(new_dir, file_name)
         shutil.move(image_path, new_path)
+        self.image_cache.discard(image_path)
 
-        self.image_dict[old_label].remove(image_path)
-        self.image_dict[new_label].append(new_path)
-        self.populate_label_tree()
+        # ツリーは該当する2行だけ更新
+        self.label_model.move_image(image_path, new_label)
 
-        self.db.update_label(new_path)
+        self.db_writer.update_label(new_path)
+        if self.refresh_filter():
+            self.label_model.reset()
 
-        self.current_images = self.image_dict[old_label]
+        self.current_images = self.dataset.view(old_label)
         self.update_image_display()
 
         return new_path
 
+    def selected_image_paths(self):
+        paths = []
+        for index in self.label_tree.selectionModel().selectedIndexes():
+            path = self.label_model.path_at(index)
+            if path is not None:
+                paths.append(path)
+            else:
+                # ラベル行ならそのラベルの全画像
+                paths.extend(self.dataset.view(self.label_model.label_at(index)))
+        return list(dict.fromkeys(paths))
+
+    def move_selected_images(self):
+        if not self.root_folder:
+            return
+
+        paths = self.selected_image_paths()
+        if not paths and self.current_label is not None:
+            pattern, ok = QInputDialog.getText(
+                self, "Move Images", f"File name pattern in '{self.current_label}' (e.g. *_blur.jpg):")
+            if not ok or not pattern:
+                return
+            pattern = pattern.lower()
+            paths = [path for path in self.current_images if fnmatch.fnmatch(os.path.basename(path).lower(), pattern)]
+        if not paths:
+            return
+
+        new_label, ok = QInputDialog.getItem(
+            self, "Move Images", f"Move {len(paths)} images to:", self.label_list, 0, False)
+        if not ok:
+            return
+
+        if not self.flush_writes("Move Images"):
+            return
+        mover = BatchMover(self.root_folder, self.db)
+        try:
+            moved = self.run_exclusive(lambda: mover.run(mover.plan(paths, new_label), progress=self.show_move_progress))
+        except RuntimeError as e:
+            QMessageBox.warning(self, "Move Images", str(e))
+            return
+        self.apply_moves(moved)
+        self.statusBar().showMessage(f"Moved {len(moved)} images to '{new_label}'", 5000)
+
+    def recover_batch_move(self, folder):
+        box = QMessageBox(self)
+        box.setWindowTitle("Interrupted move")
+        box.setText("A batch move in this folder was interrupted.")
+        resume_button = box.addButton("Resume", QMessageBox.AcceptRole)
+        rollback_button = box.addButton("Roll back", QMessageBox.DestructiveRole)
+        box.addButton(QMessageBox.Cancel)
+        box.exec()
+
+        mover = BatchMover(folder, self.db)
+        if box.clickedButton() is resume_button:
+            self.run_exclusive(lambda: mover.resume(progress=self.show_move_progress))
+        elif box.clickedButton() is rollback_button:
+            self.run_exclusive(mover.rollback)
+
+    def run_exclusive(self, run):
+        # 進捗表示でイベントを処理するので、一括移動・切り出しの間はツリー・ボタン・ラベル変更を受け付けない
+        self.left_widget.setEnabled(False)
+        self.image_view.setEnabled(False)
+        try:
+            return run()
+        finally:
+            self.left_widget.setEnabled(True)
+            self.image_view.setEnabled(True)
+
+    def show_move_progress(self, done, total):
+        self.statusBar().showMessage(f"Moving... {done}/{total}")
+        QApplication.processEvents()
+
+    @timed("tree.apply_moves")
+    def apply_moves(self, moved):
+        # データセットをまとめて更新し、ツリーは一度だけ作り直す
+        for src, dst in moved:
+            self.image_cache.discard(src)
+            # 移動中にフォルダ監視の再走査で反映済みの分は飛ばす
+            location = self.dataset.locate(src)
+            if location is None:
+                continue
+            if dst in self.dataset:
+                self.dataset.remove(*location)
+            else:
+                self.dataset.move(src, os.path.basename(os.path.dirname(dst)))
+        if moved:
+            self.refresh_filter()
+        self.label_model.reset()
+
+        if self.current_label is not None:
+            self.current_index = min(self.current_index, max(0, len(self.current_images) - 1))
+            self.update_image_display()
+
+    def refresh_filter(self):
+        """Query the active filter again after image labels changed; False if there is none or it failed."""
+        # 画像ラベルが変わると絞り込み（mismatchなど）の結果も変わる。集計はトリガーで更新されるので、書き込みを出してから
+        if self.image_filter is None or not self.flush_writes("Filter"):
+            return False
+        self.dataset.set_filter(self.image_filter.predicate(self.db))
+        return True
+
+    def flush_writes(self, title):
+        """Write out queued annotation changes; shows the error and returns False if they could not be saved."""
+        if self.db_writer.flush():
+            return True
+        QMessageBox.warning(self, title, self.db_writer.error)
+        return False
+
     def export_annotations(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV files (*.csv)")
-        if path:
-            self.db.export_to_csv(path)
+        # エクスポート時だけimport（numpyはnpy形式の時だけ読み込む）
+        from src.exporters import EXPORTERS, export_annotations
+
+        fmt, ok = QInputDialog.getItem(self, "Export Annotations", "Format:", list(EXPORTERS), 0, False)
+        if not ok:
+            return
+
+        exporter = EXPORTERS[fmt]
+        if exporter.suffix:
+            path, _ = QFileDialog.getSaveFileName(self, "Export Annotations", "", f"{fmt} files (*{exporter.suffix})")
+        else:
+            path = QFileDialog.getExistingDirectory(self, "Export Annotations")
+        if not path:
+            return
+
+        if not self.flush_writes("Export Annotations"):
+            return
+        try:
+            images, boxes, skipped, unlabeled = export_annotations(self.db, path, fmt, image_root=self.root_folder or None,
+                                                                   progress=self.show_export_progress)
+        except (ValueError, RuntimeError) as e:
+            QMessageBox.warning(self, "Export Annotations", str(e))
+            return
+
+        message = f"Exported {boxes} annotations of {images} images to: {path}"
+        if skipped:
+            message += f" ({skipped} images skipped: size unknown)"
+        if unlabeled:
+            message += f" ({unlabeled} annotations without a label skipped)"
+        self.statusBar().showMessage(message)
+        print(message)
+
+    def show_export_progress(self, images):
+        self.statusBar().showMessage(f"Exporting... {images} images")
+        QApplication.processEvents()
+
+    def export_crops(self):
+        if not self.root_folder:
+            QMessageBox.warning(self, "Export Crops", "Set the image folder first.")
+            return
+        out_dir = QFileDialog.getExistingDirectory(self, "Export Crops")
+        if not out_dir:
+            return
+        max_size, ok = QInputDialog.getInt(self, "Export Crops", "Max crop size (0: original size):", 0, 0, 8192)
+        if not ok:
+            return
+
+        if not self.flush_writes("Export Crops"):
+            return
+        progress = [None]  # ワーカースレッドからの最新の進捗
+
+        def report(crops, crops_per_sec):
+            progress[0] = (crops, crops_per_sec)
+
+        def run():
+            # SQLiteの接続はスレッドごとに開く
+            db = AnnotationDB(self.db_writer.db_path, self.db_writer.user)
+            try:
+                return extract_crops(db, self.root_folder, out_dir, max_size=max_size or None, progress=report)
+            finally:
+                db.close()
+
+        def show_progress():
+            if progress[0] is not None:
+                self.show_crop_progress(*progress[0])
+
+        images, written, existing, skipped = self.run_exclusive(lambda: self.run_in_background(run, show_progress))
+
+        message = f"Wrote {written} crops of {images} images to: {out_dir}"
+        if existing:
+            message += f" ({existing} already there)"
+        if skipped:
+            message += f" ({skipped} skipped: image missing or box outside it)"
+        self.statusBar().showMessage(message)
+        print(message)
+
+    def show_crop_progress(self, crops, crops_per_sec):
+        self.statusBar().showMessage(f"Cropping... {crops} crops ({crops_per_sec:.0f} crops/s)")
+
+    def run_in_background(self, run, poll):
+        """Run `run` on a worker thread and return its result; events are processed and `poll()` called meanwhile."""
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="background") as executor:
+            future = executor.submit(run)
+            while not future.done():
+                poll()
+                QApplication.processEvents(QEventLoop.AllEvents, 50)
+                wait([future], timeout=0.05)
+        return future.result()
 
     def import_annotations(self):
         path, _ = QFileDialog.getOpenFileName(self, "Import CSV", "", "CSV files (*.csv)")
         if path:
-            self.db.import_from_csv(path)
-            print(f"Imported annotations from: {path}")
+            if not self.flush_writes("Import CSV"):
+                return
+            try:
+                imported, rejected = self.db.import_from_csv(path, progress=self.show_import_progress)
+            except ValueError as e:
+                QMessageBox.warning(self, "Import CSV", str(e))
+                return
+            message = f"Imported {imported} annotations from: {path}"
+            if rejected:
+                message += f" ({rejected} rejected rows -> {path}.errors.csv)"
+            self.statusBar().showMessage(message)
+            print(message)
+
+    def show_import_progress(self, rows, rows_per_sec):
+        self.statusBar().showMessage(f"Importing... {rows} rows ({rows_per_sec:.0f} rows/s)")
+        QApplication.processEvents()
 
     def export_labels(self):
         path, _ = QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV files (*.csv)")
@@ -193,14 +618,21 @@ class Annotator(QMainWindow):
             with open(path, mode="w", newline="", encoding="utf-8") as f:
                 writer = csv.writer(f)
                 writer.writerow(["file_path", "label"])
-                for label, img_paths in self.image_dict.items():
-                    for img_path in img_paths:
-                        img_path = os.path.basename(img_path)
-                        writer.writerow([img_path, label])
+                for label, name in self.dataset.items():
+                    writer.writerow([name, label])
 
     def clear_current_annotations(self):
         self.image_view.clear_annotations()
 
+    def closeEvent(self, event):
+        if self.scanner is not None:
+            self.scanner.stop()
+        self.prefetcher.shutdown()
+        self.thumbnail_loader.shutdown()
+        if not self.db_writer.close():
+            QMessageBox.critical(self, "Saving annotations", f"{self.db_writer.error}\n\nThese changes are lost.")
+        super().closeEvent(event)
+
 
 class ImageWithControls(QWidget):
     def __init__(self, parent_window, db):
@@ -220,8 +652,12 @@ class ImageWithControls(QWidget):
         self.combo.currentTextChanged.connect(self.on_label_changed)
         self.combo.blockSignals(True)
 
+        self.tiled_check = QCheckBox("Tiled")
+        self.tiled_check.toggled.connect(self.on_tiled_toggled)
+
         header_layout.addWidget(self.label)
         header_layout.addWidget(self.combo)
+        header_layout.addWidget(self.tiled_check)
 
         layout.addLayout(header_layout)
 
@@ -261,6 +697,11 @@ class ImageWithControls(QWidget):
     def clear_annotations(self):
         self.image_view.clear_all_annotations()
 
+    def on_tiled_toggled(self, checked):
+        self.image_view.tiled = checked
+        if self.image_path:
+            self.image_view.set_image(self.image_path)
+
     def on_label_changed(self, new_label):
         old_label = os.path.basename(os.path.dirname(self.image_path))
 
@@ -273,15 +714,27 @@ class ImageWithControls(QWidget):
 
 
 class AnnotatableImageView(QGraphicsView):
+    _redecoded = Signal(str, object)  # ワーカースレッド → GUIスレッド
+
     def __init__(self, root_folder, parent_window, db):
         super().__init__()
         self.scene = QGraphicsScene(self)
+        # アイテム数が少なく、プレビュー矩形が頻繁に動くのでBSPインデックスは使わない
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
         self.setScene(self.scene)
 
         self.pixmap_item = None
-        self.rect_items = []  # [(rect, label)]
+        self.tile_item = None
+        self.annotation_layer = None  # 全矩形を1アイテムで描画
         self.start_point = None
 
+        # 矩形描画中のプレビュー（使い回し、setRectのみ）
+        self.preview_item = None
+        self.drag_end = None
+
+        # リサイズ時に再デコードしないよう、現在の画像を保持
+        self.source_image = None
+
         self.get_current_anno_label = None
 
         self.root_folder = root_folder
@@ -297,33 +750,79 @@ class AnnotatableImageView(QGraphicsView):
         self.view_scale = 1.0
         self.zoom_scale = 3.0
 
+        # 巨大画像向け：ピラミッドから表示範囲のタイルだけを描画
+        self.tiled = False
+
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
         self.setDragMode(QGraphicsView.ScrollHandDrag)
 
+        # resizeEventの間引き
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(100)
+        self.resize_timer.timeout.connect(self.rescale_image)
+        self._redecoded.connect(self._set_redecoded_image)
+
+        # mouseMoveEventを画面のリフレッシュレートに間引く
+        self.draw_timer = QTimer(self)
+        self.draw_timer.setSingleShot(True)
+        self.draw_timer.timeout.connect(self.update_preview)
+
+        self.frame_timer = FrameTimer("AnnotatableImageView")
+
+    def showEvent(self, event):
+        screen = self.screen()
+        refresh_rate = screen.refreshRate() if screen and screen.refreshRate() > 0 else 60
+        self.draw_timer.setInterval(int(1000 / refresh_rate))
+        self.frame_timer.budget_ms = 1000 / refresh_rate
+        super().showEvent(event)
+
+    def paintEvent(self, event):
+        self.frame_timer.begin()
+        super().paintEvent(event)
+        self.frame_timer.end()
+
+    @timed("view.set_image")
     def set_image(self, path):
+        # 前の画像の矩形（仮のidを含む）は破棄する
+        if self.image_path is not None:
+            self.db.release_temp_ids(self.image_path)
         self.scene.clear()
-        self.rect_items.clear()
+        self.pixmap_item = None
+        self.tile_item = None
+        self.annotation_layer = None
+        self.start_point = None
+        self.drag_end = None
+
+        self.preview_item = self._get_rect_item(QRectF())
+        self.preview_item.setZValue(2)
+        self.preview_item.hide()
+        self.scene.addItem(self.preview_item)
+        self.source_image = None
         self.image_path = path
 
-        image = cv2.imread(path)
+        if self.tiled and self.set_tiled_image(path):
+            return
+
+        # 表示サイズに縮小してデコードされる（元解像度のバッファは保持しない）
+        prefetcher = self.parent_window.prefetcher
+        prefetcher.set_max_size(self._get_display_size())
+        image = prefetcher.get(path)
 
         if image is None:
             return
 
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        h, w, ch = image.shape
-        self.orig_width = w
-        self.orig_height = h
+        size = get_image_size(path)
+        self.orig_width, self.orig_height = size if size is not None else (image.shape[1], image.shape[0])
 
-        # 描画用にformat変換
-        bytes_per_line = ch * w
-        qimage = QImage(image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimage)
-        scaled_pixmap = pixmap.scaled(self.viewport().size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.source_image = image
+        scaled_pixmap = self._get_scaled_pixmap()
+        if self.frame_timer.report:
+            print(decode_stats.summary())
 
         # スケール比（横方向ベース）
-        self.scale_ratio = scaled_pixmap.width() / w
+        self.scale_ratio = scaled_pixmap.width() / self.orig_width
 
         self.pixmap_item = QGraphicsPixmapItem(scaled_pixmap)
         self.scene.addItem(self.pixmap_item)
@@ -333,43 +832,103 @@ class AnnotatableImageView(QGraphicsView):
 
         self.load_annotations()
 
-    def load_annotations(self):
-        for rect, label in self.db.load_annotations(self.image_path):
-            # 元画像座標 → GUI表示座標
-            scaled_rect = QRectF(
-                rect.x() * self.scale_ratio,
-                rect.y() * self.scale_ratio,
-                rect.width() * self.scale_ratio,
-                rect.height() * self.scale_ratio
-            )
+    @timed("view.set_tiled_image")
+    def set_tiled_image(self, path):
+        size = get_image_size(path)
+        if size is None:
+            return False
 
-            rect_item = self._get_rect_item(scaled_rect)
-            self.scene.addItem(rect_item)
+        self.orig_width, self.orig_height = size
+        self.scale_ratio = self._get_fit_ratio()
+
+        tile_item = TiledImageItem(path, self.orig_width, self.orig_height, self.scale_ratio)
+        if not tile_item.is_valid():
+            return False
+
+        self.tile_item = tile_item
+        self.scene.addItem(self.tile_item)
+        self.setSceneRect(self.tile_item.boundingRect())
+
+        self.reset_zoom()
 
-            text_item = self._get_text_item(label, scaled_rect)
-            self.scene.addItem(text_item)
+        self.load_annotations()
+        return True
 
-            self.rect_items.append((rect_item, text_item))
+    @timed("view.load_annotations")
+    def load_annotations(self):
+        if self.annotation_layer is None:
+            self.annotation_layer = AnnotationLayerItem(self.scale_ratio)
+            self.scene.addItem(self.annotation_layer)
+
+        # 矩形は元画像座標のまま保持し、描画時にGUI表示座標へ変換
+        self.annotation_layer.set_boxes(self.db.load_annotations(self.image_path))
+
+    def refresh_annotations(self):
+        """Reload the boxes of the current image; False if skipped because our own writes are pending."""
+        if self.image_path is None or self.annotation_layer is None:
+            return True
+        if self.db.has_pending(self.image_path):
+            return False
+        self.load_annotations()
+        return True
 
     def clear_all_annotations(self):
         self.db.delete_all_annotations(self.image_path)
-        for rect_item, text_item in self.rect_items:
-            self.scene.removeItem(rect_item)
-            self.scene.removeItem(text_item)
-        self.rect_items.clear()
-
+        if self.annotation_layer is not None:
+            self.annotation_layer.clear()
 
     def resizeEvent(self, event):
-        # 画像を再スケールし直し、ビュー倍率は維持
-        if self.pixmap_item and self.image_path:
-            # 現在のビュー倍率を保存
-            current_view_scale = self.view_scale
-            self.set_image(self.image_path)
-
-            self.view_scale = current_view_scale
-            self.apply_view_scale()
+        # 連続したリサイズはまとめて、最後に一度だけ再スケール
+        if (self.pixmap_item or self.tile_item) and self.image_path:
+            self.resize_timer.start()
         super().resizeEvent(event)
 
+    @timed("view.rescale_image")
+    def rescale_image(self):
+        # 保持している画像から再スケールし、アイテムはその場で更新（ディスク・DBアクセスなし）
+        if self.tile_item is not None:
+            self.scale_ratio = self._get_fit_ratio()
+            self.tile_item.set_scale_ratio(self.scale_ratio)
+            image_item = self.tile_item
+        elif self.pixmap_item is not None and self.source_image is not None:
+            # 表示サイズが大きくなったら、ひとまず手元の画像を拡大し、裏で1回だけデコードし直す
+            if not self._covers_display(self.source_image):
+                self._redecode()
+            scaled_pixmap = self._get_scaled_pixmap()
+            self.scale_ratio = scaled_pixmap.width() / self.orig_width
+            self.pixmap_item.setPixmap(scaled_pixmap)
+            image_item = self.pixmap_item
+        else:
+            return
+
+        if self.annotation_layer is not None:
+            self.annotation_layer.set_scale_ratio(self.scale_ratio)
+
+        self.setSceneRect(image_item.boundingRect())
+
+        # ビュー倍率は維持
+        self.apply_view_scale()
+
+    def _redecode(self):
+        prefetcher = self.parent_window.prefetcher
+        prefetcher.set_max_size(self._get_display_size())
+        path = self.image_path
+        prefetcher.decode_async(path).add_done_callback(lambda future: self._emit_redecoded(path, future))
+
+    def _emit_redecoded(self, path, future):
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        self._redecoded.emit(path, future.result())
+
+    def _set_redecoded_image(self, path, image):
+        # 別の画像へ移った後の結果や、手元より小さい結果は使わない
+        if path != self.image_path or self.pixmap_item is None or self.source_image is None:
+            return
+        if image.shape[1] <= self.source_image.shape[1]:
+            return
+        self.source_image = image
+        self.rescale_image()
+
 
     def mousePressEvent(self, event):
         scene_pos = self.mapToScene(event.position().toPoint())
@@ -377,32 +936,20 @@ class AnnotatableImageView(QGraphicsView):
         # 左クリック：アノテーション追加開始（従来通り）
         if event.button() == Qt.LeftButton:
             self.start_point = scene_pos
+            self.drag_end = None
 
         # 右クリック：
         #   - 矩形上なら削除（従来通り）
         #   - それ以外の場所ならズーム操作
         elif event.button() == Qt.RightButton:
-            hit_rect = None
-            for rect_item, text_item in self.rect_items:
-                if rect_item.rect().contains(scene_pos):
-                    hit_rect = (rect_item, text_item)
-                    break
+            ann_id = None
+            if self.annotation_layer is not None:
+                ann_id = self.annotation_layer.box_at(scene_pos)
 
-            if hit_rect:
+            if ann_id is not None:
                 # 既存：右クリックで削除
-                rect_item, text_item = hit_rect
-                gui_rect = rect_item.rect()
-                unscaled_rect = QRectF(
-                    gui_rect.x() / self.scale_ratio,
-                    gui_rect.y() / self.scale_ratio,
-                    gui_rect.width() / self.scale_ratio,
-                    gui_rect.height() / self.scale_ratio
-                )
-                rect_label = text_item.text()
-                self.db.delete_annotation(self.image_path, unscaled_rect)
-                self.scene.removeItem(rect_item)
-                self.scene.removeItem(text_item)
-                self.rect_items.remove((rect_item, text_item))
+                self.db.delete_annotation(self.image_path, ann_id)
+                self.annotation_layer.remove_box(ann_id)
             else:
                 # 右クリックでズームイン/アウト
                 if self.view_scale < self.zoom_scale:
@@ -414,37 +961,40 @@ class AnnotatableImageView(QGraphicsView):
 
     def mouseMoveEvent(self, event):
         if self.start_point:
-            end_point = self.mapToScene(event.position().toPoint())
-            rect = QRectF(self.start_point, end_point).normalized()
-            if hasattr(self, 'temp_rect') and self.temp_rect:
-                self.scene.removeItem(self.temp_rect)
+            # 位置だけ記録し、描画は次のフレームでまとめて行う
+            self.drag_end = self.mapToScene(event.position().toPoint())
+            if not self.draw_timer.isActive():
+                self.draw_timer.start()
+
+    def update_preview(self):
+        if self.start_point is None or self.drag_end is None or self.preview_item is None:
+            return
 
-            self.temp_rect = self._get_rect_item(rect)
-            self.scene.addItem(self.temp_rect)
+        self.preview_item.setRect(QRectF(self.start_point, self.drag_end).normalized())
+        self.preview_item.show()
 
     def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton and hasattr(self, 'temp_rect'):
+        if event.button() == Qt.LeftButton and self.start_point is not None and self.drag_end is not None:
+            self.draw_timer.stop()
+            self.preview_item.hide()
+
             end_point = self.mapToScene(event.position().toPoint())
             rect = QRectF(self.start_point, end_point).normalized()
 
-            unscaled_rect = QRectF(
-                rect.x() / self.scale_ratio,
-                rect.y() / self.scale_ratio,
-                rect.width() / self.scale_ratio,
-                rect.height() / self.scale_ratio
-            )
+            unscaled_rect = self._scale_rect(rect, 1 / self.scale_ratio)
 
             label = self.get_current_anno_label() if self.get_current_anno_label else self.parent_window.current_label
-            self.db.save_annotation(self.image_path, unscaled_rect, label)
+            ann_id = self.db.save_annotation(self.image_path, unscaled_rect, label)
 
-            # ラベル表示
-            text_item = self._get_text_item(label, rect)
-            self.scene.addItem(text_item)
+            # 確定した矩形はレイヤーへ
+            if self.annotation_layer is not None:
+                self.annotation_layer.add_box(ann_id, unscaled_rect, label)
 
-            self.rect_items.append((self.temp_rect, text_item))
-            self.temp_rect = None
             self.start_point = None
+            self.drag_end = None
             self.parent_window.image_view.setFocus()
+        elif event.button() == Qt.LeftButton:
+            self.start_point = None
 
     # ズーム操作（ビュー変換のみを変更し、アノテーション座標はそのまま）
     def apply_view_scale(self):
@@ -453,32 +1003,50 @@ class AnnotatableImageView(QGraphicsView):
 
     def zoom_in(self):
         self.view_scale = self.zoom_scale
+        # タイル表示では少なくとも等倍（元画像の画素）まで拡大
+        if self.tile_item is not None:
+            self.view_scale = max(self.zoom_scale, 1 / self.scale_ratio)
         self.apply_view_scale()
 
     def reset_zoom(self):
         self.view_scale = 1.0
         self.apply_view_scale()
 
-    def _get_rect_item(self, rect):
-        rect_item = QGraphicsRectItem(rect)
-        rect_item.setPen(QPen(QColor("red"), 2))
+    def _get_scaled_pixmap(self):
+        # numpy側で表示サイズにしてから、BGRのままQImage → QPixmapへ1回だけコピー
+        ratio = self._get_fit_ratio()
+        size = (max(1, round(self.orig_width * ratio)), max(1, round(self.orig_height * ratio)))
+        image = resize_image(self.source_image, size)
+        qimage = QImage(image.data, size[0], size[1], image.strides[0], QImage.Format_BGR888)
+        return QPixmap.fromImage(qimage)
 
-        return rect_item
+    def _get_display_size(self):
+        size = self.viewport().size()
+        return size.width(), size.height()
+
+    def _covers_display(self, image):
+        ratio = self._get_fit_ratio()
+        h, w = image.shape[:2]
+        return w >= min(self.orig_width, round(self.orig_width * ratio)) and \
+            h >= min(self.orig_height, round(self.orig_height * ratio))
 
-    def _get_text_item(self, text, rect):
-        text_item = QGraphicsSimpleTextItem(text)
-        font = QFont()
-        font.setPointSize(14)
-        text_item.setFont(font)
-        text_item.setPos(rect.x(), rect.y() - 25)
-        text_item.setBrush(QColor("blue"))
+    def _get_fit_ratio(self):
+        size = self.viewport().size()
+        return min(size.width() / self.orig_width, size.height() / self.orig_height)
 
-        return text_item
+    def _scale_rect(self, rect, ratio):
+        return QRectF(rect.x() * ratio, rect.y() * ratio, rect.width() * ratio, rect.height() * ratio)
 
+    def _get_rect_item(self, rect):
+        rect_item = QGraphicsRectItem(rect)
+        rect_item.setPen(QPen(QColor("red"), 2))
 
+        return rect_item
 
 
 if __name__ == "__main__":
+    if "--startup-time" in sys.argv:
+        startup.enabled = True
     app = QApplication(sys.argv)
     window = Annotator()
     window.show()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import operator
+
+from PySide6.QtWidgets import QGraphicsItem
+from PySide6.QtGui import QPen, QColor, QFont, QFontMetricsF
+from PySide6.QtCore import QRectF, QPointF
+
+from src.spatial import GridIndex, suggest_cell_size
+
+LABEL_OFFSET = 25  # ラベルは矩形の上に表示
+LABEL_MARGIN = 200
+
+
+class AnnotationLayerItem(QGraphicsItem):
+    """Draws every box of the current image as a single scene item.
+
+    Boxes are kept in original image coordinates and indexed with a
+    GridIndex, which is used both for hit-testing and for painting only the
+    boxes inside the exposed rect. Pen and font are shared by all boxes.
+    """
+
+    def __init__(self, scale_ratio=1.0):
+        super().__init__()
+        self.scale_ratio = scale_ratio
+
+        self.boxes = {}  # id: (元画像座標の(x, y, w, h), label)
+        self.index = GridIndex()
+        self.extent = QRectF()
+
+        self.pen = QPen(QColor("red"), 2)
+        self.text_color = QColor("blue")
+        self.font = QFont()
+        self.font.setPointSize(14)
+        self.ascent = QFontMetricsF(self.font).ascent()
+
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+        # 矩形の追加・削除やズームがない限り、描画結果を再利用
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def set_boxes(self, boxes):
+        """Replace all boxes with `boxes`, an iterable of (id, (x, y, w, h), label) as load_annotations returns."""
+        self.prepareGeometryChange()
+        self.boxes = {ann_id: (rect, label) for ann_id, rect, label in boxes}
+
+        # QRectFは描画時にだけ作る
+        rects = {ann_id: rect for ann_id, (rect, _) in self.boxes.items()}
+        self.index = GridIndex(suggest_cell_size([max(rect[2], rect[3]) for rect in rects.values()]))
+        self.index.load(rects)
+        self._update_extent()
+        self.update()
+
+    def add_box(self, ann_id, rect, label):
+        """Add one box; `rect` is (x, y, w, h) or a QRectF, in original image coordinates."""
+        self.prepareGeometryChange()
+        x, y, w, h = rect.getRect() if isinstance(rect, QRectF) else rect
+        self.boxes[ann_id] = ((x, y, w, h), label)
+        self.index.insert(ann_id, x, y, w, h)
+        self.extent = self.extent.united(QRectF(x, y, w, h))
+        self.update()
+
+    def remove_box(self, ann_id):
+        box = self.boxes.pop(ann_id, None)
+        if box is None:
+            return
+        self.index.remove(ann_id)
+
+        # 外周に接する矩形を消したときだけ、範囲を求め直す
+        x, y, w, h = box[0]
+        extent = self.extent
+        if x <= extent.left() or y <= extent.top() or x + w >= extent.right() or y + h >= extent.bottom():
+            self.prepareGeometryChange()
+            self._update_extent()
+        self.update()
+
+    def clear(self):
+        self.set_boxes([])
+
+    def box_at(self, pos):
+        """Id of the smallest box containing the scene position `pos`, or None."""
+        hits = self.index.query_point(pos.x() / self.scale_ratio, pos.y() / self.scale_ratio)
+        return hits[0] if hits else None
+
+    def _update_extent(self):
+        if not self.boxes:
+            self.extent = QRectF()
+            return
+        xs, ys, ws, hs = zip(*(rect for rect, _ in self.boxes.values()))
+        x0, y0 = min(xs), min(ys)
+        x1 = max(map(operator.add, xs, ws))
+        y1 = max(map(operator.add, ys, hs))
+        self.extent = QRectF(x0, y0, x1 - x0, y1 - y0)
+
+    def set_scale_ratio(self, scale_ratio):
+        self.prepareGeometryChange()
+        self.scale_ratio = scale_ratio
+
+    def boundingRect(self):
+        r = self.scale_ratio
+        return QRectF(self.extent.x() * r, self.extent.y() * r,
+                      self.extent.width() * r, self.extent.height() * r).adjusted(
+            -self.pen.widthF(), -LABEL_OFFSET - self.pen.widthF(), LABEL_MARGIN, self.pen.widthF())
+
+    def paint(self, painter, option, widget=None):
+        r = self.scale_ratio
+        exposed = option.exposedRect
+        # ラベルだけが見えている矩形も含める
+        keys = self.index.query_rect(
+            (exposed.x() - LABEL_MARGIN) / r, exposed.y() / r,
+            (exposed.width() + LABEL_MARGIN) / r, (exposed.height() + LABEL_OFFSET) / r)
+        if not keys:
+            return
+
+        rects = []
+        labels = []
+        for key in keys:
+            (x, y, w, h), label = self.boxes[key]
+            scaled = QRectF(x * r, y * r, w * r, h * r)
+            rects.append(scaled)
+            labels.append((scaled, label))
+
+        painter.setPen(self.pen)
+        painter.drawRects(rects)
+
+        painter.setPen(self.text_color)
+        painter.setFont(self.font)
+        for scaled, label in labels:
+            painter.drawText(QPointF(scaled.x(), scaled.y() - LABEL_OFFSET + self.ascent), label)
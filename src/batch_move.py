@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+JOURNAL_NAME = ".imageannotator_move_journal.jsonl"
+MOVE_WORKERS = 8
+
+
+def journal_path(root):
+    return os.path.join(root, JOURNAL_NAME)
+
+
+def has_pending_journal(root):
+    return os.path.exists(journal_path(root))
+
+
+class MoveJournal:
+    """Append-only JSON-lines log of one batch move.
+
+    The first line is the plan ({"plan": [[src, dst], ...]}), followed by one
+    {"done": i} line per finished file move. The file is removed once the
+    database has been updated, so a leftover journal means the batch was
+    interrupted and can be resumed or rolled back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def start(self, moves):
+        # 既存の記録（実行中・中断された移動）を上書きしない
+        self._file = open(self.path, "x", encoding="utf-8")
+        self._write({"plan": moves}, sync=True)
+
+    def reopen(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def mark_done(self, i):
+        with self._lock:
+            self._write({"done": i})
+
+    def load(self):
+        """Return (moves, done indices)."""
+        moves = []
+        done = set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で中断された最終行
+                    break
+                if "plan" in entry:
+                    moves = [tuple(move) for move in entry["plan"]]
+                elif "done" in entry:
+                    done.add(entry["done"])
+        return moves, done
+
+    def finish(self):
+        self.close()
+        os.remove(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry, sync=False):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        # doneは失われてもresume時にファイルの有無から復元できるので、fsyncは計画のみ
+        if sync:
+            os.fsync(self._file.fileno())
+
+
+class BatchMover:
+    """Moves many images between label folders in one journaled operation.
+
+    File moves run on a thread pool, then the database is updated in a single
+    transaction (AnnotationDB.update_labels).
+    """
+
+    def __init__(self, root, db, workers=MOVE_WORKERS):
+        self.root = root
+        self.db = db
+        self.workers = workers
+        self.journal = MoveJournal(journal_path(root))
+
+    def plan(self, paths, new_label):
+        """List of (src, dst) for `paths`; skips images already in `new_label` or whose target exists."""
+        new_dir = os.path.join(self.root, new_label)
+        moves = []
+        for path in paths:
+            if os.path.basename(os.path.dirname(path)) == new_label:
+                continue
+            dst = os.path.join(new_dir, os.path.basename(path))
+            if os.path.exists(dst):
+                print(f"[ERROR] Skipping move: {path} → {dst} already exists")
+                continue
+            moves.append((path, dst))
+        return moves
+
+    def run(self, moves, progress=None):
+        """Execute `moves`; returns the list of (src, dst) that were moved.
+
+        Raises RuntimeError while another batch of this root is in progress or
+        was interrupted (its journal exists); resume or roll that back first.
+        """
+        if not moves:
+            return []
+
+        try:
+            self.journal.start([list(move) for move in moves])
+        except FileExistsError:
+            raise RuntimeError(f"Another batch move in {self.root} is in progress or was interrupted "
+                               f"({self.journal.path}); resume or roll it back first") from None
+
+        for new_dir in {os.path.dirname(dst) for _, dst in moves}:
+            os.makedirs(new_dir, exist_ok=True)
+        done = self._move_files(moves, set(), progress)
+
+        moved = [moves[i] for i in sorted(done)]
+        self.db.update_labels([dst for _, dst in moved])
+        self.journal.finish()
+        return moved
+
+    def resume(self, progress=None):
+        """Finish an interrupted batch; returns the list of (src, dst) moved by it."""
+        moves, done = self.journal.load()
+        for i, (src, dst) in enumerate(moves):
+            # 移動済みだが記録前に中断された分
+            if i not in done and not os.path.exists(src) and os.path.exists(dst):
+                done.add(i)
+
+        self.journal.reopen()
+        done = self._move_files(moves, done, progress)
+
+        moved = [moves[i] for i in sorted(done)]
+        self.db.update_labels([dst for _, dst in moved])
+        self.journal.finish()
+        return moved
+
+    def rollback(self):
+        """Undo an interrupted batch; returns the list of (dst, src) moved back."""
+        moves, _ = self.journal.load()
+        restored = []
+        for src, dst in moves:
+            if os.path.exists(dst) and not os.path.exists(src):
+                shutil.move(dst, src)
+                restored.append((dst, src))
+
+        self.db.update_labels([src for _, src in restored])
+        self.journal.finish()
+        return restored
+
+    def _move_files(self, moves, done, progress):
+        todo = [i for i in range(len(moves)) if i not in done]
+        done = set(done)
+        lock = threading.Lock()
+
+        def move(i):
+            src, dst = moves[i]
+            try:
+                shutil.move(src, dst)
+            except OSError as e:
+                print(f"[ERROR] Failed to move {src} → {e}")
+                return
+            self.journal.mark_done(i)
+            with lock:
+                done.add(i)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="move") as executor:
+            for n, _ in enumerate(executor.map(move, todo), 1):
+                if progress:
+                    progress(n, len(todo))
+
+        return done
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Headless command-line access to the annotation database.
+
+    python -m src.cli [--db annotations.db] import annotations.csv
+    python -m src.cli export out.csv
+    python -m src.cli export coco.json --format coco --images ROOT
+    python -m src.cli merge a.db b.db [--dedupe]
+    python -m src.cli stats [--by rect_label|created_by]
+    python -m src.cli check [--images ROOT]
+    python -m src.cli find "boxes>50 label:cat"
+    python -m src.cli crops OUT --images ROOT [--size 224]
+
+Only the standard library is loaded at startup (no Qt, no OpenCV; the npy
+export imports NumPy on demand), and every command streams rows or aggregates in
+SQLite, so memory stays flat on large databases.
+"""
+import sys
+import os
+import time
+import argparse
+
+from src.db import AnnotationDB, DB_PATH, IMPORT_CHUNK_SIZE, USER_ENV
+from src.image_filter import ImageFilter
+
+EXPORT_FORMATS = ("csv", "coco", "yolo", "voc", "npy", "parquet")
+
+
+def _open(path, must_exist=True, user=None):
+    if must_exist and not os.path.exists(path):
+        print(f"[ERROR] Database not found: {path}", file=sys.stderr)
+        sys.exit(2)
+    return AnnotationDB(path, user)
+
+
+def _print_progress(rows, rows_per_sec):
+    print(f"\r{rows} rows ({rows_per_sec:.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+
+def _print_crop_progress(crops, crops_per_sec):
+    print(f"\r{crops} crops ({crops_per_sec:.0f} crops/s)", end="", file=sys.stderr, flush=True)
+
+
+def cmd_import(args):
+    db = _open(args.db, must_exist=False, user=args.user)
+    try:
+        imported, rejected = db.import_from_csv(args.csv, chunk_size=args.chunk_size,
+                                                rebuild_indexes=args.rebuild_indexes,
+                                                progress=None if args.quiet else _print_progress)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+    if not args.quiet:
+        print(file=sys.stderr)
+    message = f"Imported {imported} annotations from: {args.csv}"
+    if rejected:
+        message += f" ({rejected} rejected rows -> {args.csv}.errors.csv)"
+    print(message)
+    return 0
+
+
+def cmd_export(args):
+    # エクスポート時だけimport（numpyはnpy形式の時だけ読み込む）
+    from src.exporters import export_annotations
+
+    db = _open(args.db)
+    try:
+        images, boxes, skipped, unlabeled = export_annotations(db, args.out, args.format, image_root=args.images,
+                                                               workers=args.workers)
+    except (ValueError, RuntimeError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+    message = f"Exported {boxes} annotations of {images} images to: {args.out}"
+    if skipped:
+        message += f" ({skipped} images skipped: size unknown)"
+    if unlabeled:
+        message += f" ({unlabeled} annotations without a label skipped)"
+    print(message)
+    return 0
+
+
+def cmd_merge(args):
+    db = _open(args.db, must_exist=False, user=args.user)
+    total = 0
+    try:
+        for path in args.sources:
+            try:
+                added = db.merge_from(path, dedupe=args.dedupe)
+            except FileNotFoundError:
+                print(f"[ERROR] Database not found: {path}", file=sys.stderr)
+                return 2
+            print(f"{path}: {added} annotations")
+            total += added
+    finally:
+        db.close()
+    print(f"Merged {total} annotations into: {args.db}")
+    return 0
+
+
+def cmd_stats(args):
+    db = _open(args.db)
+    try:
+        if args.by == "rect_label":
+            rows = db.rect_label_stats()
+        elif args.by == "created_by":
+            rows = db.user_stats()
+        else:
+            rows = db.label_stats()
+    finally:
+        db.close()
+
+    width = max([len(args.by)] + [len(str(label)) for label, _, _ in rows])
+    print(f"{args.by:<{width}}  {'images':>10}  {'boxes':>10}")
+    for label, images, boxes in rows:
+        print(f"{str(label):<{width}}  {images:>10}  {boxes:>10}")
+    print(f"{'total':<{width}}  {sum(r[1] for r in rows):>10}  {sum(r[2] for r in rows):>10}")
+    return 0
+
+
+def cmd_check(args):
+    db = _open(args.db)
+    try:
+        problems = db.check(image_root=args.images)
+    finally:
+        db.close()
+
+    for name, count in problems.items():
+        print(f"{name:<20} {count}")
+    return 1 if any(problems.values()) else 0
+
+
+def cmd_crops(args):
+    # OpenCVを読み込むので切り出し時だけimport
+    from src.crops import extract_crops
+
+    db = _open(args.db)
+    start = time.perf_counter()
+    try:
+        images, written, existing, skipped = extract_crops(
+            db, args.images, args.out, max_size=args.size, image_format=args.format, workers=args.workers,
+            progress=None if args.quiet else _print_crop_progress)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+    if not args.quiet:
+        print(file=sys.stderr)
+    seconds = time.perf_counter() - start
+    message = f"Wrote {written} crops of {images} images to: {args.out} ({written / seconds:.0f} crops/s)"
+    if existing:
+        message += f", {existing} already there"
+    if skipped:
+        message += f", {skipped} skipped (image missing or box outside it)"
+    print(message)
+    return 0
+
+
+def cmd_find(args):
+    try:
+        image_filter = ImageFilter(args.filter)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+
+    db = _open(args.db)
+    try:
+        names = sorted(db.find_filenames(image_filter))
+    finally:
+        db.close()
+
+    for name in names:
+        print(name)
+    if image_filter.matches_unannotated():
+        print("[WARN] images without annotations also match but are not in the database", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="ImageAnnotator database tool")
+    parser.add_argument("--db", default=DB_PATH, help=f"annotation database (default: {DB_PATH})")
+    parser.add_argument("--user", help=f"name recorded as created_by of imported boxes (default: ${USER_ENV} or login name)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import", help="append annotations from a CSV file")
+    p.add_argument("csv")
+    p.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    p.add_argument("--rebuild-indexes", action="store_true", help="drop indexes during the import (faster for large files)")
+    p.add_argument("-q", "--quiet", action="store_true")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser("export", help="write all annotations as CSV, COCO, YOLO, VOC, NumPy or Parquet")
+    p.add_argument("out", help="output file, or folder for yolo/voc/npy")
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    p.add_argument("--images", metavar="ROOT", help="image root folder (needed for coco/yolo/voc image sizes)")
+    p.add_argument("--workers", type=int, help="processes for reading image headers")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("merge", help="append the annotations of other .db files")
+    p.add_argument("sources", nargs="+")
+    p.add_argument("--dedupe", action="store_true", help="skip boxes that already exist")
+    p.set_defaults(func=cmd_merge)
+
+    p = commands.add_parser("stats", help="image and box counts per label")
+    p.add_argument("--by", choices=("img_label", "rect_label", "created_by"), default="img_label")
+    p.set_defaults(func=cmd_stats)
+
+    p = commands.add_parser("check", help="report integrity problems (exit status 1 if any)")
+    p.add_argument("--images", metavar="ROOT", help="also check that annotated images exist under ROOT/<label>/")
+    p.set_defaults(func=cmd_check)
+
+    p = commands.add_parser("crops", help="write every box as an image file under OUT/<rect_label>/ (resumable)")
+    p.add_argument("out")
+    p.add_argument("--images", metavar="ROOT", required=True, help="image root folder with <img_label>/<filename>")
+    p.add_argument("--size", type=int, help="shrink crops to fit SIZE x SIZE (allows reduced decoding)")
+    p.add_argument("--format", choices=("jpg", "png"), default="jpg")
+    p.add_argument("--workers", type=int, help="crop processes (0: in this process)")
+    p.add_argument("-q", "--quiet", action="store_true")
+    p.set_defaults(func=cmd_crops)
+
+    p = commands.add_parser("find", help="list annotated images matching a filter (see src/image_filter.py)")
+    p.add_argument("filter", help='e.g. "boxes>50", "label:cat -mismatch"')
+    p.set_defaults(func=cmd_find)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
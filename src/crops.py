@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import itertools
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from src.image_cache import load_reduced, fit_size, resize_image
+from src.imagesize import get_image_size
+from src.pool import process_pool
+
+CROP_FORMATS = ("jpg", "png")
+JPEG_QUALITY = 95
+IN_FLIGHT_PER_WORKER = 4
+PROGRESS_EVERY = 100  # images
+NO_LABEL_DIR = "_none"
+
+
+def reduction_factor(boxes, max_size):
+    """Largest JPEG reduction (1, 2, 4 or 8) keeping every box at least `max_size` on its longest side."""
+    factor = 8
+    for _, _, _, w, h in boxes:
+        while factor > 1 and max(w, h) / factor < max_size:
+            factor //= 2
+    return factor
+
+
+def crop_image(path, boxes, max_size=None, image_format="jpg"):
+    """Decode `path` once and write every box of `boxes`, a list of (out_path, x, y, width, height).
+
+    Runs in a worker process. With `max_size`, the image is decoded reduced
+    as far as the smallest box allows (see reduction_factor) and each crop is
+    shrunk to fit max_size x max_size. A crop is written to a temporary name
+    and renamed, so an interrupted run never leaves a partial file behind.
+    Returns (written, skipped).
+    """
+    import cv2
+
+    size = get_image_size(path)
+    factor = reduction_factor(boxes, max_size) if max_size and size else 1
+    image = load_reduced(path, factor)
+    if image is None:
+        return 0, len(boxes)
+
+    height, width = image.shape[:2]
+    scale_x = width / size[0] if size else 1.0
+    scale_y = height / size[1] if size else 1.0
+    params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY] if image_format == "jpg" else []
+
+    written = skipped = 0
+    for out_path, x, y, w, h in boxes:
+        # 画像の外にはみ出した部分は切り捨てる
+        x0, y0 = max(0, round(x * scale_x)), max(0, round(y * scale_y))
+        x1, y1 = min(width, round((x + w) * scale_x)), min(height, round((y + h) * scale_y))
+        if x1 <= x0 or y1 <= y0:
+            skipped += 1
+            continue
+
+        crop = image[y0:y1, x0:x1]
+        if max_size:
+            crop = resize_image(crop, fit_size(x1 - x0, y1 - y0, (max_size, max_size)))
+        ok, data = cv2.imencode(f".{image_format}", crop, params)
+        if not ok:
+            skipped += 1
+            continue
+
+        temp_path = out_path + ".part"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data.tobytes())
+            os.replace(temp_path, out_path)
+        except BaseException:
+            # 中断・失敗しても書きかけのファイルを残さない
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        written += 1
+    return written, skipped
+
+
+def label_dir_name(rect_label):
+    """Folder name for a box label (path separators replaced)."""
+    if not rect_label:
+        return NO_LABEL_DIR
+    name = rect_label.replace("/", "_").replace("\\", "_")
+    return NO_LABEL_DIR if name in (".", "..") else name
+
+
+def extract_crops(db, image_root, out_dir, max_size=None, image_format="jpg", workers=None, progress=None):
+    """Write every annotated box of `db` as an image file `out_dir/<rect_label>/<image stem>_<id>.<format>`.
+
+    Annotations are read grouped by filename so each image is decoded once,
+    by a process pool with at most IN_FLIGHT_PER_WORKER images per worker
+    queued, which bounds memory. Crops that already exist are skipped, so an
+    interrupted run can be resumed. `progress(crops, crops_per_sec)` is called
+    every PROGRESS_EVERY images; `workers=0` crops in this process.
+    Returns (images, written, existing, skipped boxes).
+    """
+    if image_format not in CROP_FORMATS:
+        raise ValueError(f"Unknown crop format: {image_format}")
+    os.makedirs(out_dir, exist_ok=True)
+    # ラベルのフォルダ: 開始時に空でなかったか（空なら再開ではないので、存在確認を省く）
+    resumed_dirs = {}
+    images = written = existing = skipped = 0
+    start = time.perf_counter()
+
+    def tasks():
+        nonlocal existing
+        for filename, rows in itertools.groupby(db.iter_boxes(), key=lambda row: row[1]):
+            rows = list(rows)
+            stem = os.path.splitext(filename or "")[0]
+            boxes = []
+            for ann_id, _, _, x, y, w, h, rect_label in rows:
+                label_dir = os.path.join(out_dir, label_dir_name(rect_label))
+                resumed = resumed_dirs.get(label_dir)
+                if resumed is None:
+                    os.makedirs(label_dir, exist_ok=True)
+                    # 空かどうかだけ見る（フォルダ全体は列挙しない）
+                    with os.scandir(label_dir) as it:
+                        resumed = resumed_dirs[label_dir] = next(it, None) is not None
+                out_path = os.path.join(label_dir, f"{stem}_{ann_id}.{image_format}")
+                if resumed and os.path.exists(out_path):
+                    existing += 1
+                else:
+                    boxes.append((out_path, x, y, w, h))
+            yield os.path.join(image_root, rows[0][2] or "", filename or ""), boxes
+
+    def collect(result):
+        nonlocal images, written, skipped
+        images += 1
+        written += result[0]
+        skipped += result[1]
+        if progress and images % PROGRESS_EVERY == 0:
+            progress(written, written / (time.perf_counter() - start))
+
+    if workers == 0:
+        for path, boxes in tasks():
+            collect(crop_image(path, boxes, max_size, image_format) if boxes else (0, 0))
+    else:
+        _crop_on_pool(tasks(), max_size, image_format, workers or os.cpu_count() or 1, collect)
+
+    if progress:
+        progress(written, written / (time.perf_counter() - start))
+    return images, written, existing, skipped
+
+
+def _crop_on_pool(tasks, max_size, image_format, workers, collect):
+    executor = process_pool(workers)
+    pending = {}  # future: (path, 矩形数)
+
+    def collect_done(futures):
+        for future in futures:
+            path, count = pending.pop(future)
+            try:
+                collect(future.result())
+            except Exception as e:
+                print(f"[ERROR] Failed to crop: {path} → {e}")
+                collect((0, count))
+
+    try:
+        for path, boxes in tasks:
+            if not boxes:
+                collect((0, 0))
+                continue
+            # 先に積む画像の数を抑えてメモリを一定に保つ
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect_done(finished)
+            pending[executor.submit(crop_image, path, boxes, max_size, image_format)] = (path, len(boxes))
+        collect_done(wait(pending)[0])
+    finally:
+        executor.shutdown(cancel_futures=True)
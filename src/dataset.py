@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import heapq
+import bisect
+
+
+def _key(name):
+    return name.lower()
+
+
+def _find(names, name):
+    """Row of `name` in the sorted list `names`, or None."""
+    key = _key(name)
+    row = bisect.bisect_left(names, key, key=_key)
+    # 大文字小文字だけが違う名前が並ぶ場合
+    while row < len(names) and _key(names[row]) == key:
+        if names[row] == name:
+            return row
+        row += 1
+    return None
+
+
+class ImageDataset:
+    """Images grouped by label folder under one root directory.
+
+    Each label keeps a single interned directory prefix and a list of file
+    names sorted case-insensitively, so a path costs one short string.
+    Lookups, inserts and moves find the row with bisect (O(log n)); the
+    label of a path is its parent folder name, so no per-path index is needed.
+
+    With a filter (a predicate over file names) set, only the matching names
+    are visible: rows, counts, lookups and views all refer to the visible
+    names, and the others are kept aside until the filter changes.
+    """
+
+    def __init__(self, root=""):
+        self.root = root
+        self.labels = []  # ソート済み
+        self._names = {}  # label: [file name]（小文字でソート）
+        self._dirs = {}  # label: ディレクトリ（intern済み）
+        self._hidden = {}  # label: 絞り込みで隠れているfile name（ソート済み）
+        self.filter = None
+
+    def __len__(self):
+        return sum(len(names) for names in self._names.values())
+
+    def __contains__(self, path):
+        # 絞り込みで隠れている画像も含む
+        if self.locate(path) is not None:
+            return True
+        hidden = self._hidden.get(os.path.basename(os.path.dirname(path)))
+        return bool(hidden) and _find(hidden, os.path.basename(path)) is not None
+
+    def reset(self, root):
+        self.root = root
+        self.labels.clear()
+        self._names.clear()
+        self._dirs.clear()
+        self._hidden.clear()
+
+    # ラベル
+    def add_label(self, label):
+        if label in self._names:
+            return False
+        bisect.insort(self.labels, label)
+        self._names[label] = []
+        self._hidden[label] = []
+        self._dirs[label] = sys.intern(os.path.join(self.root, label))
+        return True
+
+    def remove_label(self, label):
+        self.labels.remove(label)
+        del self._names[label]
+        del self._dirs[label]
+        del self._hidden[label]
+
+    def set_names(self, label, names):
+        self.add_label(label)
+        self._names[label], self._hidden[label] = self._split(sorted(names, key=_key))
+
+    def has_names(self, label, names):
+        """Whether `label` holds exactly `names` (hidden ones included)."""
+        shown = self._names.get(label)
+        if shown is None:
+            return False
+        hidden = self._hidden[label]
+        return len(names) == len(shown) + len(hidden) and set(names) == set(shown).union(hidden)
+
+    def set_filter(self, predicate):
+        """Show only the names for which `predicate(name)` is true (None shows all)."""
+        self.filter = predicate
+        for label in self.labels:
+            names = list(heapq.merge(self._names[label], self._hidden[label], key=_key))
+            self._names[label], self._hidden[label] = self._split(names)
+
+    def hidden_count(self):
+        return sum(len(names) for names in self._hidden.values())
+
+    def is_shown(self, name):
+        return self.filter is None or self.filter(name)
+
+    def _split(self, names):
+        # ソート済みのnamesを（表示, 非表示）に分ける
+        if self.filter is None:
+            return names, []
+        shown = []
+        hidden = []
+        for name in names:
+            (shown if self.filter(name) else hidden).append(name)
+        return shown, hidden
+
+    def label_row(self, label):
+        row = bisect.bisect_left(self.labels, label)
+        if row < len(self.labels) and self.labels[row] == label:
+            return row
+        raise ValueError(label)
+
+    # 画像
+    def count(self, label):
+        return len(self._names.get(label, ()))
+
+    def name_at(self, label, row):
+        return self._names[label][row]
+
+    def path_at(self, label, row):
+        return os.path.join(self._dirs[label], self._names[label][row])
+
+    def path(self, label, name):
+        return os.path.join(self._dirs[label], name)
+
+    def locate(self, path):
+        """(label, row) of `path`, or None."""
+        label = os.path.basename(os.path.dirname(path))
+        names = self._names.get(label)
+        if names is None:
+            return None
+
+        row = _find(names, os.path.basename(path))
+        return None if row is None else (label, row)
+
+    def insertion_row(self, label, name):
+        return bisect.bisect_right(self._names[label], _key(name), key=_key)
+
+    def insert(self, label, name, row=None):
+        """Insert `name` into `label` in sorted position; returns its row."""
+        if row is None:
+            row = self.insertion_row(label, name)
+        self._names[label].insert(row, name)
+        return row
+
+    def remove(self, label, row):
+        return self._names[label].pop(row)
+
+    def hide(self, label, name):
+        """Add `name` to `label` as hidden by the filter."""
+        bisect.insort(self._hidden[label], name, key=_key)
+
+    def move(self, path, new_label):
+        """Move `path` to `new_label`; returns (old_label, old_row, new_row, new_path).
+
+        The filter is applied to the moved image; new_row is None when it hides it.
+        """
+        old_label, old_row = self.locate(path)
+        name = self.remove(old_label, old_row)
+        if self.is_shown(name):
+            new_row = self.insert(new_label, name)
+        else:
+            new_row = None
+            self.hide(new_label, name)
+        return old_label, old_row, new_row, self.path(new_label, name)
+
+    def view(self, label):
+        return LabelView(self, label)
+
+    def items(self):
+        """Yield (label, name) for every image, hidden ones included, in sorted order."""
+        for label in self.labels:
+            for name in heapq.merge(self._names[label], self._hidden[label], key=_key):
+                yield label, name
+
+
+class LabelView:
+    """Read-only sequence of the image paths of one label (live)."""
+
+    def __init__(self, dataset, label):
+        self.dataset = dataset
+        self.label = label
+
+    def __len__(self):
+        return self.dataset.count(self.label)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self.dataset.path_at(self.label, row)
+
+    def index(self, path):
+        location = self.dataset.locate(path)
+        if location is None or location[0] != self.label:
+            raise ValueError(path)
+        return location[1]
+
+    def __contains__(self, path):
+        location = self.dataset.locate(path)
+        return location is not None and location[0] == self.label
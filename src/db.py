@@ -4,14 +4,170 @@ import os
 import shutil
 import csv
 import sqlite3
+import time
+import getpass
+from contextlib import contextmanager
 
-from PySide6.QtCore import QRectF
+from src.image_filter import ImageFilter
+from src.perf import profiler, timed
+from src.rect import Rect
+
+DB_PATH = "annotations.db"
+USER_ENV = "ANNOTATOR_USER"
+BUSY_TIMEOUT = 10.0  # sec, 他のプロセスの書き込みロックを待つ時間
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64 * 1024,  # KiB
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+INDEXES = {
+    "idx_annotations_filename": "CREATE INDEX IF NOT EXISTS idx_annotations_filename ON annotations (filename)",
+}
+
+# 画像ごとの集計（image_stats, image_box_labels）をannotationsの変更に合わせて更新する
+_STATS_ADD = '''
+    INSERT INTO image_stats (filename, boxes, mismatched) VALUES (NEW.filename, 1, NEW.rect_label IS NOT NEW.img_label)
+        ON CONFLICT (filename) DO UPDATE SET boxes = boxes + 1, mismatched = mismatched + excluded.mismatched;
+    INSERT INTO image_box_labels (filename, rect_label, boxes) VALUES (NEW.filename, IFNULL(NEW.rect_label, ''), 1)
+        ON CONFLICT (filename, rect_label) DO UPDATE SET boxes = boxes + 1;'''
+_STATS_REMOVE = '''
+    UPDATE image_stats SET boxes = boxes - 1, mismatched = mismatched - (OLD.rect_label IS NOT OLD.img_label)
+        WHERE filename = OLD.filename;
+    DELETE FROM image_stats WHERE filename = OLD.filename AND boxes <= 0;
+    UPDATE image_box_labels SET boxes = boxes - 1 WHERE filename = OLD.filename AND rect_label = IFNULL(OLD.rect_label, '');
+    DELETE FROM image_box_labels
+        WHERE filename = OLD.filename AND rect_label = IFNULL(OLD.rect_label, '') AND boxes <= 0;'''
+
+TRIGGERS = {
+    "trg_annotations_insert": f"CREATE TRIGGER IF NOT EXISTS trg_annotations_insert AFTER INSERT ON annotations "
+                              f"BEGIN {_STATS_ADD} END",
+    "trg_annotations_delete": f"CREATE TRIGGER IF NOT EXISTS trg_annotations_delete AFTER DELETE ON annotations "
+                              f"BEGIN {_STATS_REMOVE} END",
+    # 座標だけの更新では集計は変わらない
+    "trg_annotations_update": f"CREATE TRIGGER IF NOT EXISTS trg_annotations_update "
+                              f"AFTER UPDATE OF filename, rect_label, img_label ON annotations "
+                              f"BEGIN {_STATS_REMOVE} {_STATS_ADD} END",
+}
+
+IMPORT_CHUNK_SIZE = 50000
+CSV_COLUMNS = ["filename", "img_label", "x", "y", "width", "height", "rect_label"]
+
+
+def _migrate_v1(conn):
+    # rowidを主キー(id)として明示し、filenameにインデックスを張る
+    conn.execute('''CREATE TABLE annotations_v1 (
+        id INTEGER PRIMARY KEY,
+        filename TEXT,
+        x REAL,
+        y REAL,
+        width REAL,
+        height REAL,
+        rect_label TEXT,
+        img_label TEXT
+    )''')
+    conn.execute('''INSERT INTO annotations_v1 (id, filename, x, y, width, height, rect_label, img_label)
+                    SELECT rowid, filename, x, y, width, height, rect_label, img_label FROM annotations''')
+    conn.execute("DROP TABLE annotations")
+    conn.execute("ALTER TABLE annotations_v1 RENAME TO annotations")
+    conn.execute(INDEXES["idx_annotations_filename"])
+
+
+def _migrate_v2(conn):
+    # エクスポート用の画像サイズキャッシュ（ヘッダーから読んだ値、mtimeで無効化）
+    conn.execute('''CREATE TABLE image_sizes (
+        filename TEXT PRIMARY KEY,
+        mtime REAL,
+        width INTEGER,
+        height INTEGER
+    )''')
+
+
+def _migrate_v3(conn):
+    # 共有DBで誰がいつ矩形を作成・更新したか
+    for column, type_ in (("created_by", "TEXT"), ("created_at", "REAL"), ("updated_by", "TEXT"), ("updated_at", "REAL")):
+        conn.execute(f"ALTER TABLE annotations ADD COLUMN {column} {type_}")
+
+
+def _migrate_v4(conn):
+    # 内容による画像の絞り込み用に、画像ごとの矩形数・ラベル集合をトリガーで保持する
+    conn.execute('''CREATE TABLE image_stats (
+        filename TEXT PRIMARY KEY,
+        boxes INTEGER NOT NULL,
+        mismatched INTEGER NOT NULL
+    )''')
+    conn.execute('''CREATE TABLE image_box_labels (
+        filename TEXT,
+        rect_label TEXT,
+        boxes INTEGER NOT NULL,
+        PRIMARY KEY (filename, rect_label)
+    ) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX idx_image_stats_boxes ON image_stats (boxes)")
+    conn.execute("CREATE INDEX idx_image_stats_mismatched ON image_stats (mismatched)")
+    conn.execute("CREATE INDEX idx_image_box_labels_rect_label ON image_box_labels (rect_label)")
+    for sql in TRIGGERS.values():
+        conn.execute(sql)
+    _rebuild_image_stats(conn)
+
+
+def _rebuild_image_stats(conn, only=""):
+    # onlyはfilenameを絞るSQL（例: "IN (SELECT filename FROM temp.stale_files)"）
+    where = f"WHERE filename {only}" if only else ""
+    conn.execute(f"DELETE FROM image_stats {where}")
+    conn.execute(f"DELETE FROM image_box_labels {where}")
+    conn.execute(f'''INSERT INTO image_stats (filename, boxes, mismatched)
+                     SELECT filename, COUNT(*), SUM(rect_label IS NOT img_label) FROM annotations {where}
+                     GROUP BY filename''')
+    conn.execute(f'''INSERT INTO image_box_labels (filename, rect_label, boxes)
+                     SELECT filename, IFNULL(rect_label, ''), COUNT(*) FROM annotations {where}
+                     GROUP BY filename, IFNULL(rect_label, '')''')
+
+
+# index i migrates user_version i -> i + 1
+MIGRATIONS = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def default_user():
+    """Name recorded in created_by/updated_by: $ANNOTATOR_USER, else the login name."""
+    user = os.environ.get(USER_ENV)
+    if user:
+        return user
+    try:
+        return getpass.getuser()
+    except Exception:
+        return None
 
 
 class AnnotationDB:
-    def __init__(self, db_path):
-        self.conn = sqlite3.connect(db_path)
+    """Annotations of one SQLite file, which may be shared by several processes.
+
+    The file is in WAL mode, so readers never block the (single) writer;
+    writers wait up to BUSY_TIMEOUT for each other, and transactions take
+    the write lock up front (BEGIN IMMEDIATE). Saved and updated boxes are
+    attributed to `user` (default: default_user()).
+    """
+
+    def __init__(self, db_path, user=None):
+        self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+        self.user = user if user is not None else default_user()
+        self._transaction_depth = 0
+
+        self.configure()
         self.create_table()
+        self.migrate()
+
+    def configure(self):
+        for name, value in PRAGMAS.items():
+            self.conn.execute(f"PRAGMA {name}={value}")
 
     def create_table(self):
         self.conn.execute('''CREATE TABLE IF NOT EXISTS annotations (
@@ -25,34 +181,84 @@ class AnnotationDB:
         )''')
         self.conn.commit()
 
+    def migrate(self):
+        # 複数のプロセスが同時に開いても一度だけ移行するよう、書き込みロックを取ってから版を確かめる
+        while self._user_version() < SCHEMA_VERSION:
+            with self.transaction():
+                version = self._user_version()
+                if version < SCHEMA_VERSION:
+                    MIGRATIONS[version](self.conn)
+                    self.conn.execute(f"PRAGMA user_version={version + 1}")
+
+    @contextmanager
+    def transaction(self):
+        """Group writes into one transaction; nested blocks join the outermost one."""
+        if self._transaction_depth == 0 and not self.conn.in_transaction:
+            # 読んでから書く途中で他のプロセスに先を越されないよう、最初に書き込みロックを取る
+            self.conn.execute("BEGIN IMMEDIATE")
+
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.conn.rollback()
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                with profiler.timer("db.commit"):
+                    self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    @timed("db.save_annotation")
     def save_annotation(self, img_path, rect, rect_label, label=None):
         _label, filename = self._get_label_and_filename(img_path)
 
         if label is None:
             label = _label
 
-        self.conn.execute(
-            "INSERT INTO annotations (filename, x, y, width, height, rect_label, img_label) VALUES (?, ?, ?, ?, ?, ?,?)",
-            (filename, rect.x(), rect.y(), rect.width(), rect.height(), rect_label, label))
-        self.conn.commit()
+        now = time.time()
+        cursor = self.conn.execute(
+            '''INSERT INTO annotations (filename, x, y, width, height, rect_label, img_label,
+                                       created_by, created_at, updated_by, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (filename, rect.x(), rect.y(), rect.width(), rect.height(), rect_label, label,
+             self.user, now, self.user, now))
+        self._commit()
+
+        return cursor.lastrowid
 
+    @timed("db.load_annotations")
     def load_annotations(self, img_path):
         label, filename = self._get_label_and_filename(img_path)
 
-        cursor = self.conn.execute("SELECT x, y, width, height, rect_label FROM annotations WHERE filename=?",
+        cursor = self.conn.execute("SELECT id, x, y, width, height, rect_label FROM annotations WHERE filename=?",
                                    (filename,))
-        return [(QRectF(x, y, w, h), rect_label) for x, y, w, h, rect_label in cursor.fetchall()]
+        return [(ann_id, Rect(x, y, w, h), rect_label) for ann_id, x, y, w, h, rect_label in cursor.fetchall()]
 
-    def delete_annotation(self, img_path, rect, tol=1.0):
-        label, filename = self._get_label_and_filename(img_path)
+    @timed("db.delete_annotation")
+    def delete_annotation(self, ann_id):
+        self.conn.execute("DELETE FROM annotations WHERE id=?", (ann_id,))
+        self._commit()
 
-        self.conn.execute(
-            '''DELETE FROM annotations WHERE filename=? AND
-               ABS(x - ?) < ? AND ABS(y - ?) < ? AND ABS(width - ?) < ? AND ABS(height - ?) < ?''',
-            (filename, rect.x(), tol, rect.y(), tol, rect.width(), tol, rect.height(), tol)
-        )
-        self.conn.commit()
+    @timed("db.update_annotation")
+    def update_annotation(self, ann_id, rect=None, rect_label=None):
+        now = time.time()
+        if rect is not None:
+            self.conn.execute(
+                "UPDATE annotations SET x=?, y=?, width=?, height=?, updated_by=?, updated_at=? WHERE id=?",
+                (rect.x(), rect.y(), rect.width(), rect.height(), self.user, now, ann_id)
+            )
+        if rect_label is not None:
+            self.conn.execute("UPDATE annotations SET rect_label=?, updated_by=?, updated_at=? WHERE id=?",
+                              (rect_label, self.user, now, ann_id))
+        self._commit()
 
+    @timed("db.update_label")
     def update_label(self, img_path):
         label, filename = self._get_label_and_filename(img_path)
 
@@ -60,41 +266,277 @@ class AnnotationDB:
             "UPDATE annotations SET img_label=? WHERE filename=?",
             (label, filename)
         )
-        self.conn.commit()
+        self._commit()
 
+    @timed("db.update_labels")
+    def update_labels(self, img_paths):
+        rows = [self._get_label_and_filename(img_path) for img_path in img_paths]
+        with self.transaction():
+            self.conn.executemany("UPDATE annotations SET img_label=? WHERE filename=?", rows)
+
+    @timed("db.delete_all_annotations")
     def delete_all_annotations(self, img_path):
         label, filename = self._get_label_and_filename(img_path)
 
         self.conn.execute("DELETE FROM annotations WHERE filename=?", (filename,))
-        self.conn.commit()
+        self._commit()
 
+    @timed("db.export_to_csv")
     def export_to_csv(self, csv_path):
         cursor = self.conn.execute("SELECT filename, x, y, width, height, rect_label, img_label FROM annotations")
         with open(csv_path, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
-            writer.writerow(["filename", "img_label", "x", "y", "width", "height", "rect_label"])
+            writer.writerow(CSV_COLUMNS)
             for row in cursor:
                 filename, x, y, width, height, rect_label, img_label = row
 
                 writer.writerow([filename, img_label, x, y, width, height, rect_label])
 
-    def import_from_csv(self, path: str):
-
-        with open(path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                try:
-                    filename = row['filename']
-                    x = float(row['x'])
-                    y = float(row['y'])
-                    width = float(row['width'])
-                    height = float(row['height'])
-                    rect_label = row['rect_label']
-                    rect = QRectF(x, y, width, height)
-                    label = row['img_label']
-                    self.save_annotation(filename, rect, rect_label, label)
-                except Exception as e:
-                    print(f"[ERROR] Skipping row: {row} → {e}")
+    @timed("db.import_from_csv")
+    def import_from_csv(self, path: str, chunk_size=IMPORT_CHUNK_SIZE, rebuild_indexes=False,
+                        error_path=None, progress=None):
+        """Stream `path` into the table, one executemany + commit per chunk.
+
+        Rejected rows are written to `error_path` (default: `<path>.errors.csv`).
+        `progress(rows, rows_per_sec)` is called after every chunk.
+        Returns (imported, rejected).
+        """
+        if error_path is None:
+            error_path = path + ".errors.csv"
+
+        imported = 0
+        rejected = 0
+        error_file = None
+        error_writer = None
+        start = time.perf_counter()
+
+        if rebuild_indexes:
+            self.drop_indexes()
+
+        try:
+            with open(path, newline='', encoding='utf-8') as csvfile:
+                reader = csv.reader(csvfile)
+                header = next(reader, None)
+                if header is None:
+                    return 0, 0
+                missing = [name for name in CSV_COLUMNS if name not in header]
+                if missing:
+                    raise ValueError(f"Missing CSV columns in {path}: {', '.join(missing)}")
+                columns = [header.index(name) for name in CSV_COLUMNS]
+
+                chunk = []
+                for row in reader:
+                    try:
+                        filename, img_label, x, y, width, height, rect_label = [row[i] for i in columns]
+                        chunk.append((os.path.basename(filename), float(x), float(y), float(width), float(height),
+                                      rect_label, img_label))
+                    except (IndexError, ValueError) as e:
+                        if error_writer is None:
+                            error_file = open(error_path, "w", newline="", encoding="utf-8")
+                            error_writer = csv.writer(error_file)
+                            error_writer.writerow(header + ["error"])
+                        error_writer.writerow(row + [str(e)])
+                        rejected += 1
+                        continue
+
+                    if len(chunk) >= chunk_size:
+                        imported += self._insert_rows(chunk, rebuild_stats=not rebuild_indexes)
+                        chunk = []
+                        if progress:
+                            progress(imported, imported / (time.perf_counter() - start))
+
+                if chunk:
+                    imported += self._insert_rows(chunk, rebuild_stats=not rebuild_indexes)
+                    if progress:
+                        progress(imported, imported / (time.perf_counter() - start))
+        finally:
+            if error_file is not None:
+                error_file.close()
+            if rebuild_indexes:
+                self.create_indexes()
+                # 索引なしではチャンクごとの集計が全件走査になるので、最後に一度だけ行う
+                with self.transaction():
+                    self._rebuild_stale_stats()
+
+        return imported, rejected
+
+    def iter_annotations(self):
+        """Cursor over (filename, img_label, x, y, width, height, rect_label), ordered by filename."""
+        return self.conn.execute('''SELECT filename, img_label, x, y, width, height, rect_label FROM annotations
+                                    ORDER BY filename''')
+
+    def iter_boxes(self):
+        """Cursor over (id, filename, img_label, x, y, width, height, rect_label), ordered by filename."""
+        return self.conn.execute('''SELECT id, filename, img_label, x, y, width, height, rect_label FROM annotations
+                                    ORDER BY filename, id''')
+
+    def iter_images(self):
+        """Cursor over the distinct (filename, img_label) pairs."""
+        return self.conn.execute("SELECT DISTINCT filename, img_label FROM annotations")
+
+    def data_version(self):
+        """Counter that changes whenever another connection (or process) commits to the file."""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def rect_labels(self):
+        """Sorted distinct rect_labels; unlabeled boxes (NULL or '') are left out."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT rect_label FROM annotations WHERE rect_label <> '' ORDER BY rect_label")]
+
+    def load_image_sizes(self):
+        """{filename: (mtime, width, height)} of the image size cache."""
+        return {filename: (mtime, width, height) for filename, mtime, width, height
+                in self.conn.execute("SELECT filename, mtime, width, height FROM image_sizes")}
+
+    def save_image_sizes(self, rows):
+        """Store (filename, mtime, width, height) rows in the image size cache."""
+        with self.transaction():
+            self.conn.executemany("INSERT OR REPLACE INTO image_sizes (filename, mtime, width, height) VALUES (?, ?, ?, ?)",
+                                  rows)
+
+    @timed("db.merge_from")
+    def merge_from(self, db_path, dedupe=False):
+        """Append every annotation of another database file; returns the number of rows added.
+
+        With `dedupe`, boxes identical to an existing one (same file, rect and label) are skipped.
+        """
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+
+        condition = ""
+        if dedupe:
+            condition = ''' WHERE NOT EXISTS (SELECT 1 FROM main.annotations a
+                        WHERE a.filename = s.filename AND a.x = s.x AND a.y = s.y AND a.width = s.width
+                          AND a.height = s.height AND a.rect_label IS s.rect_label)'''
+
+        # ATTACHはトランザクションの外で行う
+        self.conn.execute("ATTACH DATABASE ? AS merged", (db_path,))
+        try:
+            columns = ["filename", "x", "y", "width", "height", "rect_label", "img_label"]
+            # 作成者の列がない古いDBからは、作成者なしで取り込む
+            if "created_by" in {row[1] for row in self.conn.execute("PRAGMA merged.table_info(annotations)")}:
+                columns += ["created_by", "created_at", "updated_by", "updated_at"]
+            sql = (f"INSERT INTO main.annotations ({', '.join(columns)}) "
+                   f"SELECT {', '.join('s.' + c for c in columns)} FROM merged.annotations s{condition}")
+            with self._bulk_stats():
+                self.conn.execute("INSERT OR IGNORE INTO temp.stale_files SELECT DISTINCT filename FROM merged.annotations")
+                cursor = self.conn.execute(sql)
+            return cursor.rowcount
+        finally:
+            self.conn.execute("DETACH DATABASE merged")
+
+    def label_stats(self):
+        """List of (img_label, images, boxes) per image label."""
+        return self.conn.execute('''SELECT img_label, COUNT(DISTINCT filename), COUNT(*) FROM annotations
+                                    GROUP BY img_label ORDER BY img_label''').fetchall()
+
+    def rect_label_stats(self):
+        """List of (rect_label, images, boxes) per box label."""
+        return self.conn.execute('''SELECT rect_label, COUNT(DISTINCT filename), COUNT(*) FROM annotations
+                                    GROUP BY rect_label ORDER BY rect_label''').fetchall()
+
+    def find_filenames(self, image_filter, invert=False):
+        """Set of annotated file names matching `image_filter` (an ImageFilter), or not matching it with `invert`."""
+        # SQLは解析済みのImageFilterが組み立てたもの（値はすべてパラメータ）に限る
+        if not isinstance(image_filter, ImageFilter):
+            raise TypeError(f"find_filenames takes an ImageFilter, not {type(image_filter).__name__}")
+        where, params = image_filter.where()
+        if invert:
+            where = f"NOT ({where})"
+        return {row[0] for row in self.conn.execute(f"SELECT filename FROM image_stats s WHERE {where}", params)}
+
+    def user_stats(self):
+        """List of (created_by, images, boxes) per annotator."""
+        return self.conn.execute('''SELECT created_by, COUNT(DISTINCT filename), COUNT(*) FROM annotations
+                                    GROUP BY created_by ORDER BY created_by''').fetchall()
+
+    def check(self, image_root=None):
+        """Count integrity problems; returns {problem: count}.
+
+        With `image_root`, also counts annotated files missing from `image_root/<img_label>/`.
+        """
+        problems = {}
+
+        result = [row[0] for row in self.conn.execute("PRAGMA quick_check")]
+        problems["corrupt"] = 0 if result == ["ok"] else len(result)
+
+        def count(sql):
+            return self.conn.execute(sql).fetchone()[0]
+
+        problems["missing_fields"] = count(
+            "SELECT COUNT(*) FROM annotations WHERE filename IS NULL OR filename = '' OR img_label IS NULL")
+        problems["empty_boxes"] = count("SELECT COUNT(*) FROM annotations WHERE width <= 0 OR height <= 0")
+        problems["negative_coords"] = count("SELECT COUNT(*) FROM annotations WHERE x < 0 OR y < 0")
+        # 同じ画像に複数のimg_labelが付いている
+        problems["conflicting_labels"] = count('''SELECT COUNT(*) FROM (SELECT filename FROM annotations
+                                                  GROUP BY filename HAVING COUNT(DISTINCT img_label) > 1)''')
+        problems["duplicate_boxes"] = count('''SELECT COALESCE(SUM(n - 1), 0) FROM (
+                                                 SELECT COUNT(*) AS n FROM annotations
+                                                 GROUP BY filename, x, y, width, height, rect_label HAVING n > 1)''')
+
+        if image_root is not None:
+            cursor = self.conn.execute("SELECT DISTINCT img_label, filename FROM annotations")
+            problems["missing_images"] = sum(
+                1 for label, filename in cursor
+                if not os.path.exists(os.path.join(image_root, label or "", filename or "")))
+
+        return problems
+
+    def drop_indexes(self):
+        for name in INDEXES:
+            self.conn.execute(f"DROP INDEX IF EXISTS {name}")
+        self._commit()
+
+    def create_indexes(self):
+        for sql in INDEXES.values():
+            self.conn.execute(sql)
+        self._commit()
+
+    @contextmanager
+    def _bulk_stats(self, rebuild_stats=True):
+        """Bulk insert without the per-row stats triggers, then recompute the touched images.
+
+        File names inserted into temp.stale_files inside the block are
+        recomputed at the end, or kept there for a later _rebuild_stale_stats()
+        with `rebuild_stats=False`. The triggers are dropped and recreated in
+        the same (write-locked) transaction, so other connections never see
+        the database without them.
+        """
+        with self.transaction():
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS stale_files (filename TEXT PRIMARY KEY)")
+            for name in TRIGGERS:
+                self.conn.execute(f"DROP TRIGGER {name}")
+            yield
+            if rebuild_stats:
+                self._rebuild_stale_stats()
+            for sql in TRIGGERS.values():
+                self.conn.execute(sql)
+
+    def _rebuild_stale_stats(self):
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS stale_files (filename TEXT PRIMARY KEY)")
+        _rebuild_image_stats(self.conn, "IN (SELECT filename FROM temp.stale_files)")
+        self.conn.execute("DELETE FROM temp.stale_files")
+
+    def _insert_rows(self, rows, rebuild_stats=True):
+        now = time.time()
+        # 行ごとのトリガーより、チャンク内の画像をまとめて集計し直すほうが速い
+        with self._bulk_stats(rebuild_stats):
+            self.conn.executemany("INSERT OR IGNORE INTO temp.stale_files VALUES (?)", ((row[0],) for row in rows))
+            self.conn.executemany(
+                '''INSERT INTO annotations (filename, x, y, width, height, rect_label, img_label,
+                                            created_by, created_at, updated_by, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (row + (self.user, now, self.user, now) for row in rows))
+        return len(rows)
+
+    def _user_version(self):
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _commit(self):
+        # transaction()の中ではまとめてコミットする
+        if self._transaction_depth == 0:
+            with profiler.timer("db.commit"):
+                self.conn.commit()
 
     def _get_label_and_filename(self, img_path):
         filename = os.path.basename(img_path)
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+
+from src.db import AnnotationDB
+from src.perf import profiler
+
+FLUSH_INTERVAL = 0.5  # sec
+MAX_BATCH = 256
+LOCK_RETRIES = 5
+RETRY_BACKOFF = 0.1  # sec, 再試行ごとに倍
+# 時間をおけば書ける失敗（ロック・I/O）。それ以外の失敗はやり直しても同じ
+TRANSIENT_ERRORS = ("locked", "busy", "disk I/O error", "unable to open", "disk is full")
+
+
+def _is_transient(error):
+    if isinstance(error, OSError):
+        return True
+    return isinstance(error, sqlite3.OperationalError) and any(word in str(error) for word in TRANSIENT_ERRORS)
+
+
+class AnnotationWriter:
+    """Write-behind queue in front of AnnotationDB.
+
+    Writes are applied by a dedicated thread with its own connection, batched
+    into one transaction per `max_batch` operations or `flush_interval`
+    seconds. Reads go through `db`; pending writes for the same file are
+    flushed first so they are always visible.
+
+    The writer thread also opens (and migrates) the database, so creating
+    the writer does not block; `db`, the caller's read connection, is opened
+    on first use once that is done. A batch that still finds the database
+    locked by another process after the busy timeout is retried with backoff.
+
+    save_annotation returns a temporary (negative) id right away; later
+    deletes/edits with that id are resolved to the real row id by the writer
+    thread, which applies operations in order. The mapping of a file is
+    dropped when its boxes are reloaded (they come back with real ids) or
+    release_temp_ids is called.
+
+    A batch that fails with a lock or I/O error is not dropped: it stays
+    queued in front of the next batch and is retried then, `error` describes
+    the failure, and flush()/close() return False until everything has been
+    written. Any other error is not retried: the batch is replayed one
+    operation at a time, and the operations that still fail are logged,
+    discarded and reported through `error`, so they do not block later saves.
+    """
+
+    def __init__(self, db_path, user=None, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.db_path = db_path
+        self.user = user
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._queue = queue.Queue()
+        self._pending = Counter()  # filename: 未反映の操作数
+        self._lock = threading.Lock()
+
+        self._temp_ids = itertools.count(-1, -1)
+        self._real_ids = {}  # temp id: row id（書き込みスレッドのみで使用）
+        self._file_temp_ids = defaultdict(set)  # filename: {temp id}（同上）
+
+        self._failed = []  # ロック等で書き込めず、次のバッチの前でやり直す操作
+        self.error = None  # 最後の失敗（書き込めたらNone）
+        self._error_taken = False
+
+        self._db = None
+        self._ready = threading.Event()
+        self.ready_time = None  # DBを開き終えた時刻（perf_counter）
+        self.lock_retries = 0
+
+        self._thread = threading.Thread(target=self._run, args=(db_path,), name="db-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def db(self):
+        if self._db is None:
+            # 移行が終わるまで待ってから、呼び出し元スレッド用の接続を開く
+            self.wait_ready()
+            self._db = AnnotationDB(self.db_path, self.user)
+        return self._db
+
+    def wait_ready(self, timeout=None):
+        """Wait until the writer thread has opened the database; returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def save_annotation(self, img_path, rect, rect_label, label=None):
+        temp_id = next(self._temp_ids)
+        self._put(img_path, "save_annotation", img_path, rect, rect_label, label, temp_id)
+        return temp_id
+
+    def delete_annotation(self, img_path, ann_id):
+        self._put(img_path, "delete_annotation", ann_id)
+
+    def update_annotation(self, img_path, ann_id, rect=None, rect_label=None):
+        self._put(img_path, "update_annotation", ann_id, rect, rect_label)
+
+    def update_label(self, img_path):
+        self._put(img_path, "update_label", img_path)
+
+    def delete_all_annotations(self, img_path):
+        self._put(img_path, "delete_all_annotations", img_path)
+
+    def release_temp_ids(self, img_path):
+        """Forget the temporary ids issued for `img_path`; the caller must not use them afterwards."""
+        # 書き込みと同じ順序で処理するが、未反映の操作には数えない
+        self._queue.put(("write", os.path.basename(img_path), "release_temp_ids", ()))
+
+    def load_annotations(self, img_path):
+        """Boxes of `img_path` with their real ids; temporary ids issued for it are released."""
+        if self.has_pending(img_path):
+            self.flush()
+        rows = self.db.load_annotations(img_path)
+        self.release_temp_ids(img_path)
+        return rows
+
+    def has_pending(self, img_path=None):
+        with self._lock:
+            if img_path is None:
+                return bool(self._pending)
+            return self._pending[os.path.basename(img_path)] > 0
+
+    def flush(self, wait=True):
+        """Write out everything queued so far; with wait=False only request it.
+
+        With wait=True, returns False if some operations could not be written
+        (see `error`); they stay queued.
+        """
+        if not self._thread.is_alive():
+            return not self.has_pending()
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        if wait:
+            done.wait()
+            with self._lock:
+                return not self._failed
+
+    def take_error(self):
+        """`error` the first time it is asked for after a failure, else None."""
+        with self._lock:
+            if self.error is None or self._error_taken:
+                return None
+            self._error_taken = True
+            return self.error
+
+    def close(self):
+        """Write out the queue and stop; returns False if some operations could not be written."""
+        if self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put(("stop", done))
+            done.wait()
+            self._thread.join()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        return not self.has_pending()
+
+    def _put(self, img_path, method, *args):
+        filename = os.path.basename(img_path)
+        with self._lock:
+            self._pending[filename] += 1
+        self._queue.put(("write", filename, method, args))
+
+    def _run(self, db_path):
+        try:
+            with profiler.timer("db_writer.open"):
+                db = AnnotationDB(db_path, self.user)
+        except Exception as e:
+            print(f"[ERROR] Failed to open database: {db_path} → {e}")
+            self._set_error(f"Cannot open {db_path}: {e}")
+            return
+        finally:
+            self.ready_time = time.perf_counter()
+            self._ready.set()
+
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item[0] == "write":
+                batch.append(item[1:])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.max_batch:
+                    continue
+
+            self._write(db, batch)
+            batch = []
+            deadline = None
+
+            if item is not None and item[0] in ("flush", "stop"):
+                item[1].set()
+                if item[0] == "stop":
+                    db.close()
+                    return
+
+    def _write(self, db, batch):
+        # 前回書き込めなかった操作を先に（順序を保つ）
+        with self._lock:
+            batch = self._failed + batch
+        if not batch:
+            return
+
+        profiler.count("db_writer.operations", len(batch))
+        written, dropped, failed = batch, [], []
+        error = self._commit(db, batch)
+        if error is not None:
+            if _is_transient(error):
+                written, failed = [], batch
+            else:
+                # 1件ずつ書き直し、書けない操作だけを捨てる
+                written, dropped, failed, error = self._write_each(db, batch)
+
+        if failed:
+            # 捨てずに残し、次のバッチ・flush・closeでやり直す（未反映の数もそのまま）
+            print(f"[ERROR] Failed to write {len(failed)} annotation operations, keeping them queued → {error}")
+            self._set_error(f"{len(failed)} annotation changes could not be saved and are kept to retry: {error}")
+        if dropped:
+            self._set_error(f"{len(dropped)} annotation changes could not be saved and were discarded: {dropped[-1][1]}",
+                            again=True)
+
+        with self._lock:
+            self._failed = failed
+            # 知らせ終えた失敗は、書き込めた時点で消す
+            if not failed and not dropped and self._error_taken:
+                self.error = None
+            for filename, method, _ in written + [op for op, _ in dropped]:
+                if method == "release_temp_ids":
+                    continue
+                self._pending[filename] -= 1
+                if self._pending[filename] <= 0:
+                    del self._pending[filename]
+
+    def _write_each(self, db, batch):
+        """Commit `batch` one operation at a time; returns (written, [(dropped, error)], failed, error).
+
+        Stops at the first lock or I/O error: that operation and the rest are `failed`.
+        """
+        written, dropped = [], []
+        for i, op in enumerate(batch):
+            error = self._commit(db, [op])
+            if error is None:
+                written.append(op)
+            elif _is_transient(error):
+                return written, dropped, batch[i:], error
+            else:
+                filename, method, args = op
+                print(f"[ERROR] Discarding {method} for {filename} → {error!r}")
+                dropped.append((op, error))
+        return written, dropped, [], None
+
+    def _commit(self, db, batch):
+        """Apply `batch` in one transaction, retrying while locked; returns the error, or None."""
+        for attempt in range(LOCK_RETRIES):
+            # ロールバックしたら、仮idの対応も元に戻す
+            real_ids = dict(self._real_ids)
+            file_temp_ids = {filename: set(ids) for filename, ids in self._file_temp_ids.items()}
+            try:
+                with profiler.timer("db_writer.batch"), db.transaction():
+                    self._apply(db, batch)
+                return None
+            except Exception as e:
+                self._real_ids = real_ids
+                self._file_temp_ids = defaultdict(set, file_temp_ids)
+                # ロールバック済みなので、バッチ全体をやり直せる
+                if isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e)) \
+                        and attempt < LOCK_RETRIES - 1:
+                    self.lock_retries += 1
+                    profiler.count("db_writer.lock_retries")
+                    time.sleep(RETRY_BACKOFF * 2 ** attempt)
+                    continue
+                return e
+
+    def _set_error(self, message, again=False):
+        with self._lock:
+            # やり直しても失敗が続く間は一度だけ知らせる（捨てた変更は毎回知らせる）
+            if self.error is None or again:
+                self._error_taken = False
+            self.error = message
+
+    def _apply(self, db, batch):
+        for filename, method, args in batch:
+            if method == "save_annotation":
+                *args, temp_id = args
+                self._real_ids[temp_id] = db.save_annotation(*args)
+                self._file_temp_ids[filename].add(temp_id)
+            elif method == "release_temp_ids":
+                for temp_id in self._file_temp_ids.pop(filename, ()):
+                    self._real_ids.pop(temp_id, None)
+            elif method in ("delete_annotation", "update_annotation"):
+                ann_id, *args = args
+                ann_id = self._real_ids.get(ann_id, ann_id)
+                getattr(db, method)(ann_id, *args)
+            else:
+                getattr(db, method)(*args)
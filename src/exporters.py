@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import json
+import shutil
+import tempfile
+import itertools
+from xml.etree import ElementTree
+
+from src.db import CSV_COLUMNS
+from src.imagesize import get_image_size
+from src.pool import process_pool
+
+PROBE_CHUNK_SIZE = 256
+PARQUET_ROW_GROUP = 100000
+
+
+def probe_image_sizes(db, image_root, workers=None, progress=None):
+    """{filename: (width, height) or None} for every annotated image.
+
+    Sizes are read from file headers only and cached in the image_sizes table;
+    a cached size is reused while the file's mtime is unchanged. Uncached
+    headers are read on a process pool. `progress(done, total)` is called per chunk.
+    """
+    cached = db.load_image_sizes()
+    sizes = {}
+    todo = []  # (filename, path, mtime)
+    for filename, img_label in db.iter_images():
+        if filename in sizes:
+            continue
+        path = os.path.join(image_root, img_label or "", filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            sizes[filename] = None
+            continue
+
+        entry = cached.get(filename)
+        if entry is not None and entry[0] == mtime:
+            sizes[filename] = entry[1:]
+        else:
+            sizes[filename] = None
+            todo.append((filename, path, mtime))
+
+    if not todo:
+        return sizes
+
+    paths = [path for _, path, _ in todo]
+    rows = []
+    if workers == 0 or len(todo) <= PROBE_CHUNK_SIZE:
+        results = map(get_image_size, paths)
+        executor = None
+    else:
+        executor = process_pool(workers)
+        results = executor.map(get_image_size, paths, chunksize=PROBE_CHUNK_SIZE)
+
+    try:
+        for done, ((filename, _, mtime), size) in enumerate(zip(todo, results), 1):
+            if size is not None:
+                sizes[filename] = tuple(size)
+                rows.append((filename, mtime, size[0], size[1]))
+            if progress and done % PROBE_CHUNK_SIZE == 0:
+                progress(done, len(todo))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    db.save_image_sizes(rows)
+    return sizes
+
+
+class Exporter:
+    """One output format. Receives the annotated images one at a time, in filename order.
+
+    `suffix` is the output file extension, or "" when the output is a folder.
+    Image sizes are probed for formats with `uses_sizes` when an image root is
+    given; formats with `needs_sizes` require it and skip images whose size
+    is unknown. Formats with `needs_labels` write a class per box and drop
+    boxes without a rect_label.
+    """
+
+    name = ""
+    suffix = ""
+    needs_sizes = True
+    uses_sizes = True
+    needs_labels = True
+
+    def __init__(self, out_path, categories):
+        self.out_path = out_path
+        self.categories = [label for label in categories if label]  # rect_label（indexがクラスID）
+        self.category_ids = {label: i for i, label in enumerate(self.categories)}
+
+    def category_id(self, label):
+        # エクスポート中に他の書き込みで増えたラベルは末尾に追加
+        category_id = self.category_ids.get(label)
+        if category_id is None:
+            category_id = self.category_ids[label] = len(self.categories)
+            self.categories.append(label)
+        return category_id
+
+    def write_image(self, filename, img_label, size, boxes):
+        """`size` is (width, height) or None; `boxes` is a list of (x, y, width, height, rect_label)."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvExporter(Exporter):
+    name = "csv"
+    suffix = ".csv"
+    needs_sizes = False
+    uses_sizes = False
+    needs_labels = False
+
+    def __init__(self, out_path, categories):
+        super().__init__(out_path, categories)
+        self.file = open(out_path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write_image(self, filename, img_label, size, boxes):
+        self.writer.writerows([filename, img_label, x, y, w, h, rect_label] for x, y, w, h, rect_label in boxes)
+
+    def close(self):
+        self.file.close()
+
+
+class CocoExporter(Exporter):
+    """COCO instances JSON. `images` are streamed to the output and `annotations`
+    to a temporary file that is appended at the end."""
+
+    name = "coco"
+    suffix = ".json"
+
+    def __init__(self, out_path, categories):
+        super().__init__(out_path, categories)
+        self.file = open(out_path, "w", encoding="utf-8")
+        self.annotations = tempfile.TemporaryFile("w+", encoding="utf-8", dir=os.path.dirname(os.path.abspath(out_path)))
+        self.image_id = 0
+        self.annotation_id = 0
+        self.file.write('{"images": [')
+
+    def write_image(self, filename, img_label, size, boxes):
+        self.image_id += 1
+        if self.image_id > 1:
+            self.file.write(",")
+        self.file.write(json.dumps({"id": self.image_id, "file_name": f"{img_label}/{filename}",
+                                    "width": size[0], "height": size[1]}))
+
+        for x, y, w, h, rect_label in boxes:
+            self.annotation_id += 1
+            if self.annotation_id > 1:
+                self.annotations.write(",")
+            self.annotations.write(json.dumps({
+                "id": self.annotation_id, "image_id": self.image_id,
+                "category_id": self.category_id(rect_label) + 1,
+                "bbox": [x, y, w, h], "area": w * h, "iscrowd": 0}))
+
+    def close(self):
+        self.file.write('], "annotations": [')
+        self.annotations.seek(0)
+        shutil.copyfileobj(self.annotations, self.file)
+        self.annotations.close()
+
+        categories = [{"id": i + 1, "name": label} for i, label in enumerate(self.categories)]
+        self.file.write('], "categories": ' + json.dumps(categories) + "}")
+        self.file.close()
+
+
+class YoloExporter(Exporter):
+    """YOLO txt: `labels/<stem>.txt` per image with normalized "class cx cy w h" lines,
+    plus `classes.txt` and `images.txt` (image paths relative to the root folder)."""
+
+    name = "yolo"
+
+    def __init__(self, out_path, categories):
+        super().__init__(out_path, categories)
+        self.labels_dir = os.path.join(out_path, "labels")
+        os.makedirs(self.labels_dir, exist_ok=True)
+        self.images = open(os.path.join(out_path, "images.txt"), "w", encoding="utf-8")
+
+    def write_image(self, filename, img_label, size, boxes):
+        width, height = size
+        lines = [f"{self.category_id(rect_label)} {(x + w / 2) / width:.6f} {(y + h / 2) / height:.6f} "
+                 f"{w / width:.6f} {h / height:.6f}\n" for x, y, w, h, rect_label in boxes]
+
+        stem = os.path.splitext(filename)[0]
+        with open(os.path.join(self.labels_dir, stem + ".txt"), "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        self.images.write(f"{img_label}/{filename}\n")
+
+    def close(self):
+        self.images.close()
+        with open(os.path.join(self.out_path, "classes.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{label}\n" for label in self.categories)
+
+
+class VocExporter(Exporter):
+    """Pascal VOC: `Annotations/<stem>.xml` per image."""
+
+    name = "voc"
+
+    def __init__(self, out_path, categories):
+        super().__init__(out_path, categories)
+        self.annotations_dir = os.path.join(out_path, "Annotations")
+        os.makedirs(self.annotations_dir, exist_ok=True)
+
+    def write_image(self, filename, img_label, size, boxes):
+        root = ElementTree.Element("annotation")
+        ElementTree.SubElement(root, "folder").text = img_label
+        ElementTree.SubElement(root, "filename").text = filename
+        size_element = ElementTree.SubElement(root, "size")
+        ElementTree.SubElement(size_element, "width").text = str(size[0])
+        ElementTree.SubElement(size_element, "height").text = str(size[1])
+        ElementTree.SubElement(size_element, "depth").text = "3"
+
+        for x, y, w, h, rect_label in boxes:
+            obj = ElementTree.SubElement(root, "object")
+            ElementTree.SubElement(obj, "name").text = rect_label
+            ElementTree.SubElement(obj, "difficult").text = "0"
+            bndbox = ElementTree.SubElement(obj, "bndbox")
+            for tag, value in (("xmin", x), ("ymin", y), ("xmax", x + w), ("ymax", y + h)):
+                ElementTree.SubElement(bndbox, tag).text = str(round(value))
+
+        stem = os.path.splitext(filename)[0]
+        ElementTree.ElementTree(root).write(os.path.join(self.annotations_dir, stem + ".xml"), encoding="utf-8")
+
+
+class NpyExporter(Exporter):
+    """Columnar NumPy arrays that can be opened with np.load(..., mmap_mode="r").
+
+    boxes.npy (N, 4) float32 x/y/width/height in pixels, image_ids.npy and
+    category_ids.npy (N,) int32, image_sizes.npy (M, 2) int32 (-1 if unknown),
+    and images.json / categories.json for the names. The columns are
+    streamed to raw files and get their .npy header on close, so N is the
+    number of boxes actually exported even if the table changed meanwhile.
+    """
+
+    name = "npy"
+    needs_sizes = False
+    COLUMNS = (("boxes", "float32", (4,)), ("image_ids", "int32", ()), ("category_ids", "int32", ()))
+
+    def __init__(self, out_path, categories):
+        import numpy as np
+
+        super().__init__(out_path, categories)
+        self.np = np
+        os.makedirs(out_path, exist_ok=True)
+        self.columns = {name: tempfile.TemporaryFile(dir=out_path) for name, _, _ in self.COLUMNS}
+        self.rows = 0
+        self.image_names = []
+        self.image_sizes = []
+
+    def write_image(self, filename, img_label, size, boxes):
+        np = self.np
+        image_id = len(self.image_names)
+        self.image_names.append(f"{img_label}/{filename}")
+        self.image_sizes.append(size or (-1, -1))
+
+        self.columns["boxes"].write(np.array([box[:4] for box in boxes], dtype=np.float32).tobytes())
+        self.columns["image_ids"].write(np.full(len(boxes), image_id, dtype=np.int32).tobytes())
+        self.columns["category_ids"].write(
+            np.array([self.category_id(box[4]) for box in boxes], dtype=np.int32).tobytes())
+        self.rows += len(boxes)
+
+    def close(self):
+        np = self.np
+        for name, dtype, shape in self.COLUMNS:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                      "shape": (self.rows,) + shape}
+            raw = self.columns[name]
+            raw.seek(0)
+            with open(os.path.join(self.out_path, f"{name}.npy"), "wb") as f:
+                np.lib.format.write_array_header_1_0(f, header)
+                shutil.copyfileobj(raw, f)
+            raw.close()
+
+        np.save(os.path.join(self.out_path, "image_sizes.npy"), np.array(self.image_sizes, dtype=np.int32).reshape(-1, 2))
+        with open(os.path.join(self.out_path, "images.json"), "w", encoding="utf-8") as f:
+            json.dump(self.image_names, f)
+        with open(os.path.join(self.out_path, "categories.json"), "w", encoding="utf-8") as f:
+            json.dump(self.categories, f)
+
+
+class ParquetExporter(Exporter):
+    """One row per box, written in row groups of PARQUET_ROW_GROUP rows (needs pyarrow)."""
+
+    name = "parquet"
+    suffix = ".parquet"
+    needs_sizes = False
+    needs_labels = False
+
+    def __init__(self, out_path, categories):
+        super().__init__(out_path, categories)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            ("filename", pyarrow.string()), ("img_label", pyarrow.string()), ("rect_label", pyarrow.string()),
+            ("x", pyarrow.float32()), ("y", pyarrow.float32()),
+            ("width", pyarrow.float32()), ("height", pyarrow.float32()),
+            ("image_width", pyarrow.int32()), ("image_height", pyarrow.int32()),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(out_path, self.schema)
+        self.columns = {name: [] for name in self.schema.names}
+
+    def write_image(self, filename, img_label, size, boxes):
+        width, height = size or (None, None)
+        for x, y, w, h, rect_label in boxes:
+            for name, value in zip(self.schema.names, (filename, img_label, rect_label, x, y, w, h, width, height)):
+                self.columns[name].append(value)
+
+        if len(self.columns["filename"]) >= PARQUET_ROW_GROUP:
+            self._write_group()
+
+    def _write_group(self):
+        if self.columns["filename"]:
+            self.writer.write_table(self.pa.table(self.columns, schema=self.schema))
+            self.columns = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self._write_group()
+        self.writer.close()
+
+
+EXPORTERS = {exporter.name: exporter for exporter in
+             (CsvExporter, CocoExporter, YoloExporter, VocExporter, NpyExporter, ParquetExporter)}
+
+
+def export_annotations(db, out_path, fmt, image_root=None, workers=None, progress=None):
+    """Stream every annotation of `db` into `out_path` in format `fmt` (a key of EXPORTERS).
+
+    `image_root` is the folder with `<img_label>/<filename>` images, used for
+    image sizes by the formats that write them (it is not read for csv).
+    `progress(images)` is called every 1000 images.
+    Returns (images, boxes, skipped images, unlabeled boxes); unlabeled boxes
+    are only dropped by formats that need a class per box.
+    """
+    exporter_class = EXPORTERS[fmt]
+    if exporter_class.needs_sizes and image_root is None:
+        raise ValueError(f"{fmt} export needs the image folder for image sizes")
+    if exporter_class.uses_sizes and image_root is not None:
+        sizes = probe_image_sizes(db, image_root, workers)
+    else:
+        sizes = {}
+
+    exporter = exporter_class(out_path, db.rect_labels())
+    images = boxes = skipped = unlabeled = 0
+    try:
+        for filename, rows in itertools.groupby(db.iter_annotations(), key=lambda row: row[0]):
+            rows = list(rows)
+            size = sizes.get(filename)
+            if size is None and exporter.needs_sizes:
+                skipped += 1
+                continue
+
+            image_boxes = [row[2:] for row in rows]
+            if exporter.needs_labels:
+                # ラベルのない矩形はクラスにできないので書き出さない
+                image_boxes = [box for box in image_boxes if box[4]]
+                unlabeled += len(rows) - len(image_boxes)
+            exporter.write_image(filename, rows[0][1], size, image_boxes)
+            images += 1
+            boxes += len(image_boxes)
+            if progress and images % 1000 == 0:
+                progress(images)
+    finally:
+        exporter.close()
+
+    return images, boxes, skipped, unlabeled
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from src.imagesize import get_image_size
+from src.perf import timed
+
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+DEFAULT_PREFETCH_COUNT = 2
+
+# cv2.imreadで縮小デコードできる倍率（起動を速くするためcv2は最初のデコードまで読み込まない）
+_REDUCED_FLAGS = {
+    2: "IMREAD_REDUCED_COLOR_2",
+    4: "IMREAD_REDUCED_COLOR_4",
+    8: "IMREAD_REDUCED_COLOR_8",
+}
+
+
+def preload():
+    """Import OpenCV on a background thread so the first decode does not pay for it."""
+    thread = threading.Thread(target=lambda: __import__("cv2"), name="preload-cv2", daemon=True)
+    thread.start()
+    return thread
+
+
+class DecodeStats:
+    """Transient bytes held while decoding, per image and the peak so far.
+
+    A decode holds the (reduced) decoded buffer and, when it is resized, the
+    resized copy at the same time; their sum is recorded.
+    """
+
+    def __init__(self):
+        self.last_path = None
+        self.last_bytes = 0
+        self.peak_bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, path, nbytes):
+        with self._lock:
+            self.last_path = path
+            self.last_bytes = nbytes
+            self.peak_bytes = max(self.peak_bytes, nbytes)
+
+    def summary(self):
+        return (f"[decode] last={self.last_bytes / 2 ** 20:.1f}MiB ({self.last_path}) "
+                f"peak={self.peak_bytes / 2 ** 20:.1f}MiB")
+
+
+decode_stats = DecodeStats()
+
+
+@timed("decode.load_reduced")
+def load_reduced(path, factor):
+    """Decode `path` reduced by `factor` (a power of 2) as a BGR array."""
+    import cv2
+
+    if factor == 1:
+        image = cv2.imread(path)
+    else:
+        image = cv2.imread(path, getattr(cv2, _REDUCED_FLAGS[min(factor, 8)]))
+        if image is not None and factor > 8:
+            h, w = image.shape[:2]
+            size = (max(1, round(w * 8 / factor)), max(1, round(h * 8 / factor)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def fit_size(width, height, max_size):
+    """(width, height) scaled down to fit in `max_size` keeping the aspect ratio (never enlarged)."""
+    ratio = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def resize_image(image, size):
+    """`image` resized to `size` (width, height); INTER_AREA when shrinking, INTER_LINEAR when enlarging."""
+    import cv2
+
+    h, w = image.shape[:2]
+    if (w, h) == tuple(size):
+        return image
+    interpolation = cv2.INTER_AREA if size[0] < w else cv2.INTER_LINEAR
+    return cv2.resize(image, tuple(size), interpolation=interpolation)
+
+
+@timed("decode.load_image")
+def load_image(path, max_size=None):
+    """Decode `path` as a BGR array, shrunk to fit `max_size` (width, height) if given.
+
+    The JPEG decoder is asked for the largest 1/2, 1/4 or 1/8 reduction that
+    still covers `max_size`, so a large photo is never decoded at full
+    resolution; the remainder is done with cv2.resize(INTER_AREA).
+    """
+    size = get_image_size(path) if max_size is not None else None
+    if size is None:
+        import cv2
+
+        image = cv2.imread(path)
+        if image is not None:
+            decode_stats.record(path, image.nbytes)
+        return image
+
+    target = fit_size(size[0], size[1], max_size)
+    factor = 1
+    while factor < 8 and size[0] // (factor * 2) >= target[0] and size[1] // (factor * 2) >= target[1]:
+        factor *= 2
+
+    image = load_reduced(path, factor)
+    if image is None:
+        return None
+
+    decoded_bytes = image.nbytes
+    if (image.shape[1], image.shape[0]) != target:
+        image = resize_image(image, target)
+        decoded_bytes += image.nbytes
+    decode_stats.record(path, decoded_bytes)
+    return image
+
+
+class ImageCache:
+    """Thread-safe LRU cache of decoded images, bounded by total bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._items = OrderedDict()  # path: image
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            image = self._items.get(path)
+            if image is None:
+                self.misses += 1
+                return None
+
+            self._items.move_to_end(path)
+            self.hits += 1
+            return image
+
+    def peek(self, path):
+        """The cached image (or None) without counting a hit or refreshing its LRU position."""
+        with self._lock:
+            return self._items.get(path)
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._items
+
+    def put(self, path, image):
+        size = image.nbytes
+        # キャッシュより大きい画像は保持しない
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+
+            self._items[path] = image
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def discard(self, path):
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+
+class ImagePrefetcher:
+    """Decodes neighbouring images on worker threads into an ImageCache.
+
+    Images are decoded to fit `max_size` (the display size), see load_image.
+    Cached images decoded for a smaller display are kept and only decoded
+    again when they are needed (get, prefetch or decode_async).
+    """
+
+    def __init__(self, cache, workers=2, loader=load_image):
+        self.cache = cache
+        self.loader = loader
+        self.max_size = None
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._pending = {}  # path: future
+        self._lock = threading.RLock()
+
+    def get(self, path):
+        image = self.cache.get(path)
+        if image is not None and self._fits(path, image):
+            return image
+
+        # 先読み中ならその結果を待つ
+        with self._lock:
+            future = self._pending.get(path)
+        if future is not None:
+            try:
+                image = future.result()
+            except CancelledError:
+                image = None
+            if image is not None and self._fits(path, image):
+                return image
+        else:
+            # 最初に見た後で先読みが終わっていれば、キャッシュに入っている
+            image = self.cache.peek(path)
+            if image is not None and self._fits(path, image):
+                return image
+
+        image = self.loader(path, self.max_size)
+        if image is not None:
+            self.cache.put(path, image)
+        return image
+
+    def prefetch(self, paths):
+        """Schedule `paths` (nearest first) and cancel every other pending decode."""
+        wanted = list(dict.fromkeys(paths))
+
+        with self._lock:
+            for path, future in list(self._pending.items()):
+                if path not in wanted:
+                    del self._pending[path]
+                    future.cancel()
+
+            for path in wanted:
+                if path in self._pending:
+                    continue
+                image = self.cache.peek(path)
+                if image is not None and self._fits(path, image):
+                    continue
+                self._submit(path)
+
+    def decode_async(self, path):
+        """Decode `path` for the current max_size on a worker thread and return the Future.
+
+        Like a prefetch, it is cancelled by a later prefetch() that does not list `path`.
+        """
+        with self._lock:
+            old = self._pending.pop(path, None)
+            if old is not None:
+                old.cancel()
+            return self._submit(path)
+
+    def neighbors(self, images, index, count=DEFAULT_PREFETCH_COUNT):
+        paths = []
+        for offset in range(1, count + 1):
+            for i in (index + offset, index - offset):
+                if 0 <= i < len(images):
+                    paths.append(images[i])
+        return paths
+
+    def shutdown(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            for future in pending:
+                future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _submit(self, path):
+        # self._lockを持った状態で呼ぶ（_decodeは登録が終わるまで待つ）
+        future = self._executor.submit(self._decode, path)
+        future.add_done_callback(lambda f: self._finished(path, f))
+        self._pending[path] = future
+        return future
+
+    def _decode(self, path):
+        # 別の場所へジャンプ済みなら読み込まない
+        with self._lock:
+            if path not in self._pending:
+                return None
+
+        image = self.loader(path, self.max_size)
+        if image is not None:
+            self.cache.put(path, image)
+        return image
+
+    def set_max_size(self, max_size):
+        # キャッシュは消さない（小さすぎるものは_fitsで弾いて読み直す）
+        self.max_size = max_size
+
+    def _fits(self, path, image):
+        # 今の表示サイズより小さく縮小されたものは使わない（ヘッダーから求めた表示サイズと比較）
+        if self.max_size is None:
+            return True
+        size = get_image_size(path)
+        if size is None:
+            return True
+        target = fit_size(size[0], size[1], self.max_size)
+        return image.shape[1] >= target[0] and image.shape[0] >= target[1]
+
+    def _finished(self, path, future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
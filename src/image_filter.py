@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import re
+import shlex
+import operator
+
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+_COUNT_TERM = re.compile(r"^boxes(<=|>=|!=|=|<|>)(\d+)$")
+
+FILTER_HELP = "boxes=0  boxes>50  label:cat  -label:cat  mismatch"
+
+
+class ImageFilter:
+    """Images matching every term of a filter expression, looked up in the per-image aggregates.
+
+    Terms (all must match; `-` in front negates one):
+      boxes<op>N   number of boxes, <op> one of = != < <= > >=
+      label:X      has a box labelled X (quote labels with spaces: label:"a b")
+      mismatch     has a box whose label differs from the image label
+
+    The terms become one SQL condition over image_stats, answered from its
+    indexes. Images without annotations have no row there, so whether they
+    match is decided here (0 boxes, no labels); when they do, the
+    complement is queried instead, and the result is a predicate over file
+    names either way.
+    """
+
+    def __init__(self, text):
+        self.text = text.strip()
+        self.terms = [self._parse(token) for token in shlex.split(self.text)]
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def where(self):
+        """(SQL condition over image_stats `s`, params)."""
+        sql = " AND ".join(f"NOT ({term[1]})" if term[0] else term[1] for term in self.terms) or "1"
+        params = [param for term in self.terms for param in term[2]]
+        return sql, params
+
+    def matches_unannotated(self):
+        return all(term[3] != term[0] for term in self.terms)
+
+    def predicate(self, db):
+        """Callable telling whether a file name matches, or None for an empty filter."""
+        if not self.terms:
+            return None
+
+        if self.matches_unannotated():
+            excluded = db.find_filenames(self, invert=True)
+            return lambda name: name not in excluded
+        return db.find_filenames(self).__contains__
+
+    @staticmethod
+    def _parse(token):
+        # (否定, SQL, パラメータ, 注釈のない画像で成り立つか)
+        negate = token.startswith("-")
+        if negate:
+            token = token[1:]
+
+        match = _COUNT_TERM.match(token)
+        if match:
+            op, count = match.group(1), int(match.group(2))
+            return negate, f"s.boxes {op} ?", (count,), OPERATORS[op](0, count)
+        if token.startswith("label:") and len(token) > len("label:"):
+            return (negate, "s.filename IN (SELECT filename FROM image_box_labels WHERE rect_label = ?)",
+                    (token[len("label:"):],), False)
+        if token == "mismatch":
+            return negate, "s.mismatched > 0", (), False
+        raise ValueError(f"Unknown filter term: {token} (examples: {FILTER_HELP})")
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import struct
+
+
+def get_image_size(path):
+    """Return (width, height) read from the file header, or None if unknown.
+
+    The size matches what cv2.imread returns, i.e. JPEG EXIF rotation is applied.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head.startswith(b"\x89PNG\r\n\x1a\n"):
+                return struct.unpack(">II", head[16:24])
+            if head.startswith(b"BM"):
+                width, height = struct.unpack("<ii", head[18:26])
+                return width, abs(height)
+            if head.startswith(b"\xff\xd8"):
+                f.seek(2)
+                return _get_jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+
+    return None
+
+
+def _get_jpeg_size(f):
+    orientation = 1
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        code = marker[1]
+        # パディング・データを持たないマーカー
+        if code == 0xFF:
+            f.seek(-1, 1)
+            continue
+        if code in (0x01, 0xD8) or 0xD0 <= code <= 0xD7:
+            continue
+
+        length = struct.unpack(">H", f.read(2))[0]
+
+        if code == 0xE1:
+            orientation = _get_exif_orientation(f.read(length - 2)) or orientation
+            continue
+
+        # SOFn (DHT, JPG, DACは除く)
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            if orientation >= 5:
+                return height, width
+            return width, height
+
+        f.seek(length - 2, 1)
+
+
+def _get_exif_orientation(data):
+    if not data.startswith(b"Exif\x00\x00"):
+        return None
+
+    tiff = data[6:]
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None:
+        return None
+
+    offset = struct.unpack(endian + "I", tiff[4:8])[0]
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    for i in range(count):
+        entry = tiff[offset + 2 + i * 12: offset + 14 + i * 12]
+        if len(entry) < 12:
+            break
+        tag, _, _, value = struct.unpack(endian + "HHIH2x", entry)
+        if tag == 0x0112:
+            return value
+
+    return None
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import bisect
+import itertools
+
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt
+
+FETCH_BATCH = 1000
+
+
+class LabelTreeModel(QAbstractItemModel):
+    """Label > Image tree over an ImageDataset.
+
+    Image rows are fetched lazily in FETCH_BATCH chunks when a label is
+    expanded or scrolled, and edits are applied as targeted row
+    inserts/removes instead of rebuilding the tree. Changes to the dataset
+    made while the model is in use go through the update methods below.
+    """
+
+    def __init__(self, dataset, parent=None):
+        super().__init__(parent)
+        self.dataset = dataset
+
+        self._fetched = {}  # label: 表示済みの行数
+        # 子のindexは親ラベルをinternalIdで持つ（0はトップレベル）
+        self._ids = itertools.count(1)
+        self._label_ids = {}
+        self._id_labels = {}
+
+    # 構造
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, 0)
+        return self.createIndex(row, column, self._label_id(self.dataset.labels[parent.row()]))
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.label_index(self._id_labels[index.internalId()])
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.dataset.labels)
+        if parent.internalId() == 0:
+            return self._fetched.get(self.dataset.labels[parent.row()], 0)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.dataset.labels)
+        if parent.internalId() == 0:
+            return self.dataset.count(self.dataset.labels[parent.row()]) > 0
+        return False
+
+    def canFetchMore(self, parent):
+        if not parent.isValid() or parent.internalId() != 0:
+            return False
+        label = self.dataset.labels[parent.row()]
+        return self._fetched.get(label, 0) < self.dataset.count(label)
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+
+        label = self.dataset.labels[parent.row()]
+        start = self._fetched.get(label, 0)
+        end = min(self.dataset.count(label), start + FETCH_BATCH)
+
+        self.beginInsertRows(parent, start, end - 1)
+        self._fetched[label] = end
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        if index.internalId() == 0:
+            return self.dataset.labels[index.row()]
+        return self.dataset.name_at(self._id_labels[index.internalId()], index.row())
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return "Label > Image"
+        return None
+
+    # 参照
+    def label_at(self, index):
+        if index.internalId() == 0:
+            return self.dataset.labels[index.row()]
+        return self._id_labels[index.internalId()]
+
+    def path_at(self, index):
+        """Image path of a child index, or None for a label row."""
+        if index.internalId() == 0:
+            return None
+        return self.dataset.path_at(self._id_labels[index.internalId()], index.row())
+
+    def label_index(self, label):
+        return self.createIndex(self.dataset.label_row(label), 0, 0)
+
+    # 更新
+    def reset(self, root=None):
+        self.beginResetModel()
+        if root is not None:
+            self.dataset.reset(root)
+        self._fetched.clear()
+        self.endResetModel()
+
+    def insert_label(self, label):
+        if label in self.dataset.labels:
+            return
+        row = bisect.bisect_left(self.dataset.labels, label)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.dataset.add_label(label)
+        self._fetched[label] = 0
+        self.endInsertRows()
+
+    def remove_label(self, label):
+        row = self.dataset.label_row(label)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.dataset.remove_label(label)
+        self._fetched.pop(label, None)
+        self.endRemoveRows()
+
+    def replace_images(self, label, names):
+        self.insert_label(label)
+
+        parent = self.label_index(label)
+        fetched = self._fetched.get(label, 0)
+        if fetched:
+            self.beginRemoveRows(parent, 0, fetched - 1)
+            self._fetched[label] = 0
+            self.endRemoveRows()
+        self.dataset.set_names(label, names)
+
+        # 展開済みだった分だけ再度読み込む
+        count = min(self.dataset.count(label), max(fetched, FETCH_BATCH) if fetched else 0)
+        if count:
+            self.beginInsertRows(parent, 0, count - 1)
+            self._fetched[label] = count
+            self.endInsertRows()
+        else:
+            self.dataChanged.emit(parent, parent)
+
+    def move_image(self, path, new_label):
+        """Move `path` to `new_label` via ImageDataset.move; returns the new path."""
+        old_label, old_row = self.dataset.locate(path)
+        name = self.dataset.name_at(old_label, old_row)
+
+        # 行の変化はdataset.moveの前に通知する必要があるので、移動先の行を先に求める
+        removed = old_row < self._fetched.get(old_label, 0)
+        inserted = False
+        if self.dataset.is_shown(name):
+            new_row = self.dataset.insertion_row(new_label, name)
+            fetched = self._fetched.get(new_label, 0)
+            # 未読み込みの範囲ならfetchMoreで表示される
+            inserted = new_row < fetched or fetched == self.dataset.count(new_label)
+
+        if removed and inserted:
+            self.beginMoveRows(self.label_index(old_label), old_row, old_row,
+                               self.label_index(new_label), new_row)
+        elif removed:
+            self.beginRemoveRows(self.label_index(old_label), old_row, old_row)
+        elif inserted:
+            self.beginInsertRows(self.label_index(new_label), new_row, new_row)
+
+        new_path = self.dataset.move(path, new_label)[3]
+        if removed:
+            self._fetched[old_label] -= 1
+        if inserted:
+            self._fetched[new_label] = self._fetched.get(new_label, 0) + 1
+
+        if removed and inserted:
+            self.endMoveRows()
+        elif removed:
+            self.endRemoveRows()
+        elif inserted:
+            self.endInsertRows()
+        return new_path
+
+    def _label_id(self, label):
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = next(self._ids)
+            self._label_ids[label] = label_id
+            self._id_labels[label_id] = label
+        return label_id
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from collections import Counter, deque
+from contextlib import nullcontext
+
+FRAME_STATS_ENV = "ANNOTATOR_FRAME_STATS"
+PROFILE_ENV = "ANNOTATOR_PROFILE"
+TRACE_ENV = "ANNOTATOR_TRACE"
+STARTUP_ENV = "ANNOTATOR_STARTUP"
+FRAME_WINDOW = 240
+STAT_WINDOW = 1024
+MAX_TRACE_EVENTS = 1000000
+
+
+class FrameTimer:
+    """Records paint durations of a widget and reports them against a frame budget.
+
+    Reporting is enabled with the ANNOTATOR_FRAME_STATS environment variable;
+    a summary line is printed every `window` frames. With profiling enabled,
+    frames are also recorded in the profiler as "frame.<name>".
+    """
+
+    def __init__(self, name, window=FRAME_WINDOW):
+        self.name = name
+        self.window = window
+        self.budget_ms = 1000 / 60
+        self.times = deque(maxlen=window)
+        self.report = bool(os.environ.get(FRAME_STATS_ENV))
+        self.enabled = self.report or profiler.enabled
+        self._count = 0
+        self._start = None
+
+    def begin(self):
+        if self.enabled:
+            self._start = time.perf_counter()
+
+    def end(self):
+        if self._start is None:
+            return
+
+        ms = (time.perf_counter() - self._start) * 1000
+        profiler.record(f"frame.{self.name}", ms, self._start)
+        self.times.append(ms)
+        self._start = None
+        self._count += 1
+        if self.report and self._count % self.window == 0:
+            print(self.summary())
+
+    def summary(self):
+        times = sorted(self.times)
+        if not times:
+            return f"[frame] {self.name}: no frames"
+
+        p50 = times[len(times) // 2]
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        over = sum(1 for t in times if t > self.budget_ms)
+        return (f"[frame] {self.name}: n={len(times)} p50={p50:.2f}ms p95={p95:.2f}ms max={times[-1]:.2f}ms "
+                f"over budget({self.budget_ms:.1f}ms)={over}")
+
+
+class Stat:
+    """Count, total and max of one timer plus a window of recent samples for percentiles."""
+
+    def __init__(self, window=STAT_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.samples.append(ms)
+
+    def percentile(self, q):
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class Profiler:
+    """Named timers and counters for hot paths, plus an optional Chrome trace.
+
+    Enabled with ANNOTATOR_PROFILE=1; ANNOTATOR_TRACE=<path> also records
+    every timed span and writes a Chrome trace JSON (chrome://tracing,
+    Perfetto) to <path> at exit. When disabled, `timer()` returns a shared
+    no-op context manager and functions decorated with `timed` are left
+    unwrapped, so the cost is one attribute check or nothing.
+    """
+
+    def __init__(self):
+        self.trace_path = os.environ.get(TRACE_ENV)
+        self.enabled = bool(os.environ.get(PROFILE_ENV) or self.trace_path)
+        self.stats = {}  # name: Stat
+        self.counters = Counter()
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            atexit.register(self._at_exit)
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name, ms, start=None):
+        """Add a `ms` sample to timer `name`; `start` (perf_counter) places it in the trace."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = Stat()
+            stat.add(ms)
+            if self.trace_path and start is not None:
+                self.events.append((name, start, ms, threading.get_ident()))
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def get(self, name):
+        with self._lock:
+            return self.stats.get(name)
+
+    def summary(self):
+        with self._lock:
+            stats = sorted(self.stats.items())
+            counters = sorted(self.counters.items())
+
+        lines = ["[perf] name                          n      p50      p95      max    total(ms)"]
+        for name, stat in stats:
+            lines.append(f"[perf] {name:<28} {stat.count:>6} {stat.percentile(0.5):>8.2f} {stat.percentile(0.95):>8.2f} "
+                         f"{stat.max:>8.2f} {stat.total:>12.1f}")
+        for name, value in counters:
+            lines.append(f"[perf] {name:<28} {value:>6}")
+        return "\n".join(lines)
+
+    def dump_trace(self, path):
+        with self._lock:
+            events = list(self.events)
+
+        pid = os.getpid()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": [
+                {"name": name, "ph": "X", "pid": pid, "tid": tid,
+                 "ts": (start - self._origin) * 1e6, "dur": ms * 1e3}
+                for name, start, ms, tid in events
+            ], "displayTimeUnit": "ms"}, f)
+
+    def _at_exit(self):
+        print(self.summary())
+        if self.trace_path:
+            self.dump_trace(self.trace_path)
+            print(f"[perf] trace written to: {self.trace_path}")
+
+
+class _Timer:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, (time.perf_counter() - self.start) * 1000, self.start)
+        return False
+
+
+_NULL_TIMER = nullcontext()
+
+profiler = Profiler()
+
+
+class StartupTimer:
+    """Startup milestones in ms since this module was first imported.
+
+    main.py imports it before anything else, so the marks include the
+    import time of Qt and the other modules. With ANNOTATOR_STARTUP=1 (or
+    `main.py --startup-time`) they are printed once the window has painted
+    its first frame and the DB is open; they are also recorded in the
+    profiler as "startup.<name>".
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.enabled = bool(os.environ.get(STARTUP_ENV))
+        self.marks = {}  # name: ms
+
+    def mark(self, name, when=None):
+        """Record milestone `name` at `when` (perf_counter, default now); only the first call counts."""
+        if name in self.marks:
+            return
+        ms = ((time.perf_counter() if when is None else when) - self.origin) * 1000
+        self.marks[name] = ms
+        profiler.record(f"startup.{name}", ms, self.origin)
+
+    def summary(self):
+        return "[startup] " + " ".join(f"{name}={ms:.0f}ms" for name, ms in sorted(self.marks.items(), key=lambda item: item[1]))
+
+
+startup = StartupTimer()
+
+
+def timed(name):
+    """Decorator timing every call as `name`; a no-op when profiling is disabled."""
+    def decorator(func):
+        if not profiler.enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(profiler, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(workers):
+    """ProcessPoolExecutor whose workers are started with spawn.
+
+    A forked worker would inherit the GUI's threads (Qt, the thread pools)
+    in whatever state they were in; spawn starts a clean interpreter.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+
+class Rect(tuple):
+    """Qt-free (x, y, width, height) rectangle used by AnnotationDB.
+
+    Provides the QRectF accessors the database needs, so a QRectF can be
+    passed wherever a Rect is expected; convert back with QRectF(*rect).
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, x=0.0, y=0.0, width=0.0, height=0.0):
+        return tuple.__new__(cls, (x, y, width, height))
+
+    def __repr__(self):
+        return f"Rect({self[0]!r}, {self[1]!r}, {self[2]!r}, {self[3]!r})"
+
+    def x(self):
+        return self[0]
+
+    def y(self):
+        return self[1]
+
+    def width(self):
+        return self[2]
+
+    def height(self):
+        return self[3]
+
+    def getRect(self):
+        return tuple(self)
+
+    def isEmpty(self):
+        return self[2] <= 0 or self[3] <= 0
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PySide6.QtCore import QObject, Signal, QFileSystemWatcher, QTimer, QStandardPaths
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+SCAN_CACHE_DIR = os.path.join("imageannotator", "scan")
+SCAN_WORKERS = 8
+WATCH_DEBOUNCE_MS = 300
+
+
+def scan_label_dir(label_path):
+    """Return (dir mtime, [name, ...]) for the images in `label_path`."""
+    dir_mtime = os.stat(label_path).st_mtime
+    names = []
+    with os.scandir(label_path) as it:
+        for entry in it:
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            names.append(entry.name)
+
+    names.sort(key=str.lower)
+    return dir_mtime, names
+
+
+def list_label_dirs(root):
+    """Label folders of `root`; hidden ones (.git, caches, ...) are not labels."""
+    with os.scandir(root) as it:
+        return sorted(entry.name for entry in it if entry.is_dir() and not entry.name.startswith("."))
+
+
+def scan_cache_path(root, cache_dir=None):
+    """Listing cache file of `root`, in `cache_dir` (default: the user's cache folder), not in root itself."""
+    if cache_dir is None:
+        cache_dir = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), SCAN_CACHE_DIR)
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+class _Relay(QObject):
+    """Carries results from the scan threads to the GUI thread.
+
+    It is a Qt child of its FolderScanner, so dropping the reference held by
+    a scan thread never destroys a Qt object off the GUI thread. The job is
+    stopped (under its emit lock) before the relay is deleted, see FolderScanner.
+    """
+
+    scanned = Signal(str, list)
+    finished = Signal(int)
+
+
+class _ScanJob:
+    """The part of FolderScanner used by the scan threads (holds no Qt object of its own)."""
+
+    def __init__(self, root, cache_path, workers, relay):
+        self.root = root
+        self.cache_path = cache_path
+        self.cache = {}  # label: {"mtime": float, "names": [name]}
+        self.labels = set()
+        self.relay = relay
+        self.stopped = False
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._emit_lock = threading.Lock()
+
+    def stop(self):
+        # 発行中のシグナルを待ってから止める（この後はRelayに触れない）
+        with self._emit_lock:
+            self.stopped = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def scan_all(self):
+        self.load_cache()
+
+        try:
+            labels = list_label_dirs(self.root)
+        except OSError:
+            labels = []
+        self.labels = set(labels)
+
+        futures = []
+        for label in labels:
+            if self.stopped:
+                return
+            futures.append(self.executor.submit(self.scan_one, label))
+
+        total = 0
+        for future in as_completed(futures):
+            if self.stopped:
+                return
+            total += future.result() or 0
+
+        with self.lock:
+            self.cache = {label: self.cache[label] for label in labels if label in self.cache}
+        self.save_cache()
+        self._emit("finished", total)
+
+    def rescan(self, labels):
+        for label in labels:
+            self.scan_one(label)
+        self.save_cache()
+
+    def scan_one(self, label):
+        label_path = os.path.join(self.root, label)
+        try:
+            dir_mtime = os.stat(label_path).st_mtime
+            with self.lock:
+                cached = self.cache.get(label)
+            if cached is not None and cached.get("mtime") == dir_mtime and "names" in cached:
+                names = cached["names"]
+            else:
+                dir_mtime, names = scan_label_dir(label_path)
+                with self.lock:
+                    self.cache[label] = {"mtime": dir_mtime, "names": names}
+        except OSError:
+            return 0
+
+        self._emit("scanned", label, list(names))
+        return len(names)
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def save_cache(self):
+        with self.lock:
+            data = json.dumps(self.cache)
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                with open(self.cache_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+            except OSError:
+                # 書き込めない場合はキャッシュしない
+                pass
+
+    def _emit(self, name, *args):
+        with self._emit_lock:
+            if not self.stopped:
+                getattr(self.relay, name).emit(*args)
+
+
+class FolderScanner(QObject):
+    """Scans `root/<label>/` folders on a thread pool and watches them afterwards.
+
+    Results are emitted per label as they arrive. Directory listings are
+    cached per root under the user's cache folder (see scan_cache_path),
+    keyed by directory mtime, so re-opening a root only re-reads
+    directories that changed; nothing is written into the image folders. Change
+    notifications are coalesced for WATCH_DEBOUNCE_MS, so a burst of file
+    moves re-reads each touched folder once and writes the cache once.
+    Nothing is emitted after stop(), even for scans already finished, and the
+    scanner may be dropped while its threads are still running.
+    """
+
+    label_scanned = Signal(str, list)  # label, [file names]
+    label_removed = Signal(str)
+    finished = Signal(int)  # 画像数
+
+    def __init__(self, root, workers=SCAN_WORKERS, cache_dir=None):
+        super().__init__()
+        self.root = root
+        self.cache_path = scan_cache_path(root, cache_dir)
+
+        # スレッドにはQObjectを持たせず、結果は子のRelay経由でGUIスレッドへ
+        relay = _Relay(self)
+        relay.scanned.connect(self._deliver_scanned)
+        relay.finished.connect(self._deliver_finished)
+        self._job = _ScanJob(root, self.cache_path, workers, relay)
+        # stop()せずに捨てられても、Relayを消す前にスレッドからの発行を止める
+        job = self._job
+        self.destroyed.connect(lambda *_: job.stop())
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+        self._changed_labels = set()
+        self._root_changed = False
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(WATCH_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self._apply_changes)
+
+    @property
+    def labels(self):
+        return self._job.labels
+
+    @property
+    def cache(self):
+        return self._job.cache
+
+    def start(self):
+        threading.Thread(target=self._job.scan_all, name="scan-root", daemon=True).start()
+
+    def stop(self):
+        self._job.stop()
+        self._debounce.stop()
+        paths = self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+
+    def rescan_labels(self, labels):
+        if not self._job.stopped and labels:
+            self._job.executor.submit(self._job.rescan, sorted(labels))
+
+    def watch(self):
+        # QFileSystemWatcherはGUIスレッドから操作する
+        paths = [self.root] + [os.path.join(self.root, label) for label in sorted(self.labels)]
+        self.watcher.addPaths(paths)
+
+    def _deliver_scanned(self, label, names):
+        if not self._job.stopped:
+            self.label_scanned.emit(label, names)
+
+    def _deliver_finished(self, total):
+        if not self._job.stopped:
+            self.finished.emit(total)
+
+    def _on_directory_changed(self, path):
+        # 続けて届く通知はまとめ、落ち着いてから一度だけ走査する
+        if os.path.normpath(path) == os.path.normpath(self.root):
+            self._root_changed = True
+        else:
+            self._changed_labels.add(os.path.basename(path))
+        self._debounce.start()
+
+    def _apply_changes(self):
+        if self._job.stopped:
+            return
+        changed = self._changed_labels
+        self._changed_labels = set()
+
+        if self._root_changed:
+            self._root_changed = False
+            # ラベルフォルダの追加・削除
+            try:
+                labels = set(list_label_dirs(self.root))
+            except OSError:
+                labels = self.labels
+            for label in sorted(labels - self.labels):
+                self.watcher.addPath(os.path.join(self.root, label))
+                changed.add(label)
+            for label in sorted(self.labels - labels):
+                with self._job.lock:
+                    self._job.cache.pop(label, None)
+                self.label_removed.emit(label)
+            self._job.labels = labels
+
+        self.rescan_labels(changed & self.labels)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import math
+from collections import defaultdict
+
+DEFAULT_CELL_SIZE = 64
+
+
+class GridIndex:
+    """Uniform-grid spatial index of axis-aligned rectangles keyed by id."""
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = defaultdict(set)  # (cx, cy): {key}
+        self._rects = {}  # key: (x, y, w, h)
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, key):
+        return key in self._rects
+
+    def insert(self, key, x, y, w, h):
+        if key in self._rects:
+            self.remove(key)
+
+        self._rects[key] = (x, y, w, h)
+        size = self.cell_size
+        cx0, cy0 = math.floor(x / size), math.floor(y / size)
+        cx1, cy1 = math.floor((x + w) / size), math.floor((y + h) / size)
+        # ほとんどの矩形は1セルに収まる
+        if cx0 == cx1 and cy0 == cy1:
+            self._cells[(cx0, cy0)].add(key)
+            return
+
+        for cell in self._cells_for(x, y, w, h):
+            self._cells[cell].add(key)
+
+    def load(self, rects):
+        """Replace the contents with `rects` ({key: (x, y, w, h)}); much faster than insert() per key."""
+        self._cells.clear()
+        self._rects = dict(rects)
+        cells = self._cells
+        size = self.cell_size
+        floor = math.floor
+        for key, (x, y, w, h) in self._rects.items():
+            cx0, cy0 = floor(x / size), floor(y / size)
+            cx1, cy1 = floor((x + w) / size), floor((y + h) / size)
+            if cx0 == cx1 and cy0 == cy1:
+                cells[(cx0, cy0)].add(key)
+                continue
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cells[(cx, cy)].add(key)
+
+    def remove(self, key):
+        rect = self._rects.pop(key, None)
+        if rect is None:
+            return
+
+        for cell in self._cells_for(*rect):
+            keys = self._cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._rects.clear()
+
+    def query_point(self, px, py):
+        """Keys whose rect contains (px, py), smallest area first."""
+        cell = (math.floor(px / self.cell_size), math.floor(py / self.cell_size))
+        hits = []
+        for key in self._cells.get(cell, ()):
+            x, y, w, h = self._rects[key]
+            if x <= px <= x + w and y <= py <= y + h:
+                hits.append((w * h, key))
+
+        return [key for _, key in sorted(hits, key=lambda hit: hit[0])]
+
+    def query_rect(self, x, y, w, h):
+        """Keys whose rect intersects the given rect."""
+        size = self.cell_size
+        cx0, cy0 = math.floor(x / size), math.floor(y / size)
+        cx1, cy1 = math.floor((x + w) / size), math.floor((y + h) / size)
+
+        keys = set()
+        # 縮小表示で広い範囲を問い合わせるときは、空のセルを辿らず使用中のセルだけを見る
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            for (cx, cy), cell_keys in self._cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    keys.update(cell_keys)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    keys.update(self._cells.get((cx, cy), ()))
+
+        result = []
+        for key in keys:
+            rx, ry, rw, rh = self._rects[key]
+            if rx <= x + w and x <= rx + rw and ry <= y + h and y <= ry + rh:
+                result.append(key)
+        return result
+
+    def _cells_for(self, x, y, w, h):
+        size = self.cell_size
+        cx0, cy0 = math.floor(x / size), math.floor(y / size)
+        cx1, cy1 = math.floor((x + w) / size), math.floor((y + h) / size)
+        return [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+
+
+def suggest_cell_size(sizes, minimum=32, maximum=1024):
+    """Pick a cell size around twice the median box size."""
+    sizes = sorted(sizes)
+    if not sizes:
+        return DEFAULT_CELL_SIZE
+
+    median = sizes[len(sizes) // 2]
+    return int(min(maximum, max(minimum, median * 2)))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import os
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+
+from PySide6.QtWidgets import QListView, QAbstractItemView
+from PySide6.QtGui import QImage, QPixmap
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QObject, QSize, Qt, Signal
+
+from src.thumbnails import open_store, make_thumbnail, THUMB_SIZE
+from src.pool import process_pool
+
+THUMB_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+MAX_PENDING = 512
+MAX_PIXMAPS = 2048
+
+
+class ThumbnailLoader(QObject):
+    """Generates missing thumbnails on a process pool and stores them in a ThumbnailStore.
+
+    Requests come from the visible cells only; when more than MAX_PENDING are
+    queued, the oldest (scrolled out of view) are cancelled. The store of a
+    root is opened on first use (see ensure_store), not by open().
+    """
+
+    thumbnail_ready = Signal(str)
+    _generated = Signal(str, object)  # ワーカースレッド → GUIスレッド
+
+    def __init__(self, workers=THUMB_WORKERS, parent=None):
+        super().__init__(parent)
+        self.workers = workers
+        self.root = None
+        self.store = None
+
+        self._executor = None
+        self._pending = OrderedDict()  # path: future
+        self._failed = set()
+        self._generated.connect(self._on_generated)
+
+    def open(self, root):
+        self.cancel_all()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        self.root = root
+        self._failed.clear()
+
+    def ensure_store(self):
+        if self.store is None and self.root is not None:
+            self.store = open_store(self.root)
+        return self.store
+
+    def request(self, path):
+        if self.ensure_store() is None or path in self._failed:
+            return
+        if path in self._pending:
+            self._pending.move_to_end(path)
+            return
+
+        if self._executor is None:
+            self._executor = process_pool(self.workers)
+        try:
+            future = self._executor.submit(make_thumbnail, path)
+        except BrokenProcessPool:
+            # ワーカーが落ちた場合は次の要求で作り直す
+            self._executor = None
+            return
+        future.add_done_callback(lambda f, p=path: self._done(p, f))
+        self._pending[path] = future
+
+        while len(self._pending) > MAX_PENDING:
+            _, old = self._pending.popitem(last=False)
+            old.cancel()
+
+    def cancel_all(self):
+        pending = list(self._pending.values())
+        self._pending.clear()
+        for future in pending:
+            future.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def _done(self, path, future):
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"[ERROR] Failed to make thumbnail: {path} → {e}")
+            result = None
+        try:
+            self._generated.emit(path, result)
+        except RuntimeError:
+            # 終了処理中
+            pass
+
+    def _on_generated(self, path, result):
+        if self._pending.pop(path, None) is None or self.store is None:
+            return
+        if result is None:
+            self._failed.add(path)
+            return
+
+        mtime, image = result
+        self.store.put(path, mtime, image)
+        self.thumbnail_ready.emit(path)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """Thumbnails of a sequence of image paths (e.g. a LabelView).
+
+    Pixmaps are only built for the rows the view asks for, i.e. the visible
+    cells, from the memory-mapped store; missing ones are requested from the loader.
+    """
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.images = []
+        self.pixmaps = OrderedDict()  # path: QPixmap
+
+        self.loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def set_images(self, images):
+        self.beginResetModel()
+        self.images = images
+        self.endResetModel()
+
+    def clear_pixmaps(self):
+        self.pixmaps.clear()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.images):
+            return None
+
+        path = self.images[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ToolTipRole:
+            return path
+        if role == Qt.DecorationRole:
+            return self._get_pixmap(path)
+        return None
+
+    def _get_pixmap(self, path):
+        pixmap = self.pixmaps.get(path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(path)
+            return pixmap
+
+        found = self.loader.store.lookup(path) if self.loader.store is not None else None
+        if found is None:
+            self.loader.request(path)
+            return None
+
+        slot, width, height = found
+        # スロットは行幅THUMB_SIZE固定なので、その左上を切り出す形でQImageを作る
+        qimage = QImage(slot.data, width, height, slot.strides[0], QImage.Format_BGR888)
+        pixmap = QPixmap.fromImage(qimage)
+
+        self.pixmaps[path] = pixmap
+        while len(self.pixmaps) > MAX_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def _on_thumbnail_ready(self, path):
+        try:
+            row = self.images.index(path)
+        except ValueError:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class ThumbnailGrid(QListView):
+    """Grid of thumbnails; activating a cell emits its row."""
+
+    image_activated = Signal(int)
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(1000)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setIconSize(QSize(THUMB_SIZE, THUMB_SIZE))
+        self.setGridSize(QSize(THUMB_SIZE + 16, THUMB_SIZE + 32))
+        self.setTextElideMode(Qt.ElideMiddle)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+
+        self.activated.connect(lambda index: self.image_activated.emit(index.row()))
+
+    def show_row(self, row):
+        index = self.model().index(row)
+        if index.isValid():
+            self.setCurrentIndex(index)
+            self.scrollTo(index)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+from src.image_cache import load_image
+
+THUMB_SIZE = 128
+THUMBS_CACHE_DIR = os.path.join("imageannotator", "thumbs")
+MEMORY_THUMBS = 4096
+GROW_SLOTS = 1024
+RESERVE_SLOTS = 64
+COMMIT_EVERY = 256
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    """(mtime, BGR array fitting in size x size) for `path`, or None.
+
+    Runs in a worker process; the image is decoded reduced (see load_image).
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    image = load_image(path, (size, size))
+    if image is None:
+        return None
+    return mtime, image
+
+
+def thumbs_cache_dir(root, cache_dir=None):
+    """Thumbnail store folder of `root`, in `cache_dir` (default: the user's cache folder), not in root itself."""
+    if cache_dir is None:
+        # ワーカープロセスでも読み込まれるモジュールなので、Qtは必要な時だけimport
+        from PySide6.QtCore import QStandardPaths
+
+        cache_dir = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), THUMBS_CACHE_DIR)
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, key)
+
+
+def open_store(root, size=THUMB_SIZE, cache_dir=None):
+    """Thumbnail store for `root`, kept in thumbs_cache_dir(root, cache_dir).
+
+    When it cannot be opened, thumbnails are only kept in memory.
+    """
+    try:
+        return ThumbnailStore(root, size, thumbs_cache_dir(root, cache_dir))
+    except (OSError, sqlite3.Error) as e:
+        print(f"[ERROR] Cannot store thumbnails for {root} → {e}")
+        return MemoryThumbnailStore(root, size)
+
+
+class ThumbnailStore:
+    """Persistent thumbnails of the images under one root folder.
+
+    Every thumbnail occupies one fixed size x size BGR slot of a
+    memory-mapped file (`<cache_dir>/thumbs_<size>.u8`, by default in
+    thumbs_cache_dir(root)), and an SQLite index maps (path relative to
+    root, mtime) to its slot, so reopening a folder reuses every thumbnail
+    whose file has not changed.
+
+    Several processes may open the same store: slots are reserved
+    RESERVE_SLOTS at a time, and the data file is only grown, inside a
+    write transaction of the index, so no two processes write the same slot
+    for different images.
+    """
+
+    def __init__(self, root, size=THUMB_SIZE, cache_dir=None):
+        self.root = root
+        self.size = size
+        self.dir = cache_dir or thumbs_cache_dir(root)
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(os.path.join(self.dir, "index.sqlite"), timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS thumbs (
+            path TEXT PRIMARY KEY,
+            mtime REAL,
+            slot INTEGER,
+            width INTEGER,
+            height INTEGER
+        )''')
+        # 次に確保するスロット（1行だけ）
+        self.conn.execute("CREATE TABLE IF NOT EXISTS slots (next_slot INTEGER NOT NULL)")
+        self.conn.commit()
+
+        self.entries = {path: (mtime, slot, width, height) for path, mtime, slot, width, height
+                        in self.conn.execute("SELECT path, mtime, slot, width, height FROM thumbs")}
+        self._checked = set()  # このセッションでmtimeを確認済みのパス
+        # 書き込みロックを持ち続けないよう、索引の行はまとめて短いトランザクションで書く
+        self._unwritten = []
+
+        self.data_path = os.path.join(self.dir, f"thumbs_{size}.u8")
+        self.data = None
+        self._next_slot = self._end_slot = 0  # 確保済みで未使用のスロット
+        self._reserve_slots(0)
+
+    def lookup(self, path):
+        """(BGR slot array, width, height) of a fresh thumbnail, or None."""
+        key = self._key(path)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        mtime, slot, width, height = entry
+        if key not in self._checked:
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return None
+            except OSError:
+                return None
+            self._checked.add(key)
+        return self.data[slot], width, height
+
+    def put(self, path, mtime, image):
+        key = self._key(path)
+        entry = self.entries.get(key)
+        if entry is not None:
+            slot = entry[1]
+        else:
+            if self._next_slot >= self._end_slot:
+                self._reserve_slots(RESERVE_SLOTS)
+            slot = self._next_slot
+            self._next_slot += 1
+
+        height, width = image.shape[:2]
+        self.data[slot, :height, :width] = image
+        self.entries[key] = (mtime, slot, width, height)
+        self._checked.add(key)
+
+        self._unwritten.append((key, mtime, slot, width, height))
+        if len(self._unwritten) >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self.data is not None:
+            self.data.flush()
+        if self._unwritten:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO thumbs (path, mtime, slot, width, height) VALUES (?, ?, ?, ?, ?)",
+                    self._unwritten)
+            self._unwritten = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        self.data = None
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root)
+
+    def _reserve_slots(self, count):
+        # 他のプロセスと重ならないよう、スロットの確保とファイルの拡張は書き込みロック内で行う
+        self.flush()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT next_slot FROM slots").fetchone()
+            if row is None:
+                start = self.conn.execute("SELECT COALESCE(MAX(slot), -1) + 1 FROM thumbs").fetchone()[0]
+                self.conn.execute("INSERT INTO slots (next_slot) VALUES (?)", (start + count,))
+            else:
+                start = row[0]
+                self.conn.execute("UPDATE slots SET next_slot = ?", (start + count,))
+            self._open_data(start + count)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self._next_slot, self._end_slot = start, start + count
+
+    def _open_data(self, min_slots):
+        import numpy as np
+
+        # ファイルは伸ばすだけ（他のプロセスがマップしている範囲は縮めない）
+        slot_bytes = self.size * self.size * 3
+        existing = os.path.getsize(self.data_path) // slot_bytes if os.path.exists(self.data_path) else 0
+        if existing < max(min_slots, 1):
+            existing = max(min_slots, existing + max(GROW_SLOTS, existing // 2))
+            with open(self.data_path, "ab") as f:
+                f.truncate(existing * slot_bytes)
+
+        # スロット数が増えたら開き直す
+        if self.data is not None and len(self.data) >= min_slots:
+            return
+        if self.data is not None:
+            self.data.flush()
+            self.data = None
+        self.data = np.memmap(self.data_path, dtype=np.uint8, mode="r+", shape=(existing, self.size, self.size, 3))
+
+
+class MemoryThumbnailStore:
+    """The most recent MEMORY_THUMBS thumbnails, for folders where nothing can be written."""
+
+    def __init__(self, root, size=THUMB_SIZE):
+        self.root = root
+        self.size = size
+        self.entries = OrderedDict()  # path: (mtime, BGR array)
+
+    def lookup(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        self.entries.move_to_end(path)
+        image = entry[1]
+        return image, image.shape[1], image.shape[0]
+
+    def put(self, path, mtime, image):
+        self.entries[path] = (mtime, image)
+        self.entries.move_to_end(path)
+        while len(self.entries) > MEMORY_THUMBS:
+            self.entries.popitem(last=False)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.entries.clear()
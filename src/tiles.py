@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Tiled drawing of large images from a resolution pyramid.
+
+A pyramid level is decoded whole (cv2 cannot decode a region of a JPEG), so
+a level is never finer than MAX_LEVEL_PIXELS: for larger images zooming in
+past that level shows its pixels enlarged instead of the original ones.
+"""
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtWidgets import QGraphicsObject, QGraphicsItem
+from PySide6.QtGui import QImage, QPixmap, QPainter
+from PySide6.QtCore import QRectF, Signal
+
+from src.image_cache import load_reduced
+
+TILE_SIZE = 512
+MAX_TILES = 256
+MAX_LEVEL_PIXELS = 1 << 26  # 1レベルの最大画素数（BGRで約200MB）
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tiles")
+
+
+class TiledImageItem(QGraphicsObject):
+    """Draws an image from a resolution pyramid, one tile at a time.
+
+    The item uses the same display coordinates as the pixmap view
+    (original pixels * scale_ratio). Only tiles inside the exposed rect are
+    converted to pixmaps, from the pyramid level matching the current zoom.
+    """
+
+    level_loaded = Signal(int)
+
+    def __init__(self, path, orig_width, orig_height, scale_ratio):
+        super().__init__()
+        self.path = path
+        self.orig_width = orig_width
+        self.orig_height = orig_height
+        self.scale_ratio = scale_ratio
+
+        self.levels = {}  # factor: BGR array
+        self.tiles = OrderedDict()  # (factor, tx, ty): QPixmap
+        self._loading = set()
+        self._lock = threading.RLock()
+
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.level_loaded.connect(self._on_level_loaded)
+
+        self.min_factor = self._min_factor()
+        # 表示サイズに合う粗いレベルは常に保持
+        self.base_factor = self._factor_for(self.scale_ratio)
+        self.levels[self.base_factor] = load_reduced(path, self.base_factor)
+
+    def is_valid(self):
+        return self.levels[self.base_factor] is not None
+
+    def set_scale_ratio(self, scale_ratio):
+        self.prepareGeometryChange()
+        self.scale_ratio = scale_ratio
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.orig_width * self.scale_ratio, self.orig_height * self.scale_ratio)
+
+    def paint(self, painter, option, widget=None):
+        device_scale = self.scale_ratio * painter.worldTransform().m11()
+        factor = self._factor_for(device_scale)
+
+        with self._lock:
+            image = self.levels.get(factor)
+            if image is None:
+                if factor not in self.levels:
+                    self._request_level(factor)
+                factor = self._best_loaded(factor)
+                image = self.levels[factor]
+
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+
+        # 表示座標 → レベル画素座標
+        level_h, level_w = image.shape[:2]
+        sx = level_w / (self.orig_width * self.scale_ratio)
+        sy = level_h / (self.orig_height * self.scale_ratio)
+        exposed = option.exposedRect.intersected(self.boundingRect())
+
+        tx0 = max(0, int(exposed.left() * sx) // TILE_SIZE)
+        ty0 = max(0, int(exposed.top() * sy) // TILE_SIZE)
+        tx1 = min(math.ceil(level_w / TILE_SIZE), math.ceil(exposed.right() * sx / TILE_SIZE))
+        ty1 = min(math.ceil(level_h / TILE_SIZE), math.ceil(exposed.bottom() * sy / TILE_SIZE))
+
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                pixmap = self._get_tile(factor, image, tx, ty)
+                x, y = tx * TILE_SIZE, ty * TILE_SIZE
+                target = QRectF(x / sx, y / sy, pixmap.width() / sx, pixmap.height() / sy)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+    def _min_factor(self):
+        # MAX_LEVEL_PIXELS に収まる最も細かいレベル
+        factor = 1
+        while (self.orig_width / factor) * (self.orig_height / factor) > MAX_LEVEL_PIXELS:
+            factor *= 2
+        return factor
+
+    def _factor_for(self, device_scale):
+        # 1画面画素あたりの元画素数以下で最大の2のべき
+        factor = 1 if device_scale >= 1 else 2 ** int(math.log2(1 / device_scale))
+        max_factor = 2 ** max(0, int(math.log2(max(self.orig_width, self.orig_height) / TILE_SIZE)))
+        return max(self.min_factor, min(factor, max_factor))
+
+    def _best_loaded(self, factor):
+        loaded = sorted(f for f, image in self.levels.items() if image is not None)
+        # 要求より細かいレベルがあればそれを、なければ最も細かいレベルを使う
+        finer = [f for f in loaded if f <= factor]
+        return finer[-1] if finer else loaded[0]
+
+    def _request_level(self, factor):
+        if factor in self._loading:
+            return
+        self._loading.add(factor)
+        _executor.submit(self._decode_level, factor)
+
+    def _decode_level(self, factor):
+        image = load_reduced(self.path, factor)
+        with self._lock:
+            # 常時保持するレベル以外は、直近に要求されたものだけ残す
+            for f in list(self.levels):
+                if f != self.base_factor:
+                    del self.levels[f]
+            self.levels[factor] = image
+        try:
+            self.level_loaded.emit(factor)
+        except RuntimeError:
+            # シーンから削除済み
+            pass
+
+    def _on_level_loaded(self, factor):
+        self._loading.discard(factor)
+        for key in [k for k in self.tiles if k[0] not in self.levels]:
+            del self.tiles[key]
+        self.update()
+
+    def _get_tile(self, factor, image, tx, ty):
+        key = (factor, tx, ty)
+        pixmap = self.tiles.get(key)
+        if pixmap is not None:
+            self.tiles.move_to_end(key)
+            return pixmap
+
+        x, y = tx * TILE_SIZE, ty * TILE_SIZE
+        tile = image[y:y + TILE_SIZE, x:x + TILE_SIZE].copy()
+        h, w, ch = tile.shape
+        qimage = QImage(tile.data, w, h, ch * w, QImage.Format_BGR888)
+        pixmap = QPixmap.fromImage(qimage)
+
+        self.tiles[key] = pixmap
+        while len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        return pixmap
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import random
+
+from PySide6.QtCore import QPointF, QRectF
+
+from src.annotation_layer import AnnotationLayerItem
+from src.rect import Rect
+from src.spatial import GridIndex
+
+
+def test_load_matches_insert():
+    rng = random.Random(0)
+    rects = {key: (rng.uniform(-50, 500), rng.uniform(-50, 500), rng.uniform(0, 150), rng.uniform(0, 150))
+             for key in range(500)}
+    loaded = GridIndex(40)
+    loaded.load(rects)
+    inserted = GridIndex(40)
+    for key, rect in rects.items():
+        inserted.insert(key, *rect)
+    assert dict(loaded._cells) == dict(inserted._cells)
+    assert sorted(loaded.query_rect(100, 100, 80, 80)) == sorted(inserted.query_rect(100, 100, 80, 80))
+
+
+def test_wide_query_matches_narrow_queries():
+    rng = random.Random(1)
+    index = GridIndex(8)
+    index.load({key: (rng.uniform(0, 5000), rng.uniform(0, 5000), 10, 10) for key in range(50)})
+    # 使用中のセルより多くのセルにかかる問い合わせ
+    wide = sorted(index.query_rect(-100, -100, 10000, 10000))
+    assert wide == list(range(50))
+    assert sorted(index.query_rect(0, 0, 2500, 5010)) == \
+        sorted(key for key in wide if index._rects[key][0] <= 2500)
+
+
+def test_boxes_from_tuples_and_qrectf(qapp):
+    layer = AnnotationLayerItem(scale_ratio=0.5)
+    layer.set_boxes([(1, Rect(0, 0, 100, 100), "cat"), (2, Rect(20, 20, 10, 10), "dog")])
+    assert layer.box_at(QPointF(12, 12)) == 2
+    assert layer.extent == QRectF(0, 0, 100, 100)
+
+    layer.add_box(3, QRectF(200, 0, 50, 50), "cat")
+    assert layer.box_at(QPointF(110, 10)) == 3
+    assert layer.extent == QRectF(0, 0, 250, 100)
+    layer.remove_box(3)
+    assert layer.box_at(QPointF(110, 10)) is None
+    assert layer.extent == QRectF(0, 0, 100, 100)
+    layer.remove_box(2)
+    assert layer.extent == QRectF(0, 0, 100, 100)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import pytest
+from PySide6.QtCore import QRectF
+
+from src.batch_move import BatchMover, has_pending_journal
+from src.db import AnnotationDB
+
+
+def _make_root(tmp_path, count=6):
+    root = tmp_path / "images"
+    for label in ("cat", "dog"):
+        os.makedirs(root / label)
+    paths = []
+    for i in range(count):
+        path = root / "cat" / f"img_{i}.jpg"
+        path.write_bytes(b"")
+        paths.append(str(path))
+    return str(root), paths
+
+
+def _open_db(tmp_path, paths):
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    for path in paths:
+        db.save_annotation(path, QRectF(0, 0, 10, 10), "cat")
+    return db
+
+
+def _img_labels(db):
+    return dict(db.conn.execute("SELECT filename, img_label FROM annotations"))
+
+
+def _interrupt(mover, moves, done):
+    # 一部のファイルを移動したところで中断された状態を作る
+    mover.journal.start([list(move) for move in moves])
+    for i in done:
+        shutil.move(*moves[i])
+        mover.journal.mark_done(i)
+    mover.journal.close()
+
+
+def test_run_moves_files_and_labels(tmp_path):
+    root, paths = _make_root(tmp_path)
+    db = _open_db(tmp_path, paths)
+    # 移動先に同名のファイルがあるものは計画から外す
+    open(os.path.join(root, "dog", "img_5.jpg"), "wb").close()
+
+    mover = BatchMover(root, db)
+    moves = mover.plan(paths, "dog")
+    assert [src for src, _ in moves] == paths[:5]
+    assert mover.run(moves) == moves
+
+    assert all(os.path.exists(dst) and not os.path.exists(src) for src, dst in moves)
+    assert _img_labels(db) == {f"img_{i}.jpg": "dog" if i < 5 else "cat" for i in range(6)}
+    assert not has_pending_journal(root)
+    db.close()
+
+
+def test_resume_finishes_interrupted_move(tmp_path):
+    root, paths = _make_root(tmp_path)
+    db = _open_db(tmp_path, paths)
+    mover = BatchMover(root, db)
+    moves = mover.plan(paths, "dog")
+    _interrupt(mover, moves, done=[0, 1])
+    # 移動したが記録する前に中断された分
+    shutil.move(*moves[2])
+    assert has_pending_journal(root)
+
+    assert BatchMover(root, db).resume() == moves
+    assert all(os.path.exists(dst) and not os.path.exists(src) for src, dst in moves)
+    assert set(_img_labels(db).values()) == {"dog"}
+    assert not has_pending_journal(root)
+    db.close()
+
+
+def test_rollback_restores_moved_files(tmp_path):
+    root, paths = _make_root(tmp_path)
+    db = _open_db(tmp_path, paths)
+    mover = BatchMover(root, db)
+    moves = mover.plan(paths, "dog")
+    _interrupt(mover, moves, done=[0, 1])
+
+    assert BatchMover(root, db).rollback() == [(dst, src) for src, dst in moves[:2]]
+    assert all(os.path.exists(path) for path in paths)
+    assert os.listdir(os.path.join(root, "dog")) == []
+    assert set(_img_labels(db).values()) == {"cat"}
+    assert not has_pending_journal(root)
+    db.close()
+
+
+def test_run_refuses_while_another_batch_is_pending(tmp_path):
+    root, paths = _make_root(tmp_path)
+    db = _open_db(tmp_path, paths)
+    mover = BatchMover(root, db)
+    moves = mover.plan(paths, "dog")
+    _interrupt(mover, moves, done=[0])
+
+    with pytest.raises(RuntimeError):
+        BatchMover(root, db).run(moves[1:])
+    # 中断された移動の記録はそのまま
+    assert BatchMover(root, db).journal.load() == (moves, {0})
+    assert os.listdir(os.path.join(root, "dog")) == ["img_0.jpg"]
+    db.close()
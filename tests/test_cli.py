@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import csv
+
+import pytest
+
+from src.cli import main
+from src.db import AnnotationDB, CSV_COLUMNS
+from src.image_filter import ImageFilter
+
+ROWS = [
+    ["a.jpg", "cat", "1.0", "2.0", "3.0", "4.0", "cat"],
+    ["a.jpg", "cat", "5.0", "6.0", "7.0", "8.0", "dog"],
+    ["b.jpg", "dog", "0.0", "0.0", "1.0", "1.0", "dog"],
+]
+
+
+def _import(tmp_path):
+    source = str(tmp_path / "in.csv")
+    with open(source, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(ROWS)
+    db = str(tmp_path / "annotations.db")
+    assert main(["--db", db, "--user", "alice", "import", source, "-q"]) == 0
+    return db
+
+
+def test_import_then_export_round_trip(tmp_path, capsys):
+    db = _import(tmp_path)
+    out = str(tmp_path / "out.csv")
+    assert main(["--db", db, "export", out]) == 0
+    assert "Exported 3 annotations of 2 images" in capsys.readouterr().out
+
+    with open(out, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == CSV_COLUMNS
+    assert sorted(rows[1:]) == sorted(ROWS)
+
+    assert main(["--db", db, "stats", "--by", "created_by"]) == 0
+    assert "alice" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("mismatch", ["a.jpg"]),
+    ("label:dog", ["a.jpg", "b.jpg"]),
+    ("boxes>1", ["a.jpg"]),
+    ("-label:cat", ["b.jpg"]),
+])
+def test_find(tmp_path, capsys, text, expected):
+    db = _import(tmp_path)
+    capsys.readouterr()
+    # "-"で始まる条件はオプションと区別するため"--"の後に
+    assert main(["--db", db, "find", "--", text]) == 0
+    assert capsys.readouterr().out.splitlines() == expected
+
+
+def test_find_rejects_bad_filters(tmp_path, capsys):
+    db = _import(tmp_path)
+    assert main(["--db", db, "find", "boxes>x; DROP TABLE annotations"]) == 2
+    assert "Unknown filter term" in capsys.readouterr().err
+
+
+def test_find_filenames_takes_only_a_filter(tmp_path):
+    db = AnnotationDB(_import(tmp_path))
+    assert db.find_filenames(ImageFilter("label:dog")) == {"a.jpg", "b.jpg"}
+    with pytest.raises(TypeError):
+        db.find_filenames("1 = 1")
+    db.close()
+
+
+def test_missing_database(tmp_path, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["--db", str(tmp_path / "missing.db"), "stats"])
+    assert e.value.code == 2
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+
+import cv2
+import numpy as np
+import pytest
+
+from src.crops import crop_image, extract_crops, reduction_factor
+from src.db import AnnotationDB
+from src.rect import Rect
+
+
+def _write_image(path, width, height):
+    image = np.zeros((height, width, 3), np.uint8)
+    image[:, :, 1] = np.linspace(0, 255, width, dtype=np.uint8)
+    cv2.imwrite(path, image)
+    return image
+
+
+@pytest.mark.parametrize("sizes, max_size, factor", [
+    ([(800, 400)], 100, 8),
+    ([(300, 50)], 100, 2),
+    ([(800, 800), (150, 150)], 100, 1),
+    ([(120, 90)], 100, 1),
+])
+def test_reduction_factor_keeps_every_box_large_enough(sizes, max_size, factor):
+    assert reduction_factor([("out", 0, 0, w, h) for w, h in sizes], max_size) == factor
+
+
+def test_crops_are_clipped_to_the_image(tmp_path):
+    path = str(tmp_path / "a.png")
+    image = _write_image(path, 100, 80)
+    inside, clipped, outside = (str(tmp_path / f"{name}.png") for name in ("inside", "clipped", "outside"))
+    boxes = [(inside, 10, 20, 30, 40), (clipped, -10, 60, 40, 40), (outside, 120, 0, 10, 10)]
+
+    assert crop_image(path, boxes, image_format="png") == (2, 1)
+    assert (cv2.imread(inside) == image[20:60, 10:40]).all()
+    assert (cv2.imread(clipped) == image[60:80, 0:30]).all()
+    assert not os.path.exists(outside)
+
+
+def test_crops_are_shrunk_to_max_size(tmp_path):
+    path = str(tmp_path / "a.png")
+    _write_image(path, 400, 400)
+    out = str(tmp_path / "crop.png")
+    assert crop_image(path, [(out, 0, 0, 400, 200)], max_size=100, image_format="png") == (1, 0)
+    assert cv2.imread(out).shape[:2] == (50, 100)
+
+
+def _open_db(tmp_path, boxes=5):
+    root = tmp_path / "images"
+    os.makedirs(root / "cat")
+    _write_image(str(root / "cat" / "a.png"), 100, 80)
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    for i in range(boxes):
+        db.save_annotation(str(root / "cat" / "a.png"), Rect(i * 10, 0, 10, 10), "cat" if i % 2 else "dog")
+    return db, str(root)
+
+
+def test_resume_skips_existing_crops(tmp_path):
+    db, root = _open_db(tmp_path)
+    out = str(tmp_path / "crops")
+    assert extract_crops(db, root, out, workers=0) == (1, 5, 0, 0)
+
+    os.remove(sorted(glob.glob(os.path.join(out, "*", "*.jpg")))[0])
+    assert extract_crops(db, root, out, workers=0) == (1, 1, 4, 0)
+    assert len(glob.glob(os.path.join(out, "*", "*.jpg"))) == 5
+    db.close()
+
+
+def test_interrupted_run_leaves_no_partial_files(tmp_path, monkeypatch):
+    db, root = _open_db(tmp_path)
+    out = str(tmp_path / "crops")
+    replace = os.replace
+    calls = []
+
+    def interrupted_replace(src, dst):
+        calls.append(dst)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        extract_crops(db, root, out, workers=0)
+    assert glob.glob(os.path.join(out, "*", "*.part")) == []
+    assert len(glob.glob(os.path.join(out, "*", "*.jpg"))) == 2
+
+    monkeypatch.setattr(os, "replace", replace)
+    assert extract_crops(db, root, out, workers=0) == (1, 3, 2, 0)
+    assert glob.glob(os.path.join(out, "*", "*.part")) == []
+    db.close()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import os
+
+from src.dataset import ImageDataset
+
+
+def test_move_applies_filter():
+    dataset = ImageDataset("root")
+    dataset.set_names("cat", ["a.jpg", "B.jpg", "c.jpg"])
+    dataset.add_label("dog")
+    hidden = {"c.jpg"}
+    dataset.set_filter(lambda name: name not in hidden)
+    assert dataset.count("cat") == 2
+
+    # 移動で絞り込みの結果が変わった画像は、移動先で隠れる
+    hidden.add("a.jpg")
+    assert dataset.move(os.path.join("root", "cat", "a.jpg"), "dog")[2] is None
+    assert dataset.count("dog") == 0
+    assert os.path.join("root", "dog", "a.jpg") in dataset
+    assert dataset.move(os.path.join("root", "cat", "B.jpg"), "dog")[2] == 0
+
+    dataset.set_filter(None)
+    assert list(dataset.items()) == [("cat", "c.jpg"), ("dog", "a.jpg"), ("dog", "B.jpg")]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import csv
+import sqlite3
+
+import pytest
+
+from src.db import AnnotationDB, CSV_COLUMNS, INDEXES, TRIGGERS, SCHEMA_VERSION
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(rows)
+
+
+@pytest.mark.parametrize("rebuild_indexes", [False, True])
+def test_import_keeps_image_stats(tmp_path, rebuild_indexes):
+    path = str(tmp_path / "boxes.csv")
+    _write_csv(path, [[f"img_{i % 7}.jpg", "cat", 1, 2, 3, 4, "cat" if i % 3 else "dog"] for i in range(100)])
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    assert db.import_from_csv(path, chunk_size=16, rebuild_indexes=rebuild_indexes) == (100, 0)
+
+    stats = db.conn.execute("SELECT filename, boxes, mismatched FROM image_stats ORDER BY filename").fetchall()
+    expected = db.conn.execute('''SELECT filename, COUNT(*), SUM(rect_label IS NOT img_label) FROM annotations
+                                  GROUP BY filename ORDER BY filename''').fetchall()
+    assert stats == expected
+    indexes = {row[1] for row in db.conn.execute("PRAGMA index_list(annotations)")}
+    assert "idx_annotations_filename" in indexes
+    db.close()
+
+
+def test_import_names_missing_columns(tmp_path):
+    path = str(tmp_path / "boxes.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([name for name in CSV_COLUMNS if name not in ("x", "rect_label")])
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    with pytest.raises(ValueError, match="x, rect_label"):
+        db.import_from_csv(path)
+    db.close()
+
+
+def _dump(path):
+    conn = sqlite3.connect(path)
+    schema = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+    tables = {name: conn.execute(f"SELECT * FROM {name} ORDER BY 1, 2").fetchall()
+              for kind, name, _ in schema if kind == "table"}
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version, schema, tables
+
+
+def test_baseline_database_is_upgraded_in_place(tmp_path):
+    # 最初の版のmain.pyが作っていたテーブル（idなし、user_version 0）
+    path = str(tmp_path / "annotations.db")
+    rows = [("a.jpg", 1, 2, 3, 4, "cat", "cat"),
+            ("a.jpg", 5, 6, 7, 8, "dog", "cat"),
+            ("b.jpg", 0, 0, 1, 1, None, "dog"),
+            ("c.jpg", 9, 9, 9, 9, "dog", "dog")]
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE annotations (filename TEXT, x REAL, y REAL, width REAL, height REAL,
+                                             rect_label TEXT, img_label TEXT)''')
+    conn.executemany("INSERT INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+    db = AnnotationDB(path)
+    assert SCHEMA_VERSION == 4
+    assert db.conn.execute("PRAGMA user_version").fetchone()[0] == 4
+    # v1: 全行が残り、元のrowid順にidが振られる
+    assert db.conn.execute('''SELECT id, filename, x, y, width, height, rect_label, img_label FROM annotations
+                              ORDER BY id''').fetchall() == [(i + 1, *row) for i, row in enumerate(rows)]
+    # v2, v3
+    assert db.conn.execute("SELECT COUNT(*) FROM image_sizes").fetchone()[0] == 0
+    assert db.conn.execute('''SELECT COUNT(*) FROM annotations WHERE created_by IS NULL AND created_at IS NULL
+                              AND updated_by IS NULL AND updated_at IS NULL''').fetchone()[0] == len(rows)
+    # v1, v4: インデックス・トリガー・集計
+    names = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    assert set(INDEXES) | set(TRIGGERS) | {"idx_image_stats_boxes", "idx_image_stats_mismatched",
+                                           "idx_image_box_labels_rect_label"} <= names
+    assert db.conn.execute("SELECT filename, boxes, mismatched FROM image_stats ORDER BY filename").fetchall() == \
+        [("a.jpg", 2, 1), ("b.jpg", 1, 1), ("c.jpg", 1, 0)]
+    assert db.conn.execute("SELECT filename, rect_label, boxes FROM image_box_labels ORDER BY 1, 2").fetchall() == \
+        [("a.jpg", "cat", 1), ("a.jpg", "dog", 1), ("b.jpg", "", 1), ("c.jpg", "dog", 1)]
+    db.close()
+
+    # 2回目は何も変えない
+    before = _dump(path)
+    AnnotationDB(path).close()
+    assert _dump(path) == before
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from PySide6.QtCore import QRectF
+
+from src.db import AnnotationDB
+from src.db_writer import AnnotationWriter
+
+
+def _open(tmp_path, **kwargs):
+    path = str(tmp_path / "annotations.db")
+    return AnnotationWriter(path, **kwargs)
+
+
+def _image(tmp_path, name="a.jpg"):
+    return os.path.join(str(tmp_path), "cat", name)
+
+
+def test_reads_flush_pending_writes(tmp_path):
+    # 時間では書き出されない設定でも、読み込みの前に反映される
+    writer = _open(tmp_path, flush_interval=60)
+    img_path = _image(tmp_path)
+    for i in range(3):
+        writer.save_annotation(img_path, QRectF(i, i, 10, 10), "cat")
+    assert writer.has_pending(img_path)
+    assert not writer.has_pending(_image(tmp_path, "b.jpg"))
+
+    assert [rect.x() for _, rect, _ in writer.load_annotations(img_path)] == [0, 1, 2]
+    assert not writer.has_pending()
+    writer.close()
+
+
+def test_full_batch_is_written_without_flush(tmp_path):
+    writer = _open(tmp_path, flush_interval=60, max_batch=4)
+    img_path = _image(tmp_path)
+    for i in range(4):
+        writer.save_annotation(img_path, QRectF(i, i, 10, 10), "cat")
+
+    deadline = time.monotonic() + 10
+    while writer.has_pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not writer.has_pending()
+    assert len(writer.db.load_annotations(img_path)) == 4
+    writer.close()
+
+
+def test_close_writes_queued_operations(tmp_path):
+    writer = _open(tmp_path, flush_interval=60)
+    img_path = _image(tmp_path)
+    writer.save_annotation(img_path, QRectF(0, 0, 10, 10), "cat")
+    writer.delete_all_annotations(img_path)
+    writer.save_annotation(img_path, QRectF(5, 5, 10, 10), "dog")
+    writer.close()
+
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    assert [(rect.x(), label) for _, rect, label in db.load_annotations(img_path)] == [(5, "dog")]
+    db.close()
+
+
+def test_temporary_ids_resolve_to_rows(tmp_path):
+    writer = _open(tmp_path, flush_interval=60)
+    img_path = _image(tmp_path)
+    first = writer.save_annotation(img_path, QRectF(0, 0, 10, 10), "cat")
+    second = writer.save_annotation(img_path, QRectF(5, 5, 10, 10), "cat")
+    assert first < 0 and second < 0 and first != second
+
+    # 書き込み前の矩形も、仮のidで削除・更新できる
+    writer.delete_annotation(img_path, first)
+    writer.update_annotation(img_path, second, rect_label="dog")
+    rows = writer.load_annotations(img_path)
+    assert [(rect.x(), label) for _, rect, label in rows] == [(5, "dog")]
+    assert rows[0][0] > 0
+
+    # 読み込んだ実際のidもそのまま使える
+    writer.delete_annotation(img_path, rows[0][0])
+    assert writer.load_annotations(img_path) == []
+    writer.close()
+
+
+def test_locked_batch_stays_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.db.BUSY_TIMEOUT", 0.01)
+    monkeypatch.setattr("src.db_writer.RETRY_BACKOFF", 0.001)
+    writer = _open(tmp_path, flush_interval=60)
+    img_path = _image(tmp_path)
+    writer.wait_ready()
+    # 別の接続が書き込みロックを持ったまま
+    other = AnnotationDB(str(tmp_path / "annotations.db"))
+    other.conn.execute("BEGIN IMMEDIATE")
+
+    writer.save_annotation(img_path, QRectF(0, 0, 10, 10), "cat")
+    assert not writer.flush()
+    assert writer.has_pending(img_path)
+    assert "locked" in writer.take_error()
+    assert writer.take_error() is None
+
+    # ロックが外れれば、次のflushで書き込まれる
+    other.conn.commit()
+    assert writer.flush()
+    assert not writer.has_pending()
+    assert writer.error is None
+    assert len(other.load_annotations(img_path)) == 1
+    assert writer.close()
+    other.close()
+
+
+def test_bad_operation_does_not_block_later_ones(tmp_path):
+    writer = _open(tmp_path, flush_interval=60)
+    img_path = _image(tmp_path)
+    writer.wait_ready()
+    # 別の接続から、特定の保存だけを失敗させるトリガーを仕掛ける
+    other = AnnotationDB(str(tmp_path / "annotations.db"))
+    other.conn.execute("""CREATE TRIGGER fail BEFORE INSERT ON annotations WHEN NEW.rect_label = 'bad'
+                          BEGIN SELECT RAISE(ABORT, 'bad label'); END""")
+    other.conn.commit()
+
+    bad = writer.save_annotation(img_path, QRectF(0, 0, 10, 10), "bad")
+    writer.save_annotation(img_path, QRectF(1, 1, 10, 10), "cat")
+    writer.delete_annotation(img_path, bad)
+    writer.save_annotation(_image(tmp_path, "b.jpg"), QRectF(2, 2, 10, 10), "dog")
+    assert writer.flush()
+    assert not writer.has_pending()
+    assert "discarded" in writer.take_error()
+
+    assert [(rect.x(), label) for _, rect, label in other.load_annotations(img_path)] == [(1, "cat")]
+    assert len(other.load_annotations(_image(tmp_path, "b.jpg"))) == 1
+
+    # 後の保存はそのまま書き込まれる
+    writer.save_annotation(img_path, QRectF(3, 3, 10, 10), "cat")
+    assert writer.flush()
+    assert writer.error is None
+    assert len(other.load_annotations(img_path)) == 2
+    assert writer.close()
+    other.close()
+
+
+def test_reload_releases_temporary_ids(tmp_path):
+    writer = _open(tmp_path, flush_interval=60)
+    img_path = _image(tmp_path)
+    writer.save_annotation(img_path, QRectF(0, 0, 10, 10), "cat")
+    other = writer.save_annotation(_image(tmp_path, "b.jpg"), QRectF(0, 0, 10, 10), "cat")
+    writer.load_annotations(img_path)
+    writer.flush()
+    assert list(writer._real_ids) == [other]
+
+    writer.release_temp_ids(_image(tmp_path, "b.jpg"))
+    writer.flush()
+    assert writer._real_ids == {}
+    assert not writer.has_pending()
+    writer.close()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import json
+import sys
+import struct
+import subprocess
+
+import pytest
+
+from src.db import AnnotationDB, CSV_COLUMNS
+from src.exporters import export_annotations
+from src.rect import Rect
+
+BOXES = [
+    ("cat", "a.png", (10, 20, 30, 40), "cat"),
+    ("cat", "a.png", (0, 0, 50, 50), "dog"),
+    ("dog", "b.png", (10, 10, 20, 10), "dog"),
+    # 画像ファイルがない（サイズ不明）
+    ("cat", "c.png", (1, 1, 1, 1), "cat"),
+]
+SIZES = {"a.png": (200, 100), "b.png": (100, 50)}
+
+
+def _write_png_header(path, width, height):
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00")
+
+
+def _open_db(tmp_path):
+    root = tmp_path / "images"
+    for label in ("cat", "dog"):
+        os.makedirs(root / label)
+    for img_label, filename, _, _ in BOXES:
+        if filename in SIZES:
+            _write_png_header(root / img_label / filename, *SIZES[filename])
+
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    for img_label, filename, rect, rect_label in BOXES:
+        db.save_annotation(os.path.join(str(root), img_label, filename), Rect(*rect), rect_label)
+    return db, str(root)
+
+
+def test_csv(tmp_path):
+    db, _ = _open_db(tmp_path)
+    out = str(tmp_path / "out.csv")
+    assert export_annotations(db, out, "csv") == (3, 4, 0, 0)
+
+    with open(out, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == CSV_COLUMNS
+    assert sorted((r[0], r[1], *map(float, r[2:6]), r[6]) for r in rows[1:]) == \
+        sorted((filename, img_label, *map(float, rect), rect_label) for img_label, filename, rect, rect_label in BOXES)
+    db.close()
+
+
+def test_coco(tmp_path):
+    db, root = _open_db(tmp_path)
+    out = str(tmp_path / "coco.json")
+    # サイズの分からない画像は飛ばす
+    assert export_annotations(db, out, "coco", image_root=root, workers=0) == (2, 3, 1, 0)
+
+    with open(out, encoding="utf-8") as f:
+        coco = json.load(f)
+    assert [(image["file_name"], image["width"], image["height"]) for image in coco["images"]] == \
+        [("cat/a.png", 200, 100), ("dog/b.png", 100, 50)]
+    assert coco["categories"] == [{"id": 1, "name": "cat"}, {"id": 2, "name": "dog"}]
+    assert sorted((a["image_id"], a["category_id"], a["bbox"]) for a in coco["annotations"]) == \
+        [(1, 1, [10, 20, 30, 40]), (1, 2, [0, 0, 50, 50]), (2, 2, [10, 10, 20, 10])]
+    assert len({a["id"] for a in coco["annotations"]}) == 3
+    db.close()
+
+
+def test_coco_needs_image_root(tmp_path):
+    db, _ = _open_db(tmp_path)
+    with pytest.raises(ValueError):
+        export_annotations(db, str(tmp_path / "coco.json"), "coco")
+    db.close()
+
+
+def test_yolo(tmp_path):
+    db, root = _open_db(tmp_path)
+    out = str(tmp_path / "yolo")
+    assert export_annotations(db, out, "yolo", image_root=root, workers=0) == (2, 3, 1, 0)
+
+    with open(os.path.join(out, "classes.txt"), encoding="utf-8") as f:
+        assert f.read() == "cat\ndog\n"
+    with open(os.path.join(out, "images.txt"), encoding="utf-8") as f:
+        assert f.read() == "cat/a.png\ndog/b.png\n"
+    with open(os.path.join(out, "labels", "a.txt"), encoding="utf-8") as f:
+        assert sorted(f.read().splitlines()) == ["0 0.125000 0.400000 0.150000 0.400000",
+                                                 "1 0.125000 0.250000 0.250000 0.500000"]
+    assert not os.path.exists(os.path.join(out, "labels", "c.txt"))
+    db.close()
+
+
+def test_npy(tmp_path):
+    np = pytest.importorskip("numpy")
+    db, root = _open_db(tmp_path)
+    out = str(tmp_path / "npy")
+    assert export_annotations(db, out, "npy", image_root=root, workers=0) == (3, 4, 0, 0)
+
+    with open(os.path.join(out, "images.json"), encoding="utf-8") as f:
+        images = json.load(f)
+    with open(os.path.join(out, "categories.json"), encoding="utf-8") as f:
+        categories = json.load(f)
+    boxes = np.load(os.path.join(out, "boxes.npy"), mmap_mode="r")
+    image_ids = np.load(os.path.join(out, "image_ids.npy"))
+    category_ids = np.load(os.path.join(out, "category_ids.npy"))
+    sizes = np.load(os.path.join(out, "image_sizes.npy"))
+
+    exported = sorted((images[i], categories[c], tuple(map(float, box)))
+                      for i, c, box in zip(image_ids, category_ids, boxes))
+    assert exported == sorted((f"{img_label}/{filename}", rect_label, tuple(map(float, rect)))
+                              for img_label, filename, rect, rect_label in BOXES)
+    assert dict(zip(images, map(tuple, sizes.tolist()))) == \
+        {"cat/a.png": (200, 100), "dog/b.png": (100, 50), "cat/c.png": (-1, -1)}
+    db.close()
+
+
+def test_npy_rows_changed_during_export(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    db, _ = _open_db(tmp_path)
+    rect_labels = db.rect_labels
+
+    def rect_labels_then_write():
+        # ラベル一覧を取った後に他の接続で書き込まれる
+        labels = rect_labels()
+        other = AnnotationDB(str(tmp_path / "annotations.db"))
+        other.save_annotation(os.path.join(str(tmp_path), "dog", "d.png"), Rect(1, 2, 3, 4), "bird")
+        other.save_annotation(os.path.join(str(tmp_path), "dog", "d.png"), Rect(5, 6, 7, 8), "bird")
+        other.close()
+        return labels
+
+    monkeypatch.setattr(db, "rect_labels", rect_labels_then_write)
+    out = str(tmp_path / "npy")
+    assert export_annotations(db, out, "npy") == (4, 6, 0, 0)
+
+    with open(os.path.join(out, "categories.json"), encoding="utf-8") as f:
+        assert json.load(f) == ["cat", "dog", "bird"]
+    boxes = np.load(os.path.join(out, "boxes.npy"))
+    category_ids = np.load(os.path.join(out, "category_ids.npy"))
+    assert boxes.shape == (6, 4) and len(np.load(os.path.join(out, "image_ids.npy"))) == 6
+    assert sorted(category_ids.tolist()) == [0, 0, 1, 1, 2, 2]
+    db.close()
+
+
+def test_unlabeled_boxes(tmp_path):
+    db, root = _open_db(tmp_path)
+    for rect_label in (None, ""):
+        db.save_annotation(os.path.join(root, "cat", "a.png"), Rect(5, 5, 10, 10), rect_label)
+
+    # クラスのない矩形は"None"などのクラスにせず、数えて飛ばす
+    out = str(tmp_path / "yolo")
+    assert export_annotations(db, out, "yolo", image_root=root, workers=0) == (2, 3, 1, 2)
+    with open(os.path.join(out, "classes.txt"), encoding="utf-8") as f:
+        assert f.read() == "cat\ndog\n"
+    with open(os.path.join(out, "labels", "a.txt"), encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+
+    out = str(tmp_path / "coco.json")
+    assert export_annotations(db, out, "coco", image_root=root, workers=0) == (2, 3, 1, 2)
+    with open(out, encoding="utf-8") as f:
+        coco = json.load(f)
+    assert coco["categories"] == [{"id": 1, "name": "cat"}, {"id": 2, "name": "dog"}]
+    assert len(coco["annotations"]) == 3
+
+    # csvはラベルなしのまま書き出す
+    assert export_annotations(db, str(tmp_path / "out.csv"), "csv") == (3, 6, 0, 0)
+    db.close()
+
+
+def test_csv_reads_no_images_and_no_numpy(tmp_path):
+    db, root = _open_db(tmp_path)
+    db.close()
+    script = ("import sys\n"
+              "import src.exporters as exporters\n"
+              "from src.db import AnnotationDB\n"
+              "def probe(*args, **kwargs): raise AssertionError('probed')\n"
+              "exporters.probe_image_sizes = probe\n"
+              f"db = AnnotationDB({str(tmp_path / 'annotations.db')!r})\n"
+              f"assert exporters.export_annotations(db, {str(tmp_path / 'out.csv')!r}, 'csv', image_root={root!r}) == (3, 4, 0, 0)\n"
+              "db.close()\n"
+              "assert 'numpy' not in sys.modules\n")
+    subprocess.run([sys.executable, "-c", script], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
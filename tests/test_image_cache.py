@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+
+from src.image_cache import ImageCache, ImagePrefetcher, load_image
+
+
+def _write_image(path, width, height):
+    cv2.imwrite(path, np.zeros((height, width, 3), np.uint8))
+    return path
+
+
+def test_growing_display_keeps_cache_and_decodes_again(tmp_path):
+    path = _write_image(str(tmp_path / "a.png"), 800, 400)
+    decoded = []
+
+    def loader(path, max_size):
+        decoded.append(max_size)
+        return load_image(path, max_size)
+
+    prefetcher = ImagePrefetcher(ImageCache(), loader=loader)
+    try:
+        prefetcher.set_max_size((200, 200))
+        assert prefetcher.get(path).shape[:2] == (100, 200)
+
+        # 表示が大きくなってもキャッシュは残り、読み直しは裏で行う
+        prefetcher.set_max_size((400, 400))
+        assert path in prefetcher.cache
+        image = prefetcher.decode_async(path).result()
+        assert image.shape[:2] == (200, 400)
+        assert prefetcher.get(path) is image
+        assert decoded == [(200, 200), (400, 400)]
+    finally:
+        prefetcher.shutdown()
+
+
+def test_prefetch_decodes_again_only_if_too_small(tmp_path):
+    paths = [_write_image(str(tmp_path / f"{i}.png"), 800, 400) for i in range(2)]
+    decoded = []
+
+    def loader(path, max_size):
+        decoded.append(path)
+        return load_image(path, max_size)
+
+    prefetcher = ImagePrefetcher(ImageCache(), loader=loader)
+    try:
+        prefetcher.set_max_size((400, 400))
+        large = prefetcher.get(paths[0])
+        prefetcher.set_max_size((200, 200))
+        prefetcher.get(paths[1])
+
+        prefetcher.set_max_size((400, 400))
+        prefetcher.prefetch(paths)
+        # getは先読みの結果を待つ
+        assert prefetcher.get(paths[1]).shape[:2] == (200, 400)
+        assert prefetcher.get(paths[0]) is large
+        assert decoded == [paths[0], paths[1], paths[1]]
+    finally:
+        prefetcher.shutdown()
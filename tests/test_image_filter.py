@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from src.db import AnnotationDB
+from src.image_filter import ImageFilter
+from src.rect import Rect
+
+# filename: (img_label, [rect_label])
+IMAGES = {
+    "a.jpg": ("cat", ["cat", "cat"]),
+    "b.jpg": ("dog", ["cat"]),
+    "c.jpg": ("cat", ["cat", "dog", "big cat"]),
+    # 矩形のない画像
+    "d.jpg": ("dog", []),
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = AnnotationDB(str(tmp_path / "annotations.db"))
+    for filename, (img_label, rect_labels) in IMAGES.items():
+        for i, rect_label in enumerate(rect_labels):
+            db.save_annotation(os.path.join(str(tmp_path), img_label, filename), Rect(i, i, 10, 10), rect_label)
+    yield db
+    db.close()
+
+
+def _matching(db, text):
+    predicate = ImageFilter(text).predicate(db)
+    return sorted(name for name in IMAGES if predicate(name))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("boxes=1", ["b.jpg"]),
+    ("boxes!=1", ["a.jpg", "c.jpg", "d.jpg"]),
+    ("boxes>1", ["a.jpg", "c.jpg"]),
+    ("boxes>=2", ["a.jpg", "c.jpg"]),
+    ("boxes<3", ["a.jpg", "b.jpg", "d.jpg"]),
+    ("boxes<=1", ["b.jpg", "d.jpg"]),
+])
+def test_box_count(db, text, expected):
+    assert _matching(db, text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("label:dog", ["c.jpg"]),
+    ('label:"big cat"', ["c.jpg"]),
+    ("label:bird", []),
+    ("mismatch", ["b.jpg", "c.jpg"]),
+    ("label:cat boxes<3", ["a.jpg", "b.jpg"]),
+    ("-mismatch", ["a.jpg", "d.jpg"]),
+    ("-boxes>1 label:cat", ["b.jpg"]),
+])
+def test_labels_mismatch_and_negation(db, text, expected):
+    assert _matching(db, text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 注釈のない画像はimage_statsに行がないので、補集合で問い合わせる
+    ("boxes=0", ["d.jpg"]),
+    ("boxes<2", ["b.jpg", "d.jpg"]),
+    ("-label:cat", ["d.jpg"]),
+    ("-label:dog", ["a.jpg", "b.jpg", "d.jpg"]),
+    ("-mismatch boxes<1", ["d.jpg"]),
+])
+def test_unannotated_images(db, text, expected):
+    assert ImageFilter(text).matches_unannotated()
+    assert _matching(db, text) == expected
+
+
+def test_empty_filter_matches_everything(db):
+    image_filter = ImageFilter("  ")
+    assert not image_filter
+    assert image_filter.predicate(db) is None
+
+
+@pytest.mark.parametrize("text", ["cat", "boxes>x", "boxes~1", "label:", "-", "mismatch:1"])
+def test_unknown_terms_are_rejected(text):
+    with pytest.raises(ValueError, match="Unknown filter term"):
+        ImageFilter(text)
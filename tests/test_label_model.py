@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+from PySide6.QtCore import qInstallMessageHandler
+from PySide6.QtTest import QAbstractItemModelTester
+
+from src.dataset import ImageDataset
+from src.label_model import FETCH_BATCH, LabelTreeModel
+
+
+def _model(counts, extra=()):
+    dataset = ImageDataset("root")
+    for label, count in counts.items():
+        dataset.set_names(label, [f"{label}{i:05d}.jpg" for i in range(count)])
+    for label, name in extra:
+        dataset.insert(label, name)
+    return LabelTreeModel(dataset)
+
+
+@pytest.fixture
+def qt_messages():
+    messages = []
+    previous = qInstallMessageHandler(lambda mode, context, message: messages.append(message))
+    yield messages
+    qInstallMessageHandler(previous)
+
+
+def _check(model):
+    """Watch `model` with QAbstractItemModelTester (failures go to the Qt log).
+
+    The tester fetches every row itself, so it is only attached once the
+    lazy loading under test is done.
+    """
+    model.tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Warning)
+
+
+def _names(model, label):
+    parent = model.label_index(label)
+    return [model.data(model.index(row, 0, parent)) for row in range(model.rowCount(parent))]
+
+
+def test_fetch_more_in_batches(qapp):
+    model = _model({"cat": FETCH_BATCH * 2 + 5, "dog": 0})
+    cat = model.label_index("cat")
+    dog = model.label_index("dog")
+
+    assert model.rowCount(cat) == 0
+    assert model.hasChildren(cat) and not model.hasChildren(dog)
+    assert not model.canFetchMore(dog)
+
+    for expected in (FETCH_BATCH, FETCH_BATCH * 2, FETCH_BATCH * 2 + 5):
+        assert model.canFetchMore(cat)
+        model.fetchMore(cat)
+        assert model.rowCount(cat) == expected
+    assert not model.canFetchMore(cat)
+    assert _names(model, "cat")[-1] == f"cat{FETCH_BATCH * 2 + 4:05d}.jpg"
+    assert model.path_at(model.index(3, 0, cat)) == os.path.join("root", "cat", "cat00003.jpg")
+
+
+def test_move_between_fetched_labels(qapp, qt_messages):
+    model = _model({"cat": 3, "dog": 2})
+    model.fetchMore(model.label_index("cat"))
+    model.fetchMore(model.label_index("dog"))
+    _check(model)
+    moved = []
+    model.rowsMoved.connect(lambda *args: moved.append(args[1:3] + args[4:]))
+
+    new_path = model.move_image(os.path.join("root", "cat", "cat00001.jpg"), "dog")
+    assert new_path == os.path.join("root", "dog", "cat00001.jpg")
+    assert moved == [(1, 1, 0)]
+    assert _names(model, "cat") == ["cat00000.jpg", "cat00002.jpg"]
+    assert _names(model, "dog") == ["cat00001.jpg", "dog00000.jpg", "dog00001.jpg"]
+    assert qt_messages == []
+
+
+def test_move_into_unfetched_range(qapp):
+    model = _model({"cat": 1, "dog": FETCH_BATCH + 1}, extra=[("cat", "zzz.jpg")])
+    model.fetchMore(model.label_index("cat"))
+    dog = model.label_index("dog")
+    model.fetchMore(dog)
+
+    model.move_image(os.path.join("root", "cat", "cat00000.jpg"), "dog")
+    assert model.rowCount(dog) == FETCH_BATCH + 1
+
+    # 読み込み済みの範囲より後ろに入る画像は、fetchMoreまで行にならない
+    model.move_image(os.path.join("root", "cat", "zzz.jpg"), "dog")
+    assert model.rowCount(dog) == FETCH_BATCH + 1
+    assert model.canFetchMore(dog)
+
+    model.fetchMore(dog)
+    assert model.rowCount(dog) == FETCH_BATCH + 3
+    assert _names(model, "dog")[0] == "cat00000.jpg"
+    assert _names(model, "dog")[-1] == "zzz.jpg"
+
+
+def test_move_from_unfetched_label(qapp):
+    model = _model({"cat": 2, "dog": 1})
+    model.fetchMore(model.label_index("dog"))
+
+    model.move_image(os.path.join("root", "cat", "cat00000.jpg"), "dog")
+    assert model.rowCount(model.label_index("cat")) == 0
+    assert model.dataset.count("cat") == 1
+    assert _names(model, "dog") == ["cat00000.jpg", "dog00000.jpg"]
+
+
+def test_move_hidden_by_filter(qapp, qt_messages):
+    model = _model({"cat": 2, "dog": 1})
+    model.fetchMore(model.label_index("cat"))
+    model.fetchMore(model.label_index("dog"))
+    _check(model)
+    hidden = set()
+    model.dataset.set_filter(lambda name: name not in hidden)
+
+    # 移動で絞り込みから外れた画像は、元の行が消えるだけ
+    hidden.add("cat00000.jpg")
+    model.move_image(os.path.join("root", "cat", "cat00000.jpg"), "dog")
+    assert _names(model, "cat") == ["cat00001.jpg"]
+    assert _names(model, "dog") == ["dog00000.jpg"]
+    assert model.dataset.hidden_count() == 1
+    assert os.path.join("root", "dog", "cat00000.jpg") in model.dataset
+    assert qt_messages == []
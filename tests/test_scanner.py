@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import shutil
+
+from src.scanner import FolderScanner
+
+
+def _wait(app, condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def _make_root(tmp_path):
+    root = tmp_path / "images"
+    for label in ("cat", "dog"):
+        os.makedirs(root / label)
+        for i in range(5):
+            (root / label / f"{label}_{i}.jpg").write_bytes(b"")
+    return str(root)
+
+
+def test_moves_are_coalesced(qapp, tmp_path):
+    root = _make_root(tmp_path)
+    scanner = FolderScanner(root, cache_dir=str(tmp_path / "cache"))
+    scanned = []
+    done = []
+    scanner.label_scanned.connect(lambda label, names: scanned.append((label, sorted(names))))
+    scanner.finished.connect(done.append)
+    scanner.start()
+    assert _wait(qapp, lambda: done)
+    scanner.watch()
+
+    saves = []
+    save_cache = scanner._job.save_cache
+    scanner._job.save_cache = lambda: (saves.append(1), save_cache())
+    scanned.clear()
+    for i in range(3):
+        shutil.move(os.path.join(root, "cat", f"cat_{i}.jpg"), os.path.join(root, "dog", f"cat_{i}.jpg"))
+        qapp.processEvents()
+
+    assert _wait(qapp, lambda: len(scanned) >= 2)
+    _wait(qapp, lambda: False, timeout=0.5)
+    scanner.stop()
+    assert sorted(label for label, _ in scanned) == ["cat", "dog"]
+    assert dict(scanned)["cat"] == ["cat_3.jpg", "cat_4.jpg"]
+    assert len(saves) == 1
+
+
+def test_nothing_emitted_after_stop(qapp, tmp_path):
+    root = _make_root(tmp_path)
+    scanner = FolderScanner(root, cache_dir=str(tmp_path / "cache"))
+    scanned = []
+    scanner.label_scanned.connect(lambda label, names: scanned.append(label))
+    scanner.start()
+    scanner.stop()
+    _wait(qapp, lambda: False, timeout=0.5)
+    assert scanned == []
+
+
+def test_scanner_dropped_while_scanning(qapp, tmp_path):
+    # 走査中に捨てても、スレッド側でQtオブジェクトが破棄されない
+    root = _make_root(tmp_path)
+    for _ in range(20):
+        scanner = FolderScanner(root, cache_dir=str(tmp_path / "cache"))
+        scanner.start()
+        scanner.stop()
+        del scanner
+    _wait(qapp, lambda: False, timeout=0.5)
+
+
+def test_cache_is_kept_outside_root(qapp, tmp_path):
+    root = _make_root(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    scanner = FolderScanner(root, cache_dir=cache_dir)
+    done = []
+    scanner.finished.connect(done.append)
+    scanner.start()
+    assert _wait(qapp, lambda: done) and done == [10]
+    scanner.stop()
+
+    assert sorted(os.listdir(root)) == ["cat", "dog"]
+    assert os.path.dirname(scanner.cache_path) == cache_dir
+    with open(scanner.cache_path, encoding="utf-8") as f:
+        cache = json.load(f)
+    assert cache["cat"]["names"] == [f"cat_{i}.jpg" for i in range(5)]
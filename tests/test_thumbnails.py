@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+from src.thumbnails import RESERVE_SLOTS, ThumbnailStore, MemoryThumbnailStore, open_store
+
+
+def _root(tmp_path):
+    root = tmp_path / "images"
+    os.makedirs(root)
+    return str(root)
+
+
+def test_store_is_kept_outside_root(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = _root(tmp_path)
+    path = os.path.join(root, "a.jpg")
+
+    store = open_store(root)
+    assert isinstance(store, ThumbnailStore)
+    assert store.dir.startswith(str(tmp_path / "cache"))
+    store.put(path, 1.0, np.full((64, 128, 3), 7, np.uint8))
+    store.close()
+    # 画像フォルダには何も書かない
+    assert os.listdir(root) == []
+
+    store = open_store(root)
+    assert store.entries[os.path.relpath(path, root)][0] == 1.0
+    slot = store.entries[os.path.relpath(path, root)][1]
+    assert (store.data[slot, :64, :128] == 7).all()
+    store.close()
+
+
+def test_store_in_memory_when_nothing_is_writable(tmp_path):
+    root = _root(tmp_path)
+    cache_dir = tmp_path / "cache"
+    cache_dir.write_bytes(b"")
+
+    store = open_store(root, cache_dir=str(cache_dir))
+    assert isinstance(store, MemoryThumbnailStore)
+    path = os.path.join(root, "a.jpg")
+    store.put(path, 1.0, np.zeros((64, 128, 3), np.uint8))
+    _, width, height = store.lookup(path)
+    assert (width, height) == (128, 64)
+
+
+def test_stores_sharing_a_folder_use_different_slots(tmp_path):
+    # 同じフォルダを開いた2つのアノテーター
+    root = _root(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    stores = [open_store(root, cache_dir=cache_dir), open_store(root, cache_dir=cache_dir)]
+    assert stores[0].dir == stores[1].dir
+
+    count = RESERVE_SLOTS + 10
+    for i in range(count):
+        for j, store in enumerate(stores):
+            store.put(os.path.join(root, f"{j}_{i}.jpg"), 1.0, np.full((8, 8, 3), (j * count + i) % 256, np.uint8))
+    for store in stores:
+        store.close()
+
+    store = open_store(root, cache_dir=cache_dir)
+    assert len(store.entries) == 2 * count
+    assert len({entry[1] for entry in store.entries.values()}) == 2 * count
+    for j in range(2):
+        for i in range(count):
+            slot = store.entries[f"{j}_{i}.jpg"][1]
+            assert (store.data[slot, :8, :8] == (j * count + i) % 256).all()
+    store.close()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import time
+
+import cv2
+import numpy as np
+from PySide6.QtGui import QImage, QPainter
+from PySide6.QtCore import QRectF
+from PySide6.QtWidgets import QGraphicsScene
+
+from src import tiles
+from src.tiles import TiledImageItem
+
+
+def render(scene, source, size):
+    image = QImage(size[0], size[1], QImage.Format_RGB32)
+    painter = QPainter(image)
+    scene.render(painter, QRectF(0, 0, *size), source)
+    painter.end()
+    return image
+
+
+def test_paint_at_zoom_loads_full_resolution_level(qapp, tmp_path):
+    path = str(tmp_path / "large.jpg")
+    image = np.zeros((4000, 6000, 3), np.uint8)
+    image[:, :, 1] = np.linspace(0, 255, 6000, dtype=np.uint8)
+    cv2.imwrite(path, image)
+
+    scale_ratio = 0.1
+    item = TiledImageItem(path, 6000, 4000, scale_ratio)
+    assert item.is_valid()
+    assert item.base_factor > 1
+    scene = QGraphicsScene()
+    scene.addItem(item)
+
+    # 表示座標60x40を600x400に描く（10倍ズーム → 1画面画素 = 元画像1画素）
+    render(scene, QRectF(0, 0, 60, 40), (600, 400))
+
+    end = time.monotonic() + 30
+    while 1 not in item.levels and time.monotonic() < end:
+        qapp.processEvents()
+        time.sleep(0.01)
+    qapp.processEvents()
+    assert item.levels.get(1) is not None
+
+    render(scene, QRectF(0, 0, 60, 40), (600, 400))
+    assert any(key[0] == 1 for key in item.tiles)
+
+
+def test_zoom_stays_within_pixel_budget(qapp, tmp_path, monkeypatch):
+    path = str(tmp_path / "large.jpg")
+    cv2.imwrite(path, np.full((1000, 2000, 3), 128, np.uint8))
+    # 1/4に縮小したレベル（500x250）までしか展開しない
+    monkeypatch.setattr(tiles, "MAX_LEVEL_PIXELS", 500 * 250)
+
+    item = TiledImageItem(path, 2000, 1000, 0.1)
+    assert item.min_factor == 4
+    assert item._factor_for(10) == 4
+    scene = QGraphicsScene()
+    scene.addItem(item)
+
+    render(scene, QRectF(0, 0, 60, 40), (600, 400))
+    qapp.processEvents()
+    assert set(item.levels) == {4}
+    assert item.tiles and all(key[0] == 4 for key in item.tiles)